@@ -0,0 +1,7 @@
+# /asgi.py
+import os
+
+from src.asgi import create_asgi_app
+
+# e.g. uvicorn asgi:application --workers 4
+application = create_asgi_app(os.getenv('FLASK_ENV'))
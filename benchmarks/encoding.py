@@ -0,0 +1,82 @@
+# /benchmarks/encoding.py
+
+"""
+Microbenchmark of encoding a list envelope with every available JSON backend:
+
+    python -m benchmarks.encoding --members 500 --number 200
+
+Members are built like dumped organisations, and the output of the
+backends is checked to be byte-identical before timing.
+"""
+
+import argparse
+import datetime
+import sys
+import timeit
+import uuid
+
+from flask import json as flask_json
+
+from src.encoding import BACKENDS
+
+
+def envelope(members):
+    now = datetime.datetime.utcnow()
+    return {
+        'category': 'organisations',
+        'type': 'OrganisationListV1',
+        'count': members,
+        'total': members,
+        'start': 1,
+        'next': 'WyIyMDIwLTAxLTAxVDAwOjAwOjAwIiwiNzg4MjVjMzkiLDUxXQ',
+        'members': [{
+            'type': 'OrganisationV1',
+            'uuid': str(uuid.uuid4()),
+            'createdAt': now.isoformat() + '+00:00',
+            'updatedAt': now.isoformat() + '+00:00',
+            'name': 'Organisation {} – Müller GmbH'.format(index),
+            'roles': ['SUPPLIER', 'CUSTOMER'],
+            'supplierUuid': str(uuid.uuid4()),
+            'emailAddress': 'info{}@example.com'.format(index),
+            'customerNumber': None,
+            'phoneNumber': '+49 30 1234{}'.format(index),
+            'address1': 'Hauptstraße {}'.format(index),
+            'address2': None,
+            'postalCode': '10115',
+            'city': 'Berlin',
+            'state': None,
+            'countryCode': 'DE',
+            'validated': index % 2 == 0,
+        } for index in range(members)],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the JSON backends on a list envelope')
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--number', type=int, default=200, help='encodings per backend')
+    args = parser.parse_args(argv)
+
+    data = envelope(args.members)
+    backends = {}
+    for name, backend_class in BACKENDS.items():
+        try:
+            backends[name] = backend_class()
+        except RuntimeError as error:
+            print('{:<8} skipped: {}'.format(name, error))
+
+    outputs = {name: backend.dumps(data) for name, backend in backends.items()}
+    if len(set(outputs.values())) > 1:
+        print('backends differ: {}'.format(', '.join(sorted(outputs))))
+        return 1
+
+    timings = [('flask', lambda: flask_json.dumps(data))]
+    timings.extend((name, lambda backend=backend: backend.dumps(data)) for name, backend in backends.items())
+    for name, encode in timings:
+        seconds = timeit.timeit(encode, number=args.number) / args.number
+        print('{:<8} {:8.3f} ms/envelope  {:8.1f} envelopes/s'.format(name, seconds * 1000, 1 / seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+# /benchmarks/endpoints.py
+
+"""
+Endpoint benchmark suite.
+
+Seeds a database with a configurable dataset and drives every blueprint
+route with concurrent clients, recording latency percentiles, throughput
+and SQL statements per request for each route:
+
+    DATABASE_URL=postgres://... python -m benchmarks.endpoints run \\
+        --orgs 200 --users-per-org 20 --depth 3 --clients 8 --requests 200 \\
+        --output bench/current.json
+
+The database is emptied and re-created by --reset, never point it at a
+database holding data you want to keep. Without --url the app is created
+in-process with create_app, with --url an already running server is
+driven over HTTP (it needs SERVER_TIMING enabled for query counts).
+
+Results are compared against a stored baseline with:
+
+    python -m benchmarks.endpoints compare bench/baseline.json bench/current.json --threshold 0.2
+
+which exits with status 1 if any route's p95 latency regressed by more
+than the threshold.
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import bcrypt
+
+QUERIES_PATTERN = re.compile(r'queries;desc="(\d+)"')
+PASSWORD = 'benchmark-password'
+BULK_SIZE = 50
+
+
+class Dataset(object):
+
+    def __init__(self):
+        self.organisations = []
+        self.users = []
+        self.credentials = []
+        self.accounts = []
+        self.suppliers = []
+        # rows consumed by the delete and credential create routes, one per request
+        self.spare_organisations = []
+        self.spare_users = []
+        self.spare_accounts = []
+        self.spare_credentials = []
+        self.users_without_credential = []
+
+
+class Rows(object):
+    '''column values of the rows to seed, per table'''
+
+    def __init__(self, password, now):
+        self.password = password
+        self.now = now
+        self.organisations, self.accounts, self.users, self.credentials = [], [], [], []
+
+    def _row(self, rows, **values):
+        rows.append(dict(id=str(uuid.uuid4()), created_at=self.now, updated_at=self.now, **values))
+        return rows[-1]['id']
+
+    def organisation(self, name, supplier):
+        index = len(self.organisations)
+        return self._row(
+            self.organisations, name=name, roles=['CUSTOMER'] if supplier else ['SUPPLIER', 'CUSTOMER'],
+            supplier_uuid=supplier, city='City {}'.format(index % 97), country_code='DE', is_validated=True,
+            customer_number='C{:08d}'.format(index))
+
+    def account(self, org_uuid):
+        return self._row(self.accounts, name='Default Account', organisation_id=org_uuid)
+
+    def user(self, org_uuid, name):
+        return self._row(
+            self.users, username=name, email_address='{}@example.com'.format(name), first_name='First',
+            last_name='Last', is_confirmed=True, organisation_id=org_uuid)
+
+    def credential(self, user_uuid):
+        return self._row(
+            self.credentials, user_id=user_uuid, password=self.password, password_set_at=self.now,
+            is_locked=False, is_expired=False)
+
+
+def seed(app, orgs, users_per_org, depth, spares, reset):
+    """
+    Inserts orgs organisations as supplier chains of depth customer levels,
+    users_per_org users with credentials per organisation and one account
+    per organisation, plus spares rows for every route consuming one.
+    Returns the uuids of the seeded rows.
+    """
+    from src.models import db
+    from src.models.organisation import OrganisationModel
+    from src.models.user import UserModel
+    from src.models.credential import CredentialModel
+    from src.models.account import AccountModel
+
+    dataset = Dataset()
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(10)).decode('utf-8')
+    rows = Rows(password, datetime.datetime.utcnow())
+
+    supplier = None
+    for index in range(orgs):
+        if index % (depth + 1) == 0:
+            supplier = None
+        org_uuid = rows.organisation('Organisation {}'.format(index), supplier)
+        if supplier is None:
+            dataset.suppliers.append(org_uuid)
+        supplier = org_uuid
+        dataset.organisations.append(org_uuid)
+        dataset.accounts.append(rows.account(org_uuid))
+
+        for user_index in range(users_per_org):
+            user_uuid = rows.user(org_uuid, 'user{}-{}'.format(index, user_index))
+            dataset.users.append(user_uuid)
+            dataset.credentials.append(rows.credential(user_uuid))
+
+    spare_org = rows.organisation('Spare Organisation', None)
+    for index in range(spares):
+        dataset.spare_organisations.append(rows.organisation('Spare {}'.format(index), spare_org))
+        dataset.spare_accounts.append(rows.account(spare_org))
+        dataset.spare_users.append(rows.user(spare_org, 'spare{}'.format(index)))
+        dataset.users_without_credential.append(rows.user(spare_org, 'spare{}-nocredential'.format(index)))
+        dataset.spare_credentials.append(rows.credential(rows.user(spare_org, 'spare{}-credential'.format(index))))
+
+    with app.app_context():
+        if reset:
+            db.session.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+            db.session.commit()
+            db.drop_all()
+            db.create_all()
+
+        for model, values in ((OrganisationModel, rows.organisations), (AccountModel, rows.accounts),
+                              (UserModel, rows.users), (CredentialModel, rows.credentials)):
+            db.session.execute(model.__table__.insert(), values)
+        db.session.commit()
+
+    return dataset
+
+
+def routes(dataset):
+    """
+    Returns (name, method, path factory, body factory) for every route. Write
+    routes create their own rows so reads keep seeing the seeded dataset.
+    """
+    def pick(uuids):
+        return lambda: random.choice(uuids)
+
+    def take(uuids):
+        # list.pop is atomic, every consuming request gets its own row
+        return lambda: uuids.pop()
+
+    org = pick(dataset.organisations)
+    supplier = pick(dataset.suppliers)
+    user = pick(dataset.users)
+    credential = pick(dataset.credentials)
+    account = pick(dataset.accounts)
+
+    def unique():
+        return uuid.uuid4().hex[:12]
+
+    def organisation_body():
+        return {'name': 'Bench {}'.format(unique()), 'city': 'Bench', 'countryCode': 'DE',
+                'supplierUuid': str(supplier())}
+
+    def user_body():
+        return {'username': unique(), 'emailAddress': '{}@example.com'.format(unique()),
+                'lastName': 'Bench', 'organisationUuid': str(org())}
+
+    def account_body():
+        return {'name': 'Bench {}'.format(unique()), 'organisationUuid': str(org())}
+
+    without_credential = take(dataset.users_without_credential)
+
+    return [
+        ('organisations.find_all', 'GET', lambda: '/api/v1/organisations/', None),
+        ('organisations.create', 'POST', lambda: '/api/v1/organisations/', organisation_body),
+        ('organisations.create_bulk', 'POST', lambda: '/api/v1/organisations/bulk',
+         lambda: [organisation_body() for _ in range(BULK_SIZE)]),
+        ('organisations.get_by_uuid', 'GET', lambda: '/api/v1/organisations/{}'.format(org()), None),
+        ('organisations.get_users', 'GET', lambda: '/api/v1/organisations/{}/users'.format(org()), None),
+        ('organisations.get_customers', 'GET',
+         lambda: '/api/v1/organisations/{}/customers?depth=all'.format(supplier()), None),
+        ('organisations.get_tree', 'GET', lambda: '/api/v1/organisations/{}/tree'.format(supplier()), None),
+        ('organisations.update', 'PUT', lambda: '/api/v1/organisations/{}'.format(org()),
+         lambda: {'phoneNumber': unique()}),
+        ('organisations.delete', 'DELETE',
+         lambda: '/api/v1/organisations/{}'.format(take(dataset.spare_organisations)()), None),
+        ('users.find_all', 'GET', lambda: '/api/v1/users/', None),
+        ('users.create', 'POST', lambda: '/api/v1/users/', user_body),
+        ('users.create_bulk', 'POST', lambda: '/api/v1/users/bulk', lambda: [user_body() for _ in range(BULK_SIZE)]),
+        ('users.get_by_uuid', 'GET', lambda: '/api/v1/users/{}'.format(user()), None),
+        ('users.update', 'PUT', lambda: '/api/v1/users/{}'.format(user()), lambda: {'phoneNumber': unique()}),
+        ('users.delete', 'DELETE', lambda: '/api/v1/users/{}'.format(take(dataset.spare_users)()), None),
+        ('credentials.find_all', 'GET', lambda: '/api/v1/credentials/', None),
+        ('credentials.create', 'POST', lambda: '/api/v1/credentials/',
+         lambda: {'userUuid': str(without_credential()), 'password': PASSWORD}),
+        ('credentials.login', 'POST', lambda: '/api/v1/credentials/login',
+         lambda: {'userUuid': str(user()), 'password': PASSWORD}),
+        ('credentials.get_by_uuid', 'GET', lambda: '/api/v1/credentials/{}'.format(credential()), None),
+        ('credentials.update', 'PUT', lambda: '/api/v1/credentials/{}'.format(credential()),
+         lambda: {}),
+        ('credentials.set_password', 'PUT', lambda: '/api/v1/credentials/{}/password'.format(credential()),
+         lambda: {'password': PASSWORD}),
+        ('credentials.delete', 'DELETE',
+         lambda: '/api/v1/credentials/{}'.format(take(dataset.spare_credentials)()), None),
+        ('accounts.find_all', 'GET', lambda: '/api/v1/accounts/', None),
+        ('accounts.create', 'POST', lambda: '/api/v1/accounts/', account_body),
+        ('accounts.create_bulk', 'POST', lambda: '/api/v1/accounts/bulk',
+         lambda: [account_body() for _ in range(BULK_SIZE)]),
+        ('accounts.get_by_uuid', 'GET', lambda: '/api/v1/accounts/{}'.format(account()), None),
+        ('accounts.update', 'PUT', lambda: '/api/v1/accounts/{}'.format(account()), lambda: {'name': unique()}),
+        ('accounts.delete', 'DELETE', lambda: '/api/v1/accounts/{}'.format(take(dataset.spare_accounts)()), None),
+    ]
+
+
+class InProcessClient(object):
+
+    def __init__(self, app):
+        self._local = threading.local()
+        self.app = app
+
+    def request(self, method, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HttpClient(object):
+
+    def __init__(self, url):
+        self._local = threading.local()
+        self.url = urlsplit(url)
+
+    def request(self, method, path, body):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.url.netloc)
+        payload = json.dumps(body) if body is not None else None
+        connection.request(method, path, body=payload, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.getheader('Server-Timing', '')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def drive(client, route, clients, requests):
+    '''issues requests calls of route from clients concurrent threads'''
+    name, method, path, body = route
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+
+    def call(_):
+        start = time.perf_counter()
+        status, timing = client.request(method, path(), body() if body else None)
+        elapsed = time.perf_counter() - start
+        match = QUERIES_PATTERN.search(timing)
+        with lock:
+            latencies.append(elapsed)
+            if match:
+                queries.append(int(match.group(1)))
+            if status >= 400:
+                errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(call, range(requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'throughput_rps': requests / wall,
+        'queries_per_request': sum(queries) / len(queries) if queries else None,
+    }
+
+
+def run(args):
+    from src.app import create_app
+
+    app = create_app(args.env)
+    app.config['SERVER_TIMING'] = True
+
+    dataset = seed(app, args.orgs, args.users_per_org, args.depth, args.requests, args.reset)
+    client = HttpClient(args.url) if args.url else InProcessClient(app)
+
+    results = {}
+    for route in routes(dataset):
+        if args.route and not any(pattern in route[0] for pattern in args.route):
+            continue
+        results[route[0]] = drive(client, route, args.clients, args.requests)
+        print('{:<32} p50 {p50_ms:8.2f}ms  p95 {p95_ms:8.2f}ms  p99 {p99_ms:8.2f}ms  '
+              '{throughput_rps:8.1f} req/s  queries {queries_per_request}  errors {errors}'
+              .format(route[0], **results[route[0]]))
+
+    report = {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'dataset': {'orgs': args.orgs, 'users_per_org': args.users_per_org, 'depth': args.depth},
+        'clients': args.clients,
+        'requests': args.requests,
+        'mode': 'http' if args.url else 'in-process',
+        'routes': results,
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)['routes']
+    with open(args.current) as current_file:
+        current = json.load(current_file)['routes']
+
+    regressions = []
+    for name, before in sorted(baseline.items()):
+        after = current.get(name)
+        if after is None:
+            print('{:<32} missing from current results'.format(name))
+            continue
+        change = after[args.metric] / before[args.metric] - 1 if before[args.metric] else 0.0
+        regressed = change > args.threshold
+        if regressed:
+            regressions.append(name)
+        print('{:<32} {} {:8.2f} -> {:8.2f} ({:+.1%}){}'.format(
+            name, args.metric, before[args.metric], after[args.metric], change, '  REGRESSION' if regressed else ''))
+
+    if regressions:
+        print('{} route(s) regressed by more than {:.0%}'.format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='seed a dataset and benchmark every route')
+    run_parser.add_argument('--env', default=os.getenv('FLASK_ENV', 'development'))
+    run_parser.add_argument('--orgs', type=int, default=100)
+    run_parser.add_argument('--users-per-org', type=int, default=10)
+    run_parser.add_argument('--depth', type=int, default=2, help='customer levels below each supplier')
+    run_parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    run_parser.add_argument('--route', action='append', help='only run routes containing this name')
+    run_parser.add_argument('--url', help='drive a running server instead of an in-process app')
+    run_parser.add_argument('--reset', action='store_true', help='drop and re-create all tables first')
+    run_parser.add_argument('--output', help='write the results as JSON to this file')
+
+    compare_parser = commands.add_parser('compare', help='compare results against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--metric', default='p95_ms', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'])
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'compare':
+        return compare(args)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# /benchmarks/modes.py
+
+"""
+Compares the WSGI and the ASGI app on the read routes served on asyncio.
+
+Both servers are started against the same database beforehand, e.g.
+
+    gunicorn -w 4 -b :8000 'run:create_app("production")'
+    uvicorn asgi:application --workers 4 --port 8001
+
+and driven with the same requests at a high client concurrency:
+
+    DATABASE_URL=postgres://... python -m benchmarks.modes \\
+        --wsgi http://localhost:8000 --asgi http://localhost:8001 --clients 64 --requests 2000
+
+The dataset is seeded as in benchmarks.endpoints (--reset empties the
+database first). Before timing, every route is requested once from both
+servers and their status and body are checked to be identical.
+"""
+
+import argparse
+import http.client
+import os
+import sys
+from urllib.parse import urlsplit
+
+from .endpoints import HttpClient, drive, routes, seed
+
+# the routes the ASGI app serves without a thread
+ROUTES = (
+    'organisations.find_all', 'organisations.get_by_uuid',
+    'users.find_all', 'users.get_by_uuid',
+    'credentials.find_all', 'credentials.get_by_uuid',
+    'accounts.find_all', 'accounts.get_by_uuid',
+)
+
+
+def fetch(url, path):
+    connection = http.client.HTTPConnection(urlsplit(url).netloc)
+    try:
+        connection.request('GET', path, headers={'Accept-Encoding': 'identity'})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def check(args, selected):
+    '''returns the names of the routes whose responses differ between both servers'''
+    different = []
+    for name, _, path, _ in selected:
+        path = path()
+        if fetch(args.wsgi, path) != fetch(args.asgi, path):
+            print('{:<32} responses differ for {}'.format(name, path))
+            different.append(name)
+    return different
+
+
+def run(args):
+    from src.app import create_app
+
+    dataset = seed(create_app(args.env), args.orgs, args.users_per_org, args.depth, 0, args.reset)
+    selected = [route for route in routes(dataset) if route[0] in ROUTES]
+    if check(args, selected):
+        return 1
+
+    clients = {'wsgi': HttpClient(args.wsgi), 'asgi': HttpClient(args.asgi)}
+    for route in selected:
+        for mode, client in clients.items():
+            result = drive(client, route, args.clients, args.requests)
+            print('{:<32} {}  p50 {p50_ms:8.2f}ms  p95 {p95_ms:8.2f}ms  p99 {p99_ms:8.2f}ms  '
+                  '{throughput_rps:8.1f} req/s  errors {errors}'.format(route[0], mode, **result))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the WSGI and the ASGI app')
+    parser.add_argument('--wsgi', required=True, help='URL of the WSGI server')
+    parser.add_argument('--asgi', required=True, help='URL of the ASGI server')
+    parser.add_argument('--env', default=os.getenv('FLASK_ENV', 'development'))
+    parser.add_argument('--orgs', type=int, default=100)
+    parser.add_argument('--users-per-org', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=2, help='customer levels below each supplier')
+    parser.add_argument('--clients', type=int, default=64, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route and mode')
+    parser.add_argument('--reset', action='store_true', help='drop and re-create all tables first')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
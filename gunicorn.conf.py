@@ -0,0 +1,31 @@
+# /gunicorn.conf.py
+
+"""
+Production server, run with
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is created once in the master and SERVER_WORKERS processes are
+forked from it, sharing its loaded code. Workers are recycled after
+SERVER_MAX_REQUESTS requests or when their memory exceeds
+SERVER_MAX_MEMORY_MB. SIGTERM stops accepting connections and waits up to
+SERVER_GRACEFUL_TIMEOUT seconds for in-flight requests. The settings are
+read from the Production config.
+"""
+
+from src.config import Production
+from src.server import pre_fork, post_fork, post_request  # noqa: F401
+
+bind = Production.SERVER_BIND
+workers = Production.SERVER_WORKERS
+threads = Production.SERVER_THREADS
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+
+max_requests = Production.SERVER_MAX_REQUESTS
+max_requests_jitter = Production.SERVER_MAX_REQUESTS_JITTER
+timeout = Production.SERVER_TIMEOUT
+graceful_timeout = Production.SERVER_GRACEFUL_TIMEOUT
+
+accesslog = '-'
+errorlog = '-'
@@ -15,5 +15,67 @@ manager = Manager(app=app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option('-l', '--limit', dest='limit', type=int, default=100)
+def check_schemas(limit):
+    """
+    Verifies the compiled schemas against marshmallow on stored rows, their
+    dumps loaded back and a few invalid payloads.
+    """
+    from src.models.compiled import verify
+    from src.models.organisation import OrganisationModel, OrganisationSchema
+    from src.models.user import UserModel, UserSchema
+    from src.models.credential import CredentialModel, CredentialSchema
+    from src.models.account import AccountModel, AccountSchema
+
+    invalid = [None, 'junk', {}, {'name': 1, 'emailAddress': 'not an address', 'roles': 'x', 'validated': 'x'}]
+    failed = False
+    for model, schema_class in ((OrganisationModel, OrganisationSchema), (UserModel, UserSchema),
+                                (CredentialModel, CredentialSchema), (AccountModel, AccountSchema)):
+        rows = model.query.limit(limit).all()
+        for schema in (schema_class(), schema_class(many=True)):
+            objects = [rows] if schema.many else rows
+            payloads = [schema.dump(rows, many=True).data] if schema.many else \
+                schema.dump(rows, many=True).data + invalid
+            mismatches = verify(schema, objects, payloads)
+            for mismatch in mismatches:
+                print(mismatch)
+            failed = failed or bool(mismatches)
+        print('{}: {} rows checked'.format(schema_class.__name__, len(rows)))
+    return 1 if failed else 0
+
+
+@manager.option('-b', '--budget', dest='budget', type=int, default=None)
+@manager.option('--lazy', dest='lazy', action='store_true', default=None)
+def startup_profile(budget, lazy):
+    """
+    Starts the app in a fresh interpreter and reports the time until its
+    first request per subsystem, fails if it exceeds the budget
+    (milliseconds, STARTUP_BUDGET_MS by default).
+    """
+    from src.startup import StartupBudgetExceeded, check_budget, format_profile, profile_startup
+
+    profile = profile_startup(env_name, lazy)
+    print(format_profile(profile))
+    try:
+        check_budget(profile, budget or app.config['STARTUP_BUDGET_MS'])
+    except StartupBudgetExceeded as e:
+        print(e)
+        return 1
+    return 0
+
+
+@manager.option('-r', '--retention-hours', dest='retention_hours', type=int, default=None)
+def purge_changes(retention_hours):
+    '''deletes the recorded changes older than the retention (hours, CHANGES_RETENTION_HOURS by default)'''
+    import datetime
+    from src.models.change import ChangeModel
+
+    hours = retention_hours or app.config['CHANGES_RETENTION_HOURS']
+    count = ChangeModel.purge(datetime.datetime.utcnow() - datetime.timedelta(hours=hours))
+    print('{} changes purged'.format(count))
+    return 0
+
+
 if __name__ == '__main__':
     manager.run()
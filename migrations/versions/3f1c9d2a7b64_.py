@@ -0,0 +1,29 @@
+"""add keyset pagination indexes
+
+Revision ID: 3f1c9d2a7b64
+Revises: 070937bb084a
+Create Date: 2019-08-12 10:21:37.118402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9d2a7b64'
+down_revision = '070937bb084a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_organisations_created_at_id', 'organisations', ['created_at', 'id'], unique=False)
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_credentials_created_at_id', 'credentials', ['created_at', 'id'], unique=False)
+    op.create_index('ix_accounts_created_at_id', 'accounts', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_accounts_created_at_id', table_name='accounts')
+    op.drop_index('ix_credentials_created_at_id', table_name='credentials')
+    op.drop_index('ix_users_created_at_id', table_name='users')
+    op.drop_index('ix_organisations_created_at_id', table_name='organisations')
@@ -0,0 +1,50 @@
+"""add filter and sort indexes
+
+Revision ID: 8d4e2a6c1f57
+Revises: 3f1c9d2a7b64
+Create Date: 2019-08-19 09:47:12.530114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4e2a6c1f57'
+down_revision = '3f1c9d2a7b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # text[] like the model, so roles @> / && ARRAY[...] compare without casts
+    op.alter_column('organisations', 'roles', type_=postgresql.ARRAY(sa.Text()),
+                    existing_type=postgresql.ARRAY(sa.String(length=255)), postgresql_using='roles::text[]')
+    op.create_index('ix_organisations_roles', 'organisations', ['roles'], unique=False, postgresql_using='gin')
+    op.create_index('ix_organisations_supplier_uuid', 'organisations', ['supplier_uuid'], unique=False)
+    op.create_index('ix_organisations_country_code', 'organisations', ['country_code'], unique=False)
+    op.create_index('ix_organisations_email_address', 'organisations', ['email_address'], unique=False)
+    op.create_index('ix_users_organisation_id', 'users', ['organisation_id'], unique=False)
+    op.create_index('ix_accounts_organisation_id', 'accounts', ['organisation_id'], unique=False)
+
+    op.create_index('ix_organisations_updated_at_id', 'organisations', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_users_updated_at_id', 'users', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_credentials_updated_at_id', 'credentials', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_accounts_updated_at_id', 'accounts', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_accounts_updated_at_id', table_name='accounts')
+    op.drop_index('ix_credentials_updated_at_id', table_name='credentials')
+    op.drop_index('ix_users_updated_at_id', table_name='users')
+    op.drop_index('ix_organisations_updated_at_id', table_name='organisations')
+
+    op.drop_index('ix_accounts_organisation_id', table_name='accounts')
+    op.drop_index('ix_users_organisation_id', table_name='users')
+    op.drop_index('ix_organisations_email_address', table_name='organisations')
+    op.drop_index('ix_organisations_country_code', table_name='organisations')
+    op.drop_index('ix_organisations_supplier_uuid', table_name='organisations')
+    op.drop_index('ix_organisations_roles', table_name='organisations')
+    op.alter_column('organisations', 'roles', type_=postgresql.ARRAY(sa.String(length=255)),
+                    existing_type=postgresql.ARRAY(sa.Text()), postgresql_using='roles::varchar(255)[]')
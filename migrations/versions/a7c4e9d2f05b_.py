@@ -0,0 +1,35 @@
+"""make timestamps not null
+
+Revision ID: a7c4e9d2f05b
+Revises: f6d2b8e4a1c3
+Create Date: 2019-09-02 09:14:26.730918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e9d2f05b'
+down_revision = 'f6d2b8e4a1c3'
+branch_labels = None
+depends_on = None
+
+TABLES = ['organisations', 'users', 'credentials', 'accounts']
+
+
+def upgrade():
+    # rows written before the timestamps were always set, keyset cursors and
+    # the (created_at, id) and (updated_at, id) orders need a value
+    for table in TABLES:
+        op.execute("UPDATE {} SET created_at = coalesce(created_at, updated_at, timezone('utc', now())), "
+                   "updated_at = coalesce(updated_at, created_at, timezone('utc', now())) "
+                   'WHERE created_at IS NULL OR updated_at IS NULL'.format(table))
+        op.alter_column(table, 'created_at', existing_type=sa.DateTime(), nullable=False)
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(), nullable=True)
+        op.alter_column(table, 'created_at', existing_type=sa.DateTime(), nullable=True)
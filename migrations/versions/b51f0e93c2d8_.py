@@ -0,0 +1,36 @@
+"""add trigram search indexes
+
+Revision ID: b51f0e93c2d8
+Revises: 8d4e2a6c1f57
+Create Date: 2019-08-21 14:05:38.902617
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b51f0e93c2d8'
+down_revision = '8d4e2a6c1f57'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_organisations_name_trgm', 'organisations', 'name'),
+    ('ix_organisations_city_trgm', 'organisations', 'city'),
+    ('ix_organisations_customer_number_trgm', 'organisations', 'customer_number'),
+    ('ix_users_first_name_trgm', 'users', 'first_name'),
+    ('ix_users_last_name_trgm', 'users', 'last_name'),
+    ('ix_users_email_address_trgm', 'users', 'email_address'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(name, table, [column], unique=False, postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for name, table, column in reversed(TRIGRAM_INDEXES):
+        op.drop_index(name, table_name=table)
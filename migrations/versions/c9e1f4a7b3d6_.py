@@ -0,0 +1,34 @@
+"""record the transaction of changes
+
+Revision ID: c9e1f4a7b3d6
+Revises: a7c4e9d2f05b
+Create Date: 2019-09-03 16:41:08.215370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1f4a7b3d6'
+down_revision = 'a7c4e9d2f05b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ids are taken at insert, not at commit, so change streams resume by the
+    # writing transaction (txid) and the oldest one still running when the
+    # change was written (snapshot_xmin), the trigger's RETURNING * publishes
+    # both. Recorded changes get 0, before any horizon a client can hold.
+    op.add_column('changes', sa.Column('txid', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('changes', sa.Column('snapshot_xmin', sa.BigInteger(), server_default='0', nullable=False))
+    op.alter_column('changes', 'txid', server_default=sa.text('txid_current()'))
+    op.alter_column('changes', 'snapshot_xmin', server_default=sa.text('txid_snapshot_xmin(txid_current_snapshot())'))
+    op.create_index('ix_changes_txid', 'changes', ['txid'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_changes_txid', table_name='changes')
+    op.drop_column('changes', 'snapshot_xmin')
+    op.drop_column('changes', 'txid')
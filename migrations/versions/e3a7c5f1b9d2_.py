@@ -0,0 +1,72 @@
+"""add change feed
+
+Revision ID: e3a7c5f1b9d2
+Revises: b51f0e93c2d8
+Create Date: 2019-08-26 11:18:52.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c5f1b9d2'
+down_revision = 'b51f0e93c2d8'
+branch_labels = None
+depends_on = None
+
+# tables whose changes are published, their name is the category
+TABLES = ['organisations', 'users', 'credentials', 'accounts']
+
+# records every row change in changes and publishes it on the plaza_changes
+# channel, the notification is delivered when the transaction commits
+RECORD_CHANGE = '''
+CREATE FUNCTION plaza_record_change() RETURNS trigger AS $$
+DECLARE
+    item record;
+    change changes%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        item := OLD;
+    ELSE
+        item := NEW;
+    END IF;
+    INSERT INTO changes (category, action, resource_id, updated_at)
+        VALUES (TG_ARGV[0],
+                CASE TG_OP WHEN 'INSERT' THEN 'create' WHEN 'UPDATE' THEN 'update' ELSE 'delete' END,
+                item.id, item.updated_at)
+        RETURNING * INTO change;
+    PERFORM pg_notify('plaza_changes', row_to_json(change)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+
+def upgrade():
+    op.create_table(
+        'changes',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('category', sa.Text(), nullable=False),
+        sa.Column('action', sa.Text(), nullable=False),
+        sa.Column('resource_id', postgresql.UUID(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('changed_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_changes_changed_at', 'changes', ['changed_at'], unique=False)
+
+    op.execute(RECORD_CHANGE)
+    for table in TABLES:
+        op.execute('CREATE TRIGGER {0}_record_change AFTER INSERT OR UPDATE OR DELETE ON {0} '
+                   "FOR EACH ROW EXECUTE PROCEDURE plaza_record_change('{0}')".format(table))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.execute('DROP TRIGGER {0}_record_change ON {0}'.format(table))
+    op.execute('DROP FUNCTION plaza_record_change()')
+
+    op.drop_index('ix_changes_changed_at', table_name='changes')
+    op.drop_table('changes')
@@ -0,0 +1,26 @@
+"""add tombstone index
+
+Revision ID: f6d2b8e4a1c3
+Revises: e3a7c5f1b9d2
+Create Date: 2019-08-28 15:42:09.318560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6d2b8e4a1c3'
+down_revision = 'e3a7c5f1b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the deletes of a table since a delta sync's updatedSince
+    op.create_index('ix_changes_deletes', 'changes', ['category', 'changed_at'], unique=False,
+                    postgresql_where=sa.text("action = 'delete'"))
+
+
+def downgrade():
+    op.drop_index('ix_changes_deletes', table_name='changes')
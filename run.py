@@ -6,5 +6,5 @@ from src.app import create_app
 if __name__ == '__main__':
     env_name = os.getenv('FLASK_ENV')
     app = create_app(env_name)
-    # run app
+    # run app on the development server, production is served by gunicorn (gunicorn.conf.py)
     app.run()
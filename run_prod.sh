@@ -0,0 +1,3 @@
+#!/bin/sh
+export FLASK_ENV="production"
+exec gunicorn -c gunicorn.conf.py wsgi:application
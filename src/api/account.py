@@ -1,74 +1,131 @@
 # /src/api/credential.py
 
 from flask import request, Blueprint
+from sqlalchemy.exc import IntegrityError
+from ..models import db
 from ..models.account import AccountModel, account_schema, account_list_schema
-from .utils import resource_response, empty_response, error_response
+from .utils import (ArgumentError, BULK_MAX_ITEMS, BULK_RESULT_TYPE, Resource, dump, load, resource_response,
+                    empty_response, error_response, constraint_error_response, bulk_results)
+from .filters import Filter, parse_datetime, parse_uuid
+from .sync import parse_list_args, list_response
+from .fieldsets import parse_fields, parse_include, schema_for, query_options
+from .conditional import (resource_etag, current_resource_etag, is_not_modified, if_match_versions,
+                          unmatched_write_response, not_modified_response)
 
 account_api = Blueprint('accounts', __name__)
 
 API_CATEGORY = 'accounts'
 API_LIST_TYPE = 'AccountListV1'
 
+# filterable query parameters, only indexed columns are accepted
+LIST_FILTERS = {
+    'organisationUuid': Filter(AccountModel.organisation_uuid, parse_uuid),
+    'updatedAfter': Filter(AccountModel.updated_at, parse_datetime, 'gt'),
+}
+
+RESOURCE = Resource(AccountModel, account_schema, account_list_schema, LIST_FILTERS, API_CATEGORY, API_LIST_TYPE,
+                    'credential not found', lambda args: AccountModel.query)
+
 @account_api.route('/', methods=['GET'])
 def find_all():
-    models = AccountModel.find_all()
+    try:
+        list_args = parse_list_args(request.args, account_list_schema, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
 
-    res_data = account_list_schema.dump(models).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+    return list_response(AccountModel.query, AccountModel, account_list_schema, API_CATEGORY, API_LIST_TYPE, list_args)
 
 
 @account_api.route('/', methods=['POST'])
 def create():
     req_data = request.get_json()
-    data, error = account_schema.load(req_data)
+    data, error = load(account_schema, req_data)
 
     if error:
         return error_response(error, 400)
 
-    # cred_in_db = AccountModel.get_by_user_uuid(data.get('user_uuid'))
-    # if cred_in_db:
-    #    return error_response({'error': 'Credential for given user already exist'}, 400)
-
-    model = AccountModel(data)
-    model.save()
+    try:
+        model = AccountModel.create(data)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Account already exist, please supply another name')
+    if not model:
+        return error_response({'error': 'Account already exist, please supply another name'}, 400)
 
-    res_data = account_schema.dump(model).data
+    res_data = dump(account_schema, model)
     return resource_response(res_data, API_CATEGORY, 201)
 
 
+@account_api.route('/bulk', methods=['POST'])
+def create_bulk():
+    req_data = request.get_json()
+    if not isinstance(req_data, list):
+        return error_response({'error': 'expected a list of accounts'}, 400)
+    if len(req_data) > BULK_MAX_ITEMS:
+        return error_response({'error': 'at most {} accounts per request'.format(BULK_MAX_ITEMS)}, 400)
+
+    data, errors = load(account_schema, req_data, many=True)
+    indices = [index for index in range(len(req_data)) if index not in errors]
+    errors.update(AccountModel.reference_errors({index: data[index] for index in indices}))
+    indices = [index for index in indices if index not in errors]
+
+    try:
+        uuids = AccountModel.insert_many([data[index] for index in indices])
+    except IntegrityError:
+        # a referenced organisation was deleted since it was looked up
+        db.session.rollback()
+        return error_response({'error': 'bulk insert conflicted with a concurrent change, please retry'}, 409)
+
+    res_data = bulk_results(len(req_data), errors, indices, uuids)
+    return resource_response(res_data, API_CATEGORY, 200, many=True, type=BULK_RESULT_TYPE)
+
+
 @account_api.route('/<string:uuid>', methods=['GET'])
 def get_by_uuid(uuid):
-    model = AccountModel.get_by_uuid(uuid)
+    try:
+        only = parse_fields(request.args, account_schema)
+        include = parse_include(request.args, account_schema)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    if request.if_none_match:
+        etag = current_resource_etag(AccountModel, uuid)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+    model = AccountModel.get_by_uuid(uuid, *query_options(AccountModel, only, include, 'updated_at'),
+                                     cached=not include)
     if not model:
         return error_response({'error': 'credential not found'}, 404)
 
-    res_data = account_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(schema_for(account_schema, only, include), model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @account_api.route('/<string:uuid>', methods=['PUT'])
 def update(uuid):
     req_data = request.get_json()
-    data, error = account_schema.load(req_data, partial=True)
+    data, error = load(account_schema, req_data, partial=True)
     if error:
         return error_response(error, 400)
 
-    model = AccountModel.get_by_uuid(uuid)
+    versions = if_match_versions(uuid)
+    try:
+        model = AccountModel.update_by_uuid(uuid, data, versions)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Account already exist, please supply another name')
     if not model:
-        return error_response({'error': 'credential not found'}, 404)
-
-    model.update(data)
+        return unmatched_write_response(AccountModel, uuid, versions, 'credential not found')
 
-    res_data = account_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(account_schema, model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @account_api.route('/<string:uuid>', methods=['DELETE'])
 def delete(uuid):
-    model = AccountModel.get_by_uuid(uuid)
-    if not model:
-        return error_response({'error': 'credential not found'}, 404)
-
-    model.delete()
+    versions = if_match_versions(uuid)
+    if not AccountModel.delete_by_uuid(uuid, versions):
+        return unmatched_write_response(AccountModel, uuid, versions, 'credential not found')
 
     return empty_response(204)
@@ -0,0 +1,194 @@
+# /src/api/change.py
+
+from flask import current_app, request, Blueprint, Response
+from ..encoding import codec
+from ..models.change import ChangeModel, CATEGORIES, change_schema
+from ..models.feed import change_feed, TooManyStreams
+from ..models.replicas import use_primary
+from .utils import ArgumentError, dump, error_response, unavailable_response
+
+change_api = Blueprint('changes', __name__)
+
+KEEPALIVE = b': keepalive\n\n'
+
+
+def parse_categories(args):
+    value = args.get('categories')
+    if not value:
+        return CATEGORIES
+    categories = tuple(sorted({name.strip() for name in value.split(',') if name.strip()}))
+    unknown = [name for name in categories if name not in CATEGORIES]
+    if unknown or not categories:
+        raise ArgumentError('categories must be some of {}'.format(', '.join(CATEGORIES)))
+    return categories
+
+
+def parse_last_event_id(req):
+    '''reads the id of the last event a reconnecting client received, EventSource sends it as Last-Event-ID'''
+    value = req.headers.get('Last-Event-ID') or req.args.get('lastEventId')
+    if not value:
+        return None
+    try:
+        last_id = int(value)
+    except ValueError:
+        raise ArgumentError('Last-Event-ID must be an integer')
+    if last_id < 0:
+        raise ArgumentError('Last-Event-ID must not be negative')
+    return last_id
+
+
+class StreamPosition(object):
+    """
+    What a stream has sent: the changes of every transaction below the
+    horizon, and of the later ones those with the ids in sent, which the
+    LISTEN connection or a read of the changes table may deliver again.
+    """
+
+    def __init__(self, horizon):
+        self.horizon = horizon
+        self.sent = {}
+
+    def is_new(self, change):
+        return change.txid >= self.horizon and change.id not in self.sent
+
+    def add(self, change):
+        self.sent[change.id] = change.txid
+
+    def advance(self, horizon):
+        if horizon > self.horizon:
+            self.horizon = horizon
+            self.sent = {id: txid for id, txid in self.sent.items() if txid >= horizon}
+
+    def reset(self, horizon):
+        self.horizon = horizon
+        self.sent = {}
+
+
+def _event(change, horizon):
+    data = codec.dumps(dump(change_schema, change))
+    return b''.join([b'id: ', str(horizon).encode('ascii'), b'\nevent: ', change.action.encode('ascii'),
+                     b'\ndata: ', data, b'\n\n'])
+
+
+def _reset_event(horizon):
+    # the changes since the client's last event are no longer all recorded,
+    # it reloads the lists it shows and continues from here
+    return 'id: {}\nevent: reset\ndata: {{}}\n\n'.format(horizon).encode('ascii')
+
+
+def catch_up_events(position, horizon, retained, changes, limit):
+    """
+    Returns the events of the committed changes the stream hasn't sent, read
+    (up to limit + 1) after the horizon, and advances its position past them.
+    Only the last event carries the new horizon, a client resuming in
+    between gets the others again. retained is ChangeModel.retained of the
+    position's horizon, if it or the limit is exceeded the client resets.
+    """
+    if not retained or len(changes) > limit:
+        position.reset(horizon)
+        return [_reset_event(horizon)]
+
+    changes = [change for change in changes if position.is_new(change)]
+    events = [_event(change, position.horizon) for change in changes[:-1]]
+    for change in changes:
+        position.add(change)
+    position.advance(horizon)
+    if changes:
+        events.append(_event(changes[-1], position.horizon))
+    return events
+
+
+def live_event(position, change):
+    '''returns the event of a change received from the feed, None if the stream sent it already'''
+    if not position.is_new(change):
+        return None
+    # notifications arrive in commit order, the transactions below its
+    # snapshot_xmin committed before it and were received
+    position.add(change)
+    position.advance(change.snapshot_xmin)
+    return _event(change, position.horizon)
+
+
+def _catch_up(categories, position, limit):
+    horizon = ChangeModel.horizon()
+    retained = ChangeModel.retains(position.horizon)
+    changes = ChangeModel.committed_since(position.horizon, categories, limit + 1) if retained else []
+    return catch_up_events(position, horizon, retained, changes, limit)
+
+
+def _stream(app, subscription, categories, events, position):
+    """
+    Yields the caught up events, then the changes of the subscription as they
+    arrive, each with the stream's horizon as its id. After missed changes
+    they are read from the table again, the position skips those sent
+    already.
+    """
+    config = app.config
+    try:
+        yield retry_event(config)
+        for event in events:
+            yield event
+
+        while True:
+            change = subscription.get(config.get('CHANGES_KEEPALIVE_SECONDS', 15))
+            if subscription.resync():
+                with app.app_context():
+                    events = _catch_up(categories, position, config.get('CHANGES_BACKLOG_LIMIT', 1000))
+                for event in events:
+                    yield event
+            elif change is None:
+                # detects clients gone away, and keeps proxies from closing the stream
+                yield KEEPALIVE
+            elif isinstance(change, ChangeModel):
+                event = live_event(position, change)
+                if event is not None:
+                    yield event
+    finally:
+        change_feed.unsubscribe(subscription)
+
+
+def retry_event(config):
+    return 'retry: {}\n\n'.format(config.get('CHANGES_RETRY_MS', 3000)).encode('ascii')
+
+
+def event_stream_response(events):
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx would buffer the stream otherwise
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@change_api.route('/', methods=['GET'])
+def stream():
+    """
+    Streams the creates, updates and deletes of the given categories as
+    Server-Sent Events. Event ids are horizons (see ChangeModel), a client
+    reconnecting with Last-Event-ID first gets the changes committed since,
+    which may repeat some it received but never leaves one out.
+    """
+    try:
+        categories = parse_categories(request.args)
+        last_id = parse_last_event_id(request)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    # subscribed first, so nothing committed meanwhile is lost
+    try:
+        subscription = change_feed.subscribe(categories)
+    except TooManyStreams:
+        return unavailable_response({'error': 'too many open change streams, please retry'})
+    try:
+        # the horizon must be the primary's, where the notifications come from
+        with use_primary():
+            if last_id is None:
+                position, events = StreamPosition(ChangeModel.horizon()), []
+            else:
+                position = StreamPosition(last_id)
+                events = _catch_up(categories, position, current_app.config.get('CHANGES_BACKLOG_LIMIT', 1000))
+    except Exception:
+        change_feed.unsubscribe(subscription)
+        raise
+
+    return event_stream_response(_stream(current_app._get_current_object(), subscription, categories, events,
+                                         position))
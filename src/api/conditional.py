@@ -0,0 +1,135 @@
+# /src/api/conditional.py
+
+import datetime
+import hashlib
+import uuid as uuid_lib
+
+from flask import request, Response
+from sqlalchemy import func
+
+from ..compression import strip_coding
+from ..models import db
+from .utils import error_response
+
+
+def _version(updated_at):
+    return '{:%Y%m%d%H%M%S%f}'.format(updated_at) if updated_at else '0'
+
+
+def _variant():
+    # representation affecting query parameters, e.g. fields
+    args = sorted(request.args.items(multi=True))
+    if not args:
+        return None
+    return hashlib.sha1(repr(args).encode('utf-8')).hexdigest()[:12]
+
+
+def resource_etag(uuid, updated_at):
+    """
+    Returns the strong ETag of a single resource representation, which is
+    derived from its uuid, its updated_at and the request's query parameters.
+    """
+    etag = '{}.{}'.format(uuid, _version(updated_at))
+    variant = _variant()
+    return '{}.{}'.format(etag, variant) if variant else etag
+
+
+def current_resource_etag(model, uuid):
+    """
+    Returns the ETag of a stored resource without loading the whole row, or
+    None if it does not exist.
+    """
+    row = db.session.query(model.uuid, model.updated_at).filter(model.uuid == uuid).first()
+    if row is None:
+        return None
+    return resource_etag(row.uuid, row.updated_at)
+
+
+def list_version_query(query, model):
+    return query.order_by(None).with_entities(func.max(model.updated_at), func.count())
+
+
+def list_version(query, model):
+    '''returns max(updated_at) and the row count of a list query'''
+    return list_version_query(query, model).one()
+
+
+def list_etag(version):
+    """
+    Returns the weak ETag of a list representation, the aggregate version
+    changes whenever a member is created, updated or deleted.
+    """
+    updated_at, count = version
+    raw = '{}.{}.{}'.format(_version(updated_at), count, _variant())
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def page_etag(page):
+    """
+    Returns the weak ETag of a list page whose total isn't counted, which is
+    derived from the versions of its members instead of the whole list's.
+    """
+    members = ','.join('{}.{}'.format(item.uuid, _version(item.updated_at)) for item in page.items)
+    raw = '{}.{}.{}.{}.{}'.format(members, page.start, page.total, page.next, _variant())
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _matching_tag(etag):
+    '''returns the If-None-Match tag matching etag, also the tag of a compressed representation of it'''
+    if_none_match = request.if_none_match
+    if etag is None:
+        return None
+    if if_none_match.star_tag or if_none_match.contains_weak(etag):
+        return etag
+    return next((tag for tag in if_none_match.as_set(include_weak=True) if strip_coding(tag) == etag), None)
+
+
+def is_not_modified(etag):
+    return _matching_tag(etag) is not None
+
+
+def if_match_versions(uuid):
+    """
+    Returns the stored versions (updated_at) the If-Match header of a write
+    request accepts for the resource uuid, tags of any representation variant
+    of a version match. None if the header is missing or *, any version is
+    accepted then.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+
+    try:
+        prefix = '{}.'.format(uuid_lib.UUID(uuid))
+    except ValueError:
+        return []
+    versions = []
+    for tag in request.if_match:
+        tag = strip_coding(tag)
+        if not tag.startswith(prefix):
+            continue
+        version = tag[len(prefix):].split('.')[0]
+        if version == '0':
+            versions.append(None)
+            continue
+        try:
+            versions.append(datetime.datetime.strptime(version, '%Y%m%d%H%M%S%f'))
+        except ValueError:
+            pass
+    return versions
+
+
+def unmatched_write_response(model, uuid, versions, not_found):
+    """
+    Returns the response of a write that matched no row, 412 if the resource
+    exists at a version the If-Match header doesn't accept, else 404.
+    """
+    if versions is not None and model.exists(uuid):
+        return error_response({'error': 'precondition failed'}, 412)
+    return error_response({'error': not_found}, 404)
+
+
+def not_modified_response(etag, weak=False):
+    '''returns the 304 of etag, with the coding of the tag the client sent'''
+    response = Response(mimetype='application/json', status=304)
+    response.set_etag(_matching_tag(etag) or etag, weak=weak)
+    return response
@@ -1,74 +1,168 @@
 # /src/api/credential.py
 
 from flask import request, Blueprint
-from ..models.credential import CredentialModel, credential_schema, credential_list_schema
-from .utils import resource_response, empty_response, error_response
+from sqlalchemy.exc import IntegrityError
+from ..models import db, hash_pool
+from ..models.credential import (CredentialModel, credential_schema, credential_list_schema, login_schema,
+                                 password_schema)
+from ..models.hashing import PoolSaturated
+from ..models.user import UserModel
+from .utils import (ArgumentError, Resource, dump, load, resource_response, empty_response, error_response,
+                    constraint_error_response, unavailable_response)
+from .filters import Filter, parse_datetime, parse_uuid
+from .sync import parse_list_args, list_response
+from .fieldsets import parse_fields, parse_include, schema_for, query_options
+from .conditional import (resource_etag, current_resource_etag, is_not_modified, if_match_versions,
+                          unmatched_write_response, not_modified_response)
 
 credential_api = Blueprint('credentials', __name__)
 
 API_CATEGORY = 'credentials'
 API_LIST_TYPE = 'CredentialListV1'
 
+# filterable query parameters, only indexed columns are accepted
+LIST_FILTERS = {
+    'userUuid': Filter(CredentialModel.user_uuid, parse_uuid),
+    'updatedAfter': Filter(CredentialModel.updated_at, parse_datetime, 'gt'),
+}
+
+RESOURCE = Resource(CredentialModel, credential_schema, credential_list_schema, LIST_FILTERS, API_CATEGORY,
+                    API_LIST_TYPE, 'credential not found', lambda args: CredentialModel.query)
+
 @credential_api.route('/', methods=['GET'])
 def find_all():
-    models = CredentialModel.find_all()
+    try:
+        list_args = parse_list_args(request.args, credential_list_schema, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
 
-    res_data = credential_list_schema.dump(models).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+    return list_response(CredentialModel.query, CredentialModel, credential_list_schema, API_CATEGORY, API_LIST_TYPE,
+                         list_args)
 
 
 @credential_api.route('/', methods=['POST'])
 def create():
     req_data = request.get_json()
-    data, error = credential_schema.load(req_data)
+    data, error = load(credential_schema, req_data)
 
     if error:
         return error_response(error, 400)
 
-    cred_in_db = CredentialModel.get_by_user_uuid(data.get('user_uuid'))
-    if cred_in_db:
+    try:
+        model = CredentialModel.create(data)
+    except PoolSaturated:
+        return unavailable_response({'error': 'password hashing is busy, please retry'})
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Credential for given user already exist')
+    if not model:
         return error_response({'error': 'Credential for given user already exist'}, 400)
 
-    model = CredentialModel(data)
-    model.save()
-
-    res_data = credential_schema.dump(model).data
+    res_data = dump(credential_schema, model)
     return resource_response(res_data, API_CATEGORY, 201)
 
 
+@credential_api.route('/login', methods=['POST'])
+def login():
+    req_data = request.get_json()
+    data, error = load(login_schema, req_data)
+    if error:
+        return error_response(error, 400)
+
+    model = None
+    if data.get('user_uuid'):
+        model = CredentialModel.get_by_user_uuid(data.get('user_uuid'))
+    elif data.get('email_address'):
+        user = UserModel.get_by_email_address(data.get('email_address'))
+        model = user.credential if user else None
+    else:
+        return error_response({'error': 'emailAddress or userUuid is required'}, 400)
+
+    # the password is checked first and unknown users are checked against a
+    # dummy hash, so neither the timing nor the status tells whether a user
+    # exists or is locked before the password is known
+    try:
+        succeeded = model.check_hash(data.get('password')) if model else hash_pool.check_dummy(data.get('password'))
+    except PoolSaturated:
+        return unavailable_response({'error': 'password hashing is busy, please retry'})
+
+    if not succeeded:
+        if model:
+            model.record_login(False)
+        return error_response({'error': 'invalid credentials'}, 401)
+
+    if model.is_locked or model.is_expired:
+        return error_response({'error': 'credential is locked or expired'}, 403)
+
+    model.record_login(True)
+    res_data = dump(credential_schema, model)
+    return resource_response(res_data, API_CATEGORY, 200)
+
+
 @credential_api.route('/<string:uuid>', methods=['GET'])
 def get_by_uuid(uuid):
-    model = CredentialModel.get_by_uuid(uuid)
+    try:
+        only = parse_fields(request.args, credential_schema)
+        include = parse_include(request.args, credential_schema)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    if request.if_none_match:
+        etag = current_resource_etag(CredentialModel, uuid)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+    model = CredentialModel.get_by_uuid(uuid, *query_options(CredentialModel, only, include, 'updated_at'))
     if not model:
         return error_response({'error': 'credential not found'}, 404)
 
-    res_data = credential_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(schema_for(credential_schema, only, include), model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @credential_api.route('/<string:uuid>', methods=['PUT'])
 def update(uuid):
     req_data = request.get_json()
-    data, error = credential_schema.load(req_data, partial=True)
+    data, error = load(credential_schema, req_data, partial=True)
     if error:
         return error_response(error, 400)
 
-    model = CredentialModel.get_by_uuid(uuid)
+    versions = if_match_versions(uuid)
+    try:
+        model = CredentialModel.update_by_uuid(uuid, data, versions)
+    except PoolSaturated:
+        return unavailable_response({'error': 'password hashing is busy, please retry'})
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Credential for given user already exist')
     if not model:
-        return error_response({'error': 'credential not found'}, 404)
+        return unmatched_write_response(CredentialModel, uuid, versions, 'credential not found')
 
-    model.update(data)
+    res_data = dump(credential_schema, model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
-    res_data = credential_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
 
+@credential_api.route('/<string:uuid>/password', methods=['PUT'])
+def set_password(uuid):
+    req_data = request.get_json()
+    data, error = load(password_schema, req_data)
+    if error:
+        return error_response(error, 400)
 
-@credential_api.route('/<string:uuid>', methods=['DELETE'])
-def delete(uuid):
-    model = CredentialModel.get_by_uuid(uuid)
+    try:
+        model = CredentialModel.update_by_uuid(uuid, data)
+    except PoolSaturated:
+        return unavailable_response({'error': 'password hashing is busy, please retry'})
     if not model:
         return error_response({'error': 'credential not found'}, 404)
 
-    model.delete()
+    return empty_response(204)
+
+
+@credential_api.route('/<string:uuid>', methods=['DELETE'])
+def delete(uuid):
+    versions = if_match_versions(uuid)
+    if not CredentialModel.delete_by_uuid(uuid, versions):
+        return unmatched_write_response(CredentialModel, uuid, versions, 'credential not found')
 
     return empty_response(204)
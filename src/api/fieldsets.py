@@ -0,0 +1,110 @@
+# /src/api/fieldsets.py
+
+from functools import lru_cache
+
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, joinedload, selectinload
+
+from .utils import ArgumentError
+
+
+class FieldsetError(ArgumentError):
+    pass
+
+
+def parse_fields(args, schema):
+    """
+    Maps the comma separated fields query parameter, given in the dumped
+    (camelCase) names, to the attribute names of schema. The type
+    discriminator is always part of the fieldset.
+    """
+    value = args.get('fields')
+    if not value:
+        return None
+
+    names = {(field.dump_to or name): name for name, field in schema.fields.items() if not field.load_only}
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+
+    unknown = [name for name in requested if name not in names]
+    if unknown:
+        raise FieldsetError('unknown fields: {}'.format(', '.join(unknown)))
+
+    only = {names[name] for name in requested}
+    only.add('_type')
+    return tuple(sorted(only))
+
+
+def parse_include(args, schema):
+    """
+    Maps the comma separated include query parameter to the nested fields of
+    schema which are dumped. Without the parameter, the nested fields the
+    schema doesn't exclude are included, an empty value includes none.
+    """
+    nested = {(field.dump_to or name): name for name, field in schema.declared_fields.items()
+              if isinstance(field, fields.Nested)}
+
+    value = args.get('include')
+    if value is None:
+        return tuple(sorted(name for name in nested.values() if name not in schema.exclude))
+
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+
+    unknown = [name for name in requested if name not in nested]
+    if unknown:
+        raise FieldsetError('unknown includes: {}'.format(', '.join(unknown)))
+
+    return tuple(sorted({nested[name] for name in requested}))
+
+
+@lru_cache(maxsize=256)
+def schema_for(schema, only=None, include=None):
+    """
+    Returns a schema like the given one restricted to the only fieldset and
+    dumping the include nested fields. Instances are cached as there are only
+    few distinct combinations in use.
+    """
+    if include is None:
+        include = tuple(name for name, field in schema.declared_fields.items()
+                        if isinstance(field, fields.Nested) and name not in schema.exclude)
+
+    exclude = tuple(sorted(name for name, field in schema.declared_fields.items()
+                           if isinstance(field, fields.Nested) and name not in include))
+    if only is not None:
+        only = tuple(sorted(set(only) | set(include)))
+
+    if only is None and set(exclude) == set(schema.exclude):
+        return schema
+    return schema.__class__(only=only, many=schema.many, exclude=exclude)
+
+
+def query_options(model, only, include=(), *always):
+    """
+    Returns the loader options for dumping model with the only fieldset and
+    the include relationships. The SELECT is limited to the columns backing
+    the fieldset, plus the always columns (e.g. sort keys) and the foreign
+    keys of relationships. Included relationships are loaded eagerly, scalar
+    ones joined and collections with a second SELECT ... IN, so a response
+    costs a fixed number of queries.
+    """
+    mapper = inspect(model)
+    options = []
+
+    for name in include:
+        relationship = mapper.relationships[name]
+        attribute = getattr(model, name)
+        options.append(selectinload(attribute) if relationship.uselist else joinedload(attribute))
+
+    if only is None:
+        return tuple(options)
+
+    columns = set()
+    for name in set(only) | set(include) | set(always):
+        if name in mapper.column_attrs:
+            columns.add(name)
+        elif name in mapper.relationships:
+            for column in mapper.relationships[name].local_columns:
+                columns.add(mapper.get_property_by_column(column).key)
+
+    options.append(load_only(*columns))
+    return tuple(options)
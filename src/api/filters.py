@@ -0,0 +1,126 @@
+# /src/api/filters.py
+
+import datetime
+import re
+import uuid as uuid_lib
+
+from ..models.search import MIN_SEARCH_LENGTH
+from .utils import ArgumentError
+
+
+class FilterError(ArgumentError):
+    pass
+
+
+def parse_uuid(value):
+    try:
+        return str(uuid_lib.UUID(value))
+    except ValueError:
+        raise FilterError('invalid uuid: {}'.format(value))
+
+
+def parse_datetime(value):
+    '''parses an ISO 8601 timestamp to a naive UTC datetime, naive input is UTC'''
+    # an unescaped + arrives as a space, and strptime's %z doesn't accept a
+    # colon in the offset before Python 3.7
+    normalized = value.strip().replace(' ', '+').replace('Z', '+0000')
+    normalized = re.sub(r'([+-]\d\d):(\d\d)$', r'\1\2', normalized)
+    for pattern in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f',
+                    '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            parsed = datetime.datetime.strptime(normalized, pattern)
+        except ValueError:
+            continue
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise FilterError('invalid timestamp: {}'.format(value))
+
+
+def is_indexed(column):
+    '''whether column leads an index, unique constraint or primary key of its table'''
+    if column.primary_key or column.index or column.unique:
+        return True
+    leading = [list(index.columns)[0] for index in column.table.indexes if index.columns]
+    leading += [list(constraint.columns)[0] for constraint in column.table.constraints
+                if getattr(constraint, 'columns', None) and constraint.__visit_name__ == 'unique_constraint']
+    return any(candidate.name == column.name for candidate in leading)
+
+
+class Filter(object):
+    """
+    A list filter on one indexed column. The operator is eq (one or more
+    values, IN), contains (array column containing all values, @>) or gt.
+    """
+
+    OPERATORS = ('eq', 'contains', 'gt')
+
+    def __init__(self, attribute, parse=str, operator='eq'):
+        column = attribute.property.columns[0]
+        if not is_indexed(column):
+            raise ValueError('{}.{} is not indexed'.format(column.table.name, column.name))
+        if operator not in self.OPERATORS:
+            raise ValueError('unknown filter operator: {}'.format(operator))
+        self.attribute = attribute
+        self.parse = parse
+        self.operator = operator
+
+    def clause(self, name, values):
+        values = [self.parse(value) for value in values]
+        if self.operator == 'contains':
+            return self.attribute.contains(values)
+        if len(values) > 1 and self.operator != 'eq':
+            raise FilterError('{} accepts one value'.format(name))
+        if self.operator == 'gt':
+            return self.attribute > values[0]
+        return self.attribute == values[0] if len(values) == 1 else self.attribute.in_(values)
+
+
+def parse_filters(args, filters):
+    '''returns the clauses of the allowed filters given as query parameters'''
+    return [filters[name].clause(name, args.getlist(name)) for name in sorted(filters) if name in args]
+
+
+class Sort(object):
+    """
+    The order of a list, by one of the SORT_KEYS and the uuid as tiebreaker
+    """
+
+    def __init__(self, key, descending=False):
+        self.key = key
+        self.attribute = SORT_KEYS[key]
+        self.descending = descending
+
+    @property
+    def token(self):
+        return ('-' if self.descending else '') + self.key
+
+    def columns(self, model):
+        return getattr(model, self.attribute), model.uuid
+
+
+# sortable attributes, each backed by an (attribute, id) index of every table
+SORT_KEYS = {
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at',
+}
+DEFAULT_SORT = Sort('createdAt')
+
+
+def parse_sort(args):
+    '''reads the sort query parameter, a sort key optionally prefixed with - for descending order'''
+    value = args.get('sort')
+    if not value:
+        return DEFAULT_SORT
+    key = value[1:] if value.startswith('-') else value
+    if key not in SORT_KEYS:
+        raise FilterError('sort must be one of {}, optionally prefixed with -'.format(', '.join(sorted(SORT_KEYS))))
+    return Sort(key, value.startswith('-'))
+
+
+def parse_search(args):
+    '''reads the q search term of a search request'''
+    value = (args.get('q') or '').strip()
+    if len(value) < MIN_SEARCH_LENGTH:
+        raise FilterError('q must have at least {} characters'.format(MIN_SEARCH_LENGTH))
+    return value
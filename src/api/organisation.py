@@ -1,101 +1,250 @@
 # /src/api/organisation.py
 
 from flask import request, Blueprint
+from sqlalchemy.exc import IntegrityError
+from ..models import db
 from ..models.organisation import OrganisationModel, organisation_schema, organisation_list_schema
-from ..models.user import user_list_schema
-from .utils import resource_response, empty_response, error_response
-from .user import API_LIST_TYPE as API_USER_LIST_TYPE
+from ..models.user import UserModel, user_list_schema
+from .utils import (ArgumentError, BULK_MAX_ITEMS, BULK_RESULT_TYPE, Resource, dump, load, resource_response,
+                    empty_response, error_response, constraint_error_response, bulk_results)
+from .pagination import parse_offset_page_args, parse_total_mode, paginate_offset
+from .filters import Filter, parse_filters, parse_search, parse_datetime, parse_uuid
+from .sync import parse_list_args, list_response
+from .fieldsets import parse_fields, parse_include, schema_for, query_options
+from .conditional import (resource_etag, current_resource_etag, is_not_modified, if_match_versions,
+                          unmatched_write_response, not_modified_response)
+from .user import API_LIST_TYPE as API_USER_LIST_TYPE, LIST_FILTERS as USER_LIST_FILTERS
 
 organisation_api = Blueprint('organisations', __name__)
 
 API_CATEGORY = 'organisations'
 API_LIST_TYPE = 'OrganisationListV1'
 
+# filterable query parameters, only indexed columns are accepted
+LIST_FILTERS = {
+    'supplierUuid': Filter(OrganisationModel.supplier_uuid, parse_uuid),
+    'countryCode': Filter(OrganisationModel.country_code),
+    'role': Filter(OrganisationModel.roles, operator='contains'),
+    'emailAddress': Filter(OrganisationModel.email_address),
+    'updatedAfter': Filter(OrganisationModel.updated_at, parse_datetime, 'gt'),
+}
+
+def list_query(args):
+    if args.get('suppliersOnly'):
+        return OrganisationModel.query_suppliers()
+    return OrganisationModel.query
+
+
+RESOURCE = Resource(OrganisationModel, organisation_schema, organisation_list_schema, LIST_FILTERS, API_CATEGORY,
+                    API_LIST_TYPE, 'organisation not found', list_query)
+
+def parse_depth(args, default):
+    '''reads the depth query parameter, a positive level count or "all" (None)'''
+    value = args.get('depth')
+    if value is None:
+        return default
+    if value == 'all':
+        return None
+    try:
+        depth = int(value)
+    except ValueError:
+        raise ArgumentError('depth must be a positive integer or all')
+    if depth < 1:
+        raise ArgumentError('depth must be a positive integer or all')
+    return depth
+
 @organisation_api.route('/', methods=['GET'])
 def find_all():
-    suppliers_only = request.args.get('suppliersOnly')
-    models = []
-
-    if suppliers_only:
-        models = OrganisationModel.find_suppliers()
-    else:
-        models = OrganisationModel.find_all()
+    try:
+        list_args = parse_list_args(request.args, organisation_list_schema, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
 
-    res_data = organisation_list_schema.dump(models).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+    return list_response(list_query(request.args), OrganisationModel, organisation_list_schema, API_CATEGORY,
+                         API_LIST_TYPE, list_args)
 
 
 @organisation_api.route('/', methods=['POST'])
 def create():
     req_data = request.get_json()
-    data, error = organisation_schema.load(req_data)
+    data, error = load(organisation_schema, req_data)
 
     if error:
         return error_response(error, 400)
 
-    org_in_db = OrganisationModel.get_by_name_and_country_code(data.get('name'), data.get('country_code'))
-    if org_in_db:
+    try:
+        model = OrganisationModel.create(data)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Organisation already exist, please supply another name')
+    if not model:
         return error_response({'error': 'Organisation already exist, please supply another name'}, 400)
 
-    model = OrganisationModel(data)
-    model.save()
-
-    res_data = organisation_schema.dump(model).data
+    res_data = dump(organisation_schema, model)
     return resource_response(res_data, API_CATEGORY, 201)
 
 
+@organisation_api.route('/bulk', methods=['POST'])
+def create_bulk():
+    req_data = request.get_json()
+    if not isinstance(req_data, list):
+        return error_response({'error': 'expected a list of organisations'}, 400)
+    if len(req_data) > BULK_MAX_ITEMS:
+        return error_response({'error': 'at most {} organisations per request'.format(BULK_MAX_ITEMS)}, 400)
+
+    data, errors = load(organisation_schema, req_data, many=True)
+    indices = [index for index in range(len(req_data)) if index not in errors]
+    errors.update(OrganisationModel.reference_errors({index: data[index] for index in indices}))
+    indices = [index for index in indices if index not in errors]
+
+    try:
+        uuids = OrganisationModel.insert_many([data[index] for index in indices])
+    except IntegrityError:
+        # a referenced supplier was deleted since it was looked up
+        db.session.rollback()
+        return error_response({'error': 'bulk insert conflicted with a concurrent change, please retry'}, 409)
+
+    res_data = bulk_results(len(req_data), errors, indices, uuids)
+    return resource_response(res_data, API_CATEGORY, 200, many=True, type=BULK_RESULT_TYPE)
+
+
+@organisation_api.route('/search', methods=['GET'])
+def search():
+    try:
+        only = parse_fields(request.args, organisation_list_schema)
+        include = parse_include(request.args, organisation_list_schema)
+        text = parse_search(request.args)
+        start, limit = parse_offset_page_args(request.args)
+        total_mode = parse_total_mode(request.args)
+        filters = parse_filters(request.args, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    schema = schema_for(organisation_list_schema, only, include)
+    query = OrganisationModel.search(text).filter(*filters).options(*query_options(OrganisationModel, only, include))
+
+    page = paginate_offset(query, start, limit, total_mode=total_mode)
+
+    res_data = dump(schema, page.items)
+    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE, page=page)
+
+
 @organisation_api.route('/<string:uuid>', methods=['GET'])
 def get_by_uuid(uuid):
-    model = OrganisationModel.get_by_uuid(uuid)
+    try:
+        only = parse_fields(request.args, organisation_schema)
+        include = parse_include(request.args, organisation_schema)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    if request.if_none_match:
+        etag = current_resource_etag(OrganisationModel, uuid)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+    model = OrganisationModel.get_by_uuid(uuid, *query_options(OrganisationModel, only, include, 'updated_at'),
+                                          cached=not include)
     if not model:
         return error_response({'error': 'organisation not found'}, 404)
 
-    res_data = organisation_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(schema_for(organisation_schema, only, include), model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 @organisation_api.route('/<string:uuid>/users', methods=['GET'])
 def get_users(uuid):
+    try:
+        list_args = parse_list_args(request.args, user_list_schema, USER_LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
     model = OrganisationModel.get_by_uuid(uuid)
     if not model:
         return error_response({'error': 'organisation not found'}, 404)
 
-    res_data = user_list_schema.dump(model.users).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_USER_LIST_TYPE)
+    return list_response(UserModel.query.filter_by(organisation_uuid=uuid), UserModel, user_list_schema,
+                         API_CATEGORY, API_USER_LIST_TYPE, list_args)
 
 @organisation_api.route('/<string:uuid>/customers', methods=['GET'])
 def get_customers(uuid):
+    try:
+        list_args = parse_list_args(request.args, organisation_list_schema, LIST_FILTERS)
+        max_depth = parse_depth(request.args, 1)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
     model = OrganisationModel.get_by_uuid(uuid)
     if not model:
         return error_response({'error': 'organisation not found'}, 404)
 
-    res_data = organisation_list_schema.dump(model.customers).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+    return list_response(OrganisationModel.query_customers(uuid, max_depth), OrganisationModel,
+                         organisation_list_schema, API_CATEGORY, API_LIST_TYPE, list_args, stream=False)
+
+@organisation_api.route('/<string:uuid>/tree', methods=['GET'])
+def get_tree(uuid):
+    try:
+        only = parse_fields(request.args, organisation_list_schema)
+        include = parse_include(request.args, organisation_list_schema)
+        max_depth = parse_depth(request.args, None)
+        tree_format = request.args.get('format', 'nested')
+        if tree_format not in ('nested', 'flat'):
+            raise ArgumentError('format must be nested or flat')
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    rows = OrganisationModel.find_customer_tree(
+        uuid, max_depth, *query_options(OrganisationModel, only, include, 'created_at', 'supplier_uuid'))
+    if not rows:
+        return error_response({'error': 'organisation not found'}, 404)
+
+    members = dump(schema_for(organisation_list_schema, only, include), [model for model, _ in rows])
+    for member, (model, depth) in zip(members, rows):
+        member['parentUuid'] = model.supplier_uuid
+        member['depth'] = depth
+
+    if tree_format == 'flat':
+        return resource_response(members, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+
+    # rows are ordered by depth, so every parent is seen before its customers
+    nodes = {}
+    for member, (model, _) in zip(members, rows):
+        member['customers'] = []
+        nodes[str(model.uuid)] = member
+        if member['depth']:
+            nodes[model.supplier_uuid]['customers'].append(member)
+
+    return resource_response(members[0], API_CATEGORY, 200)
 
 @organisation_api.route('/<string:uuid>', methods=['PUT'])
 def update(uuid):
     req_data = request.get_json()
     print("req_data=", req_data)
-    data, error = organisation_schema.load(req_data, partial=True)
+    data, error = load(organisation_schema, req_data, partial=True)
     if error:
         print("error=", error)
         return error_response(error, 400)
 
-    model = OrganisationModel.get_by_uuid(uuid)
+    versions = if_match_versions(uuid)
+    try:
+        model = OrganisationModel.update_by_uuid(uuid, data, versions)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'Organisation already exist, please supply another name')
     if not model:
-        return error_response({'error': 'organisation not found'}, 404)
+        return unmatched_write_response(OrganisationModel, uuid, versions, 'organisation not found')
 
-    model.update(data)
-
-    res_data = organisation_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(organisation_schema, model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @organisation_api.route('/<string:uuid>', methods=['DELETE'])
 def delete(uuid):
-    model = OrganisationModel.get_by_uuid(uuid)
-    if not model:
-        return error_response({'error': 'organisation not found'}, 404)
-
-    model.delete()
+    versions = if_match_versions(uuid)
+    try:
+        deleted = OrganisationModel.delete_by_uuid(uuid, versions)
+    except IntegrityError:
+        db.session.rollback()
+        return error_response({'error': 'organisation still has users, accounts or customers'}, 400)
+    if not deleted:
+        return unmatched_write_response(OrganisationModel, uuid, versions, 'organisation not found')
 
     return empty_response(204)
@@ -0,0 +1,246 @@
+# /src/api/pagination.py
+
+import base64
+import binascii
+import datetime
+import json
+import uuid as uuid_lib
+
+from flask import current_app, request
+from sqlalchemy import tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .filters import DEFAULT_SORT
+from .utils import ArgumentError
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+STREAM_BATCH_SIZE = 500
+
+# how the total of a list is computed, counted, estimated by the planner or not at all
+TOTAL_MODES = ('exact', 'estimated', 'none')
+
+
+class PaginationError(ArgumentError):
+    pass
+
+
+class Page(object):
+    """
+    One keyset page of a list query
+    """
+
+    def __init__(self, items, start, total, next_cursor, total_mode='exact'):
+        self.items = items
+        self.start = start
+        self.total = total
+        self.next = next_cursor
+        self.total_mode = total_mode
+        # tombstones and watermark of a delta sync, see sync.sync_page
+        self.deleted = None
+        self.watermark = None
+
+    @property
+    def count(self):
+        return len(self.items)
+
+
+def _parse_timestamp(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+
+
+def encode_cursor(sort, value, uuid, start, watermark=None):
+    '''the cursor of a delta sync also carries the watermark of its first page'''
+    raw = [sort.token, value.isoformat(), str(uuid), start]
+    if watermark is not None:
+        raw.append(watermark.isoformat())
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort=DEFAULT_SORT):
+    '''returns (value, uuid, start, watermark) of a cursor, the watermark is None outside delta syncs'''
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_token, value, uuid, start, *watermark = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        cursor = (_parse_timestamp(value), uuid_lib.UUID(uuid), int(start),
+                  _parse_timestamp(watermark[0]) if watermark else None)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise PaginationError('invalid cursor')
+    if sort_token != sort.token:
+        raise PaginationError('cursor belongs to a list sorted by {}'.format(sort_token))
+    return cursor
+
+
+def encode_offset_cursor(start):
+    raw = json.dumps(['offset', start], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_offset_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        kind, start = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        start = int(start)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise PaginationError('invalid cursor')
+    if kind != 'offset' or start < 1:
+        raise PaginationError('invalid cursor')
+    return start
+
+
+def parse_limit(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise PaginationError('limit must be between 1 and {}'.format(MAX_LIMIT))
+    return limit
+
+
+def parse_page_args(args, sort=DEFAULT_SORT):
+    """
+    Reads the limit and cursor query parameters of a list request, the
+    cursor must come from a page in the same sort order
+    """
+    limit = parse_limit(args)
+    cursor = args.get('cursor')
+    if cursor:
+        cursor = decode_cursor(cursor, sort)
+    return cursor, limit
+
+
+def parse_offset_page_args(args):
+    '''reads the limit and cursor query parameters of a list paginated by offset'''
+    limit = parse_limit(args)
+    cursor = args.get('cursor')
+    return decode_offset_cursor(cursor) if cursor else 1, limit
+
+
+def parse_total_mode(args):
+    """
+    Reads the totalMode query parameter, defaulting to the LIST_TOTAL_MODES
+    entry of the endpoint or else LIST_TOTAL_MODE
+    """
+    value = args.get('totalMode')
+    if not value:
+        config = current_app.config
+        return config.get('LIST_TOTAL_MODES', {}).get(request.endpoint, config.get('LIST_TOTAL_MODE', 'exact'))
+    if value not in TOTAL_MODES:
+        raise PaginationError('totalMode must be one of {}'.format(', '.join(TOTAL_MODES)))
+    return value
+
+
+class explain(Executable, ClauseElement):
+    '''EXPLAIN (FORMAT JSON) of a statement, which is planned but not run'''
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def plan_rows(plan):
+    '''returns the row estimate of the top node of an EXPLAIN (FORMAT JSON) plan'''
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(query):
+    """
+    Returns the planner's row estimate of query. For a whole table that is
+    pg_class.reltuples scaled to its current size, for filtered queries it
+    also depends on the column statistics, so it is off after bulk changes
+    until the table is analyzed again.
+    """
+    return plan_rows(query.session.execute(explain(query.order_by(None).statement)).scalar())
+
+
+def page_total(total_mode, start, items, next_cursor, count=None, estimate=None):
+    """
+    Returns the total of a page by total_mode, the count is only used if it
+    is exact and the estimate only if another page follows
+    """
+    if total_mode == 'none':
+        return None
+    if total_mode == 'exact':
+        return count
+    if next_cursor is None:
+        # the last page tells the exact total
+        return start - 1 + len(items)
+    return max(estimate, start + len(items))
+
+
+def _order_by(query, model, sort):
+    columns = sort.columns(model)
+    return query.order_by(*[column.desc() if sort.descending else column for column in columns])
+
+
+def page_query(query, model, cursor, limit, sort=DEFAULT_SORT):
+    """
+    Returns the query of the page following cursor, ordered by (sort key,
+    uuid) so that the lookup is served by the (sort key, id) index of the
+    table, and the start of the page. One extra row is fetched to find out
+    whether another page follows.
+    """
+    start = 1
+    if cursor:
+        value, uuid, start, _ = cursor
+        keys = tuple_(*sort.columns(model))
+        query = query.filter(keys < tuple_(value, uuid) if sort.descending else keys > tuple_(value, uuid))
+    return _order_by(query, model, sort).limit(limit + 1), start
+
+
+def keyset_page(rows, start, limit, sort=DEFAULT_SORT, watermark=None):
+    '''returns the items and the next cursor of the rows fetched by page_query'''
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort.attribute), last.uuid, start + len(items), watermark)
+    return items, next_cursor
+
+
+def paginate(query, model, cursor, limit, total=None, sort=DEFAULT_SORT, total_mode='exact', watermark=None):
+    """
+    Returns the page of query following cursor, see page_query. The total is
+    computed by total_mode, an exact one is counted unless the caller already
+    knows it. A watermark is passed on in the next cursor.
+    """
+    rows_query, start = page_query(query, model, cursor, limit, sort)
+    items, next_cursor = keyset_page(rows_query.all(), start, limit, sort, watermark)
+
+    if total_mode == 'exact' and total is None:
+        total = query.order_by(None).count()
+    estimate = estimate_count(query) if total_mode == 'estimated' and next_cursor else None
+    return Page(items, start, page_total(total_mode, start, items, next_cursor, total, estimate),
+                next_cursor, total_mode)
+
+
+def paginate_offset(query, start, limit, total=None, total_mode='exact'):
+    """
+    Returns the page of an already ordered query starting at the 1-based
+    start offset. For orders without a unique indexed key, e.g. relevance,
+    where keyset pagination doesn't apply.
+    """
+    rows = query.offset(start - 1).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = encode_offset_cursor(start + len(items)) if len(rows) > limit else None
+
+    if total_mode == 'exact' and total is None:
+        total = query.order_by(None).count()
+    estimate = estimate_count(query) if total_mode == 'estimated' and next_cursor else None
+    return Page(items, start, page_total(total_mode, start, items, next_cursor, total, estimate),
+                next_cursor, total_mode)
+
+
+def iter_all(query, model, batch_size=STREAM_BATCH_SIZE, sort=DEFAULT_SORT):
+    """
+    Iterates over every row of query in (sort key, uuid) order. Rows are
+    fetched through a server-side cursor batch_size rows at a time.
+    """
+    return _order_by(query, model, sort).yield_per(batch_size)
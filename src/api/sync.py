@@ -0,0 +1,144 @@
+# /src/api/sync.py
+
+import datetime
+from collections import namedtuple
+
+from flask import current_app, request
+
+from ..models import db
+from ..models.change import tombstone_schema
+from ..models.replicas import use_primary
+from .conditional import list_version, list_etag, page_etag, is_not_modified, not_modified_response
+from .fieldsets import parse_fields, parse_include, schema_for, query_options
+from .filters import FilterError, Sort, parse_datetime, parse_filters, parse_sort
+from .pagination import iter_all, paginate, parse_page_args, parse_total_mode
+from .utils import ArgumentError, dump, error_response, resource_response, stream_resource_response
+
+# delta syncs page through the changed rows by (updated_at, uuid), a row
+# updated meanwhile moves behind the cursor and shows up on a later page
+SYNC_SORT = Sort('updatedAt')
+
+
+def parse_updated_since(args):
+    """
+    Reads the updatedSince query parameter of a delta sync, a timestamp or the
+    watermark of the previous sync. sync_page checks that it isn't older than
+    the deletes are kept for.
+    """
+    value = args.get('updatedSince')
+    if not value:
+        return None
+    if args.get('sort', SYNC_SORT.token) != SYNC_SORT.token:
+        raise FilterError('lists with updatedSince are sorted by {}'.format(SYNC_SORT.token))
+    return parse_datetime(value)
+
+
+def _now():
+    '''returns the time of the database clock, which also stamps the recorded deletes'''
+    return db.session.query(db.func.timezone('utc', db.func.statement_timestamp())).scalar()
+
+
+def check_retention(since, now):
+    """
+    Raises a FilterError if since is older than the deletes are kept for at
+    now, the database time, the client syncs the whole list again then.
+    """
+    hours = current_app.config.get('CHANGES_RETENTION_HOURS', 24)
+    if since < now - datetime.timedelta(hours=hours):
+        raise FilterError('updatedSince is older than the {} hours deletes are kept, sync the whole list again'
+                          .format(hours))
+
+
+def watermark_at(now):
+    """
+    Returns the watermark of a delta sync starting at now, the database time
+    (changed_at of the deletes is the start of their transaction), set back
+    by SYNC_OVERLAP_SECONDS, at least the statement timeout, for writes
+    committing that much after their updated_at or changed_at. The rows of
+    the overlap arrive twice.
+    """
+    config = current_app.config
+    overlap = max(config.get('SYNC_OVERLAP_SECONDS', 5), config.get('DB_STATEMENT_TIMEOUT', 0) / 1000)
+    return now - datetime.timedelta(seconds=overlap)
+
+
+def sync_page(query, model, since, cursor, limit, total_mode='exact'):
+    """
+    Returns the page of a delta sync, the rows of query updated since then.
+    The first page also lists the tombstones of the rows deleted since then,
+    of the whole table as deleted rows no longer tell which lists they were
+    part of, so since must be within their retention (else a FilterError is
+    raised). Every page carries the watermark to pass as updatedSince next
+    time, taken before the first page was read and passed on in the cursor,
+    so deletes after the first page are reported by the next sync. Delta
+    syncs read from the primary, a replica may not have the writes before
+    the watermark yet.
+    """
+    with use_primary():
+        if cursor:
+            # cursors without one come from plain lists, since is always safe
+            watermark = cursor[3] or since
+        else:
+            now = _now()
+            check_retention(since, now)
+            watermark = watermark_at(now)
+        page = paginate(query.filter(model.updated_at >= since), model, cursor, limit, sort=SYNC_SORT,
+                        total_mode=total_mode, watermark=watermark)
+        page.deleted = [] if cursor else dump(tombstone_schema, model.tombstones(since))
+    page.watermark = watermark
+    return page
+
+
+ListArgs = namedtuple('ListArgs', 'only include since sort cursor limit total_mode filters')
+
+
+def parse_list_args(args, list_schema, filters):
+    """
+    Reads the query parameters of a list of list_schema: the fieldset, the
+    filters of the allowed ones, the sort and page, and updatedSince of a
+    delta sync. Raises an ArgumentError for invalid ones.
+    """
+    only = parse_fields(args, list_schema)
+    include = parse_include(args, list_schema)
+    since = parse_updated_since(args)
+    sort = SYNC_SORT if since else parse_sort(args)
+    cursor, limit = parse_page_args(args, sort)
+    total_mode = parse_total_mode(args)
+    return ListArgs(only, include, since, sort, cursor, limit, total_mode, parse_filters(args, filters))
+
+
+def list_response(query, model, list_schema, category, list_type, list_args, stream=True):
+    """
+    Returns the response of the list route reading query: every row streamed
+    with the stream parameter (if stream), a delta sync with updatedSince,
+    else a page, weakly tagged by the version of the list for exact totals
+    and by its content otherwise.
+    """
+    schema = schema_for(list_schema, list_args.only, list_args.include)
+    sort, since = list_args.sort, list_args.since
+    query = query.filter(*list_args.filters).options(
+        *query_options(model, list_args.only, list_args.include, sort.attribute, 'updated_at'))
+
+    if stream and request.args.get('stream') and since is None:
+        return stream_resource_response(iter_all(query, model, sort=sort), schema, category, 200, type=list_type)
+
+    if since is not None:
+        try:
+            page = sync_page(query, model, since, list_args.cursor, list_args.limit, list_args.total_mode)
+        except ArgumentError as e:
+            return error_response({'error': str(e)}, 400)
+        etag = None
+    elif list_args.total_mode == 'exact':
+        version = list_version(query, model)
+        etag = list_etag(version)
+        if is_not_modified(etag):
+            return not_modified_response(etag, weak=True)
+        page = paginate(query, model, list_args.cursor, list_args.limit, total=version[1], sort=sort)
+    else:
+        page = paginate(query, model, list_args.cursor, list_args.limit, sort=sort, total_mode=list_args.total_mode)
+        etag = page_etag(page)
+        if is_not_modified(etag):
+            return not_modified_response(etag, weak=True)
+
+    res_data = dump(schema, page.items)
+    return resource_response(res_data, category, 200, many=True, type=list_type, page=page, etag=etag, weak=True)
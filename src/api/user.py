@@ -1,74 +1,159 @@
 # /src/api/user.py
 
 from flask import request, Blueprint
+from sqlalchemy.exc import IntegrityError
+from ..models import db
 from ..models.user import UserModel, user_schema, user_list_schema
-from .utils import resource_response, empty_response, error_response
+from .utils import (ArgumentError, BULK_MAX_ITEMS, BULK_RESULT_TYPE, Resource, dump, load, resource_response,
+                    empty_response, error_response, constraint_error_response, bulk_results)
+from .pagination import parse_offset_page_args, parse_total_mode, paginate_offset
+from .filters import Filter, parse_filters, parse_search, parse_datetime, parse_uuid
+from .sync import parse_list_args, list_response
+from .fieldsets import parse_fields, parse_include, schema_for, query_options
+from .conditional import (resource_etag, current_resource_etag, is_not_modified, if_match_versions,
+                          unmatched_write_response, not_modified_response)
 
 user_api = Blueprint('users', __name__)
 
 API_CATEGORY = 'users'
 API_LIST_TYPE = 'UserListV1'
 
+# filterable query parameters, only indexed columns are accepted
+LIST_FILTERS = {
+    'organisationUuid': Filter(UserModel.organisation_uuid, parse_uuid),
+    'emailAddress': Filter(UserModel.email_address),
+    'updatedAfter': Filter(UserModel.updated_at, parse_datetime, 'gt'),
+}
+
+RESOURCE = Resource(UserModel, user_schema, user_list_schema, LIST_FILTERS, API_CATEGORY, API_LIST_TYPE,
+                    'user not found', lambda args: UserModel.query)
+
 @user_api.route('/', methods=['GET'])
 def find_all():
-    models = UserModel.find_all()
+    try:
+        list_args = parse_list_args(request.args, user_list_schema, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
 
-    res_data = user_list_schema.dump(models, many=True).data
-    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE)
+    return list_response(UserModel.query, UserModel, user_list_schema, API_CATEGORY, API_LIST_TYPE, list_args)
 
 
 @user_api.route('/', methods=['POST'])
 def create():
     req_data = request.get_json()
-    data, error = user_schema.load(req_data)
+    data, error = load(user_schema, req_data)
 
     if error:
         return error_response(error, 400)
 
-    user_in_db = UserModel.get_by_email_address(data.get('email_address'))
-    if user_in_db:
+    try:
+        model = UserModel.create(data)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'User already exist, please supply another email address')
+    if not model:
         return error_response({'error': 'User already exist, please supply another email address'}, 400)
 
-    model = UserModel(data)
-    model.save()
-
-    res_data = user_schema.dump(model).data
+    res_data = dump(user_schema, model)
     return resource_response(res_data, API_CATEGORY, 201)
 
 
+@user_api.route('/bulk', methods=['POST'])
+def create_bulk():
+    req_data = request.get_json()
+    if not isinstance(req_data, list):
+        return error_response({'error': 'expected a list of users'}, 400)
+    if len(req_data) > BULK_MAX_ITEMS:
+        return error_response({'error': 'at most {} users per request'.format(BULK_MAX_ITEMS)}, 400)
+
+    data, errors = load(user_schema, req_data, many=True)
+    indices = [index for index in range(len(req_data)) if index not in errors]
+    errors.update(UserModel.reference_errors({index: data[index] for index in indices}))
+    indices = [index for index in indices if index not in errors]
+
+    try:
+        uuids = UserModel.insert_many([data[index] for index in indices])
+    except IntegrityError:
+        # a referenced organisation was deleted since it was looked up
+        db.session.rollback()
+        return error_response({'error': 'bulk insert conflicted with a concurrent change, please retry'}, 409)
+
+    res_data = bulk_results(len(req_data), errors, indices, uuids)
+    return resource_response(res_data, API_CATEGORY, 200, many=True, type=BULK_RESULT_TYPE)
+
+
+@user_api.route('/search', methods=['GET'])
+def search():
+    try:
+        only = parse_fields(request.args, user_list_schema)
+        include = parse_include(request.args, user_list_schema)
+        text = parse_search(request.args)
+        start, limit = parse_offset_page_args(request.args)
+        total_mode = parse_total_mode(request.args)
+        filters = parse_filters(request.args, LIST_FILTERS)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    schema = schema_for(user_list_schema, only, include)
+    query = UserModel.search(text).filter(*filters).options(*query_options(UserModel, only, include))
+
+    page = paginate_offset(query, start, limit, total_mode=total_mode)
+
+    res_data = dump(schema, page.items)
+    return resource_response(res_data, API_CATEGORY, 200, many=True, type=API_LIST_TYPE, page=page)
+
+
 @user_api.route('/<string:uuid>', methods=['GET'])
 def get_by_uuid(uuid):
-    model = UserModel.get_by_uuid(uuid)
+    try:
+        only = parse_fields(request.args, user_schema)
+        include = parse_include(request.args, user_schema)
+    except ArgumentError as e:
+        return error_response({'error': str(e)}, 400)
+
+    if request.if_none_match:
+        etag = current_resource_etag(UserModel, uuid)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+    model = UserModel.get_by_uuid(uuid, *query_options(UserModel, only, include, 'updated_at'),
+                                  cached=not include)
     if not model:
         return error_response({'error': 'user not found'}, 404)
 
-    res_data = user_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(schema_for(user_schema, only, include), model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @user_api.route('/<string:uuid>', methods=['PUT'])
 def update(uuid):
     req_data = request.get_json()
-    data, error = user_schema.load(req_data, partial=True)
+    data, error = load(user_schema, req_data, partial=True)
     if error:
         return error_response(error, 400)
 
-    model = UserModel.get_by_uuid(uuid)
+    versions = if_match_versions(uuid)
+    try:
+        model = UserModel.update_by_uuid(uuid, data, versions)
+    except IntegrityError as e:
+        db.session.rollback()
+        return constraint_error_response(e, 'User already exist, please supply another email address')
     if not model:
-        return error_response({'error': 'user not found'}, 404)
-
-    model.update(data)
+        return unmatched_write_response(UserModel, uuid, versions, 'user not found')
 
-    res_data = user_schema.dump(model).data
-    return resource_response(res_data, API_CATEGORY, 200)
+    res_data = dump(user_schema, model)
+    return resource_response(res_data, API_CATEGORY, 200, etag=resource_etag(model.uuid, model.updated_at))
 
 
 @user_api.route('/<string:uuid>', methods=['DELETE'])
 def delete(uuid):
-    model = UserModel.get_by_uuid(uuid)
-    if not model:
-        return error_response({'error': 'user not found'}, 404)
-
-    model.delete()
+    versions = if_match_versions(uuid)
+    try:
+        deleted = UserModel.delete_by_uuid(uuid, versions)
+    except IntegrityError:
+        db.session.rollback()
+        return error_response({'error': 'user still has a credential'}, 400)
+    if not deleted:
+        return unmatched_write_response(UserModel, uuid, versions, 'user not found')
 
     return empty_response(204)
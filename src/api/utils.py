@@ -1,32 +1,115 @@
 # /src/api/utils.py
 
-from flask import json, Response
+from collections import namedtuple
+
+from flask import Response, stream_with_context
+
+from ..encoding import codec
+from ..instrumentation import timed
+from ..models import schema_compiler
+
+STREAM_CHUNK_SIZE = 100
+BULK_MAX_ITEMS = 1000
+BULK_RESULT_TYPE = 'BulkResultListV1'
+# SQLSTATE of a write referencing a row that doesn't exist
+FOREIGN_KEY_VIOLATION = '23503'
+
+# a resource of the API, read by its list and get routes in both the Flask and
+# the ASGI app. base_query returns the query listing it for the request args
+Resource = namedtuple('Resource', 'model schema list_schema filters category list_type not_found base_query')
+
+def encode(obj):
+    with timed('encode'):
+        return codec.dumps(obj)
+
+class ArgumentError(ValueError):
+    '''raised for invalid query parameters, answered with 400'''
+    pass
+
+def dump(schema, obj, many=None):
+    '''returns the data of obj dumped with schema, timing the dump stage'''
+    with timed('dump'):
+        return schema_compiler.dump(schema, obj, many=many).data
+
+def load(schema, data, many=None, partial=None):
+    '''returns (data, errors) of data loaded with schema'''
+    return schema_compiler.load(schema, data, many=many, partial=partial)
 
 def resource_response(res, category, status_code, *args, **kwargs):
     if kwargs.get('many', False):
+        page = kwargs.get('page')
         resource_list = {
             'category': category,
             'type': kwargs.get('type', 'UnknownList'),
             'count': len(res),
-            'total': len(res),
-            'start': 1,
+            'total': page.total if page else len(res),
+            'totalMode': page.total_mode if page else 'exact',
+            'start': page.start if page else 1,
+            'next': page.next if page else None,
             'members': res
         }
-        return Response(
+        if page is not None and page.watermark is not None:
+            resource_list['deleted'] = page.deleted
+            resource_list['watermark'] = page.watermark
+        response = Response(
             mimetype='application/json',
-            response=json.dumps(resource_list),
+            response=encode(resource_list),
             status=status_code
         )
     else:
-        meta = {
-            'category': category
-        }
-        return Response(
+        # res is the freshly dumped resource, the category is added in place
+        res.setdefault('category', category)
+        response = Response(
             mimetype='application/json',
-            response=json.dumps({**meta, **res}),
+            response=encode(res),
             status=status_code
         )
 
+    if kwargs.get('etag'):
+        response.set_etag(kwargs['etag'], weak=kwargs.get('weak', False))
+    return response
+
+def stream_resource_response(models, schema, category, status_code, *args, **kwargs):
+    """
+    Streams a resource list as chunked JSON, dumping the models one at a time
+    so memory stays flat no matter how many rows the iterable yields.
+    """
+    def generate():
+        yield b''.join([b'{"category":', codec.dumps(category), b',"type":',
+                        codec.dumps(kwargs.get('type', 'UnknownList')), b',"start":1,"members":['])
+
+        count = 0
+        chunk = []
+        for model in models:
+            chunk.append(codec.dumps(schema_compiler.dump(schema, model, many=False).data))
+            count += 1
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield (b'' if count == len(chunk) else b',') + b','.join(chunk)
+                chunk = []
+        if chunk:
+            yield (b'' if count == len(chunk) else b',') + b','.join(chunk)
+
+        yield '],"count":{0},"total":{0},"totalMode":"exact"}}'.format(count).encode('ascii')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/json',
+        status=status_code
+    )
+
+def bulk_results(size, errors, indices, uuids):
+    """
+    Returns the per item status of a bulk create: invalid items with their
+    validation errors, created items with their uuid and conflicting items.
+    """
+    results = [{'index': index, 'status': 'invalid', 'errors': error} for index, error in errors.items()]
+    for index, uuid in zip(indices, uuids):
+        if uuid:
+            results.append({'index': index, 'status': 'created', 'uuid': str(uuid)})
+        else:
+            results.append({'index': index, 'status': 'conflict'})
+    return sorted(results, key=lambda result: result['index'])
+
 def empty_response(status_code):
     return Response(
         mimetype='application/json',
@@ -36,6 +119,21 @@ def empty_response(status_code):
 def error_response(error, status_code):
     return Response(
         mimetype='application/json',
-        response=json.dumps(error),
+        response=codec.dumps(error),
         status=status_code
     )
+
+def constraint_error_response(error, conflict):
+    """
+    Returns the 400 of a create or update that violated a constraint,
+    conflict is the error of a unique one, the same create reports when ON
+    CONFLICT skips the row.
+    """
+    if getattr(error.orig, 'pgcode', None) == FOREIGN_KEY_VIOLATION:
+        return error_response({'error': 'a referenced resource does not exist'}, 400)
+    return error_response({'error': conflict}, 400)
+
+def unavailable_response(error, retry_after=1):
+    response = error_response(error, 503)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
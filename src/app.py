@@ -1,15 +1,24 @@
 # src/app.py
 
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 
 from .config import app_config
-from .models import db, bcrypt
-
-from .api.organisation import organisation_api as organisation_blueprint
-from .api.user import user_api as user_blueprint
-from .api.credential import credential_api as credential_blueprint
-from .api.account import account_api as account_blueprint
+from .models import db, bcrypt, hash_pool, entity_cache, schema_compiler, replicas, pool, change_feed
+from .metrics import registry
+from . import instrumentation
+from .encoding import codec
+from .compression import compression
+from .blueprints import lazy_blueprints
+
+# url prefix, module and attribute of the API blueprints
+BLUEPRINTS = (
+    ('/api/v1/organisations', '.api.organisation', 'organisation_api'),
+    ('/api/v1/users', '.api.user', 'user_api'),
+    ('/api/v1/credentials', '.api.credential', 'credential_api'),
+    ('/api/v1/accounts', '.api.account', 'account_api'),
+    ('/api/v1/changes', '.api.change', 'change_api'),
+)
 
 def create_app(env_name):
     # app initiliazation
@@ -19,15 +28,27 @@ def create_app(env_name):
     app.config.from_object(app_config[env_name])
 
     bcrypt.init_app(app)
+    hash_pool.init_app(app)
+    entity_cache.init_app(app)
+    schema_compiler.init_app(app)
+    instrumentation.init_app(app)
+    # after the instrumentation, so that compressing runs before its hook and is timed
+    compression.init_app(app)
+    codec.init_app(app)
+    pool.init_app(app)
+    replicas.init_app(app)
     db.init_app(app)
+    change_feed.init_app(app)
 
     # REST-APIs don't require strict trailing slashed, e.g. /users/
     app.url_map.strict_slashes = False
 
-    app.register_blueprint(organisation_blueprint, url_prefix='/api/v1/organisations')
-    app.register_blueprint(user_blueprint, url_prefix='/api/v1/users')
-    app.register_blueprint(credential_blueprint, url_prefix='/api/v1/credentials')
-    app.register_blueprint(account_blueprint, url_prefix='/api/v1/accounts')
+    # imported on the first request to their prefix with LAZY_BLUEPRINTS
+    lazy_blueprints.init_app(app, BLUEPRINTS, __package__)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
     @app.route('/', methods=['GET'])
     def index():
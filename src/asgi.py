@@ -0,0 +1,668 @@
+# /src/asgi.py
+
+import asyncio
+import io
+import json
+import logging
+import re
+import sys
+import time
+import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
+
+import werkzeug.local
+from flask import _app_ctx_stack, _request_ctx_stack, g, request
+from sqlalchemy import inspect, select
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql.base import PGCompiler, PGDialect
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .app import create_app
+from .api import account, credential, organisation, user
+from .api.change import (KEEPALIVE, StreamPosition, catch_up_events, event_stream_response, live_event,
+                         parse_categories, parse_last_event_id, retry_event)
+from .api.conditional import (resource_etag, list_version_query, list_etag, page_etag, is_not_modified,
+                              not_modified_response)
+from .api.fieldsets import parse_fields, parse_include, schema_for, query_options
+from .api.pagination import Page, explain, keyset_page, page_query, page_total, plan_rows
+from .api.sync import parse_list_args
+from .api.utils import ArgumentError, dump, error_response, resource_response
+from .models.change import ChangeModel
+from .models.feed import CHANNEL, feeds, feed_changes, feed_overflows, feed_reconnects
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# the GET routes served on the event loop, keyed by blueprint name, which is their category
+RESOURCES = {module.RESOURCE.category: module.RESOURCE for module in (organisation, user, credential, account)}
+
+
+class _AsyncpgCompiler(PGCompiler):
+    # asyncpg takes $1, $2, ... placeholders
+    def bindparam_string(self, name, **kw):
+        super(_AsyncpgCompiler, self).bindparam_string(name, **kw)
+        return '$[_POSITION]'
+
+
+class _AsyncpgDialect(PGDialect):
+    statement_compiler = _AsyncpgCompiler
+
+
+_dialect = _AsyncpgDialect(paramstyle='numeric')
+
+
+def compile_statement(statement):
+    '''returns the SQL and the positional arguments of a statement for asyncpg'''
+    compiled = statement.compile(dialect=_dialect)
+    params = compiled.construct_params()
+    processors = compiled._bind_processors
+    args = []
+    for name in compiled.positiontup:
+        value = params[name]
+        args.append(processors[name](value) if name in processors else value)
+    return compiled.string, args
+
+
+def _column_value(column, value):
+    # as psycopg2 and the column types return them
+    if value is not None and isinstance(column.type, UUID):
+        return uuid_lib.UUID(str(value)) if column.type.as_uuid else str(value)
+    return value
+
+
+def instance_from(model, record):
+    '''returns a detached instance of model with the column values of record loaded'''
+    mapper = inspect(model)
+    table = model.__table__
+    instance = mapper.class_manager.new_instance()
+    for name, value in record.items():
+        column = table.c[name]
+        set_committed_value(instance, mapper.get_property_by_column(column).key, _column_value(column, value))
+    return instance
+
+
+def _libpq_url(url):
+    # asyncpg takes libpq URLs without the SQLAlchemy driver name
+    return re.sub(r'^postgres(ql)?\+\w+://', 'postgresql://', url)
+
+
+class AsyncDatabase(object):
+    """
+    asyncpg connection pool of the ASGI app, created on startup. The
+    statement timeout applies like in the WSGI app, with DB_PGBOUNCER the
+    prepared statement cache is disabled as PgBouncer in transaction mode
+    can't keep them.
+    """
+
+    def __init__(self, config):
+        if asyncpg is None:
+            raise RuntimeError('the ASGI app requires the asyncpg package')
+        self.dsn = _libpq_url(config['ASYNC_DATABASE_URL'])
+        self.min_size = config['ASYNC_POOL_MIN_SIZE']
+        self.max_size = config['ASYNC_POOL_MAX_SIZE']
+        self.timeout = config['DB_POOL_TIMEOUT']
+        self.server_settings = {}
+        if config['DB_STATEMENT_TIMEOUT'] and not config['DB_PGBOUNCER']:
+            self.server_settings['statement_timeout'] = str(config['DB_STATEMENT_TIMEOUT'])
+        self.statement_cache_size = 0 if config['DB_PGBOUNCER'] else 100
+        self.pool = None
+        self._lock = None
+
+    async def open(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size,
+                    statement_cache_size=self.statement_cache_size, server_settings=self.server_settings)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def fetch(self, statement, timings=None):
+        '''runs a SQLAlchemy statement, adding its time to the db stage of the request timings'''
+        if self.pool is None:
+            await self.open()
+        sql, args = compile_statement(statement)
+        start = time.perf_counter()
+        async with self.pool.acquire(timeout=self.timeout) as connection:
+            records = await connection.fetch(sql, *args)
+        if timings is not None:
+            timings['db'] = timings.get('db', 0.0) + time.perf_counter() - start
+            timings['queries'] = timings.get('queries', 0) + 1
+        return records
+
+
+class AsyncSubscription(object):
+    '''models.feed.Subscription of a stream served on the event loop'''
+
+    def __init__(self, categories, size):
+        self.categories = frozenset(categories)
+        self.queue = asyncio.Queue(maxsize=size)
+        self.missed = False
+
+    def put(self, change):
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            feed_overflows.inc()
+            self.missed = True
+
+    def miss(self):
+        self.missed = True
+        # wakes the stream, the change itself is read from the table
+        self.put(None)
+
+    async def get(self, timeout):
+        '''returns the next change, None if there was none within timeout seconds'''
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def resync(self):
+        missed, self.missed = self.missed, False
+        return missed
+
+
+class AsyncChangeFeed(object):
+    """
+    The change feed of the ASGI app, like models.feed.ChangeFeed, but
+    LISTENing on an asyncpg connection and fanning out on the event loop,
+    so an open stream holds no thread. The connection is opened on the
+    first subscription and checked every CHANGES_RECONNECT_SECONDS, once
+    it is (re)opened the subscriptions read what they missed from the
+    changes table.
+    """
+
+    def __init__(self, config):
+        self.dsn = _libpq_url(config['CHANGES_LISTEN_URL'])
+        self.queue_size = config['CHANGES_QUEUE_SIZE']
+        self.reconnect_seconds = config['CHANGES_RECONNECT_SECONDS']
+        self.subscriptions = set()
+        self._task = None
+        feeds.append(self)
+
+    def subscribe(self, categories):
+        subscription = AsyncSubscription(categories, self.queue_size)
+        self.subscriptions.add(subscription)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _listen(self):
+        connected = False
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(CHANNEL, self._receive)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.exception('opening the change feed connection failed')
+                await asyncio.sleep(self.reconnect_seconds)
+                continue
+            if connected:
+                feed_reconnects.inc()
+            self._miss_all()
+            connected = True
+            try:
+                while True:
+                    await asyncio.sleep(self.reconnect_seconds)
+                    await connection.fetchval('SELECT 1', timeout=self.reconnect_seconds)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.exception('the change feed connection was lost')
+            finally:
+                connection.terminate()
+
+    def _receive(self, connection, pid, channel, payload):
+        change = ChangeModel.from_notification(json.loads(payload))
+        feed_changes.inc(category=change.category)
+        for subscription in list(self.subscriptions):
+            if change.category in subscription.categories:
+                subscription.put(change)
+
+    def _miss_all(self):
+        for subscription in list(self.subscriptions):
+            subscription.miss()
+
+
+def _current_task():
+    try:
+        return asyncio.current_task() if hasattr(asyncio, 'current_task') else asyncio.Task.current_task()
+    except RuntimeError:
+        # no event loop in this thread
+        return None
+
+
+def _per_task(stack):
+    """
+    Makes a Flask context stack local to the asyncio task rather than the
+    thread, so a request on the event loop pushes its contexts once and keeps
+    them across awaits while others run on the same thread. Threads without
+    a task, the executor's, keep theirs per thread. werkzeug from 2.0 keeps
+    context locals in context variables, which already are per task.
+    """
+    thread_ident = stack.__ident_func__
+
+    def ident():
+        task = _current_task()
+        return task if task is not None else thread_ident()
+
+    stack.__ident_func__ = ident
+
+
+if not hasattr(werkzeug.local, 'ContextVar'):
+    _per_task(_app_ctx_stack)
+    _per_task(_request_ctx_stack)
+
+
+def _environ(scope, body):
+    '''returns the WSGI environ of an ASGI http scope'''
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class AsgiApp(object):
+    """
+    Serves the app on asyncio. The GET routes listing and reading
+    organisations, users, credentials and accounts run on the event loop
+    with asyncpg, so requests waiting on Postgres or on slow clients don't
+    hold a thread. Their responses are built by the same parsing, schemas,
+    envelope and request hooks as the Flask app's. The change streams run
+    there too, as each would hold a thread for as long as it is open. Every
+    other request, streamed lists included, is handed to the Flask app on
+    one of ASGI_WSGI_THREADS threads.
+    """
+
+    def __init__(self, app):
+        app.config.setdefault('ASYNC_DATABASE_URL', app.config['SQLALCHEMY_DATABASE_URI'])
+        app.config.setdefault('ASYNC_POOL_MIN_SIZE', 2)
+        app.config.setdefault('ASYNC_POOL_MAX_SIZE', 10)
+        app.config.setdefault('ASGI_WSGI_THREADS', 8)
+        self.app = app
+        self.database = AsyncDatabase(app.config)
+        self.changes = AsyncChangeFeed(app.config)
+        self.executor = ThreadPoolExecutor(max_workers=app.config['ASGI_WSGI_THREADS'])
+        self.handlers = {'find_all': self._find_all, 'get_by_uuid': self._get_by_uuid}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError('unsupported ASGI scope type: {}'.format(scope['type']))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.database.open()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.changes.close()
+                await self.database.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        native = None
+        if scope['method'] in ('GET', 'HEAD'):
+            environ = _environ(scope, b'')
+            native = self._native_handler(environ)
+        if native is None:
+            environ = _environ(scope, await _read_body(receive))
+            await self._wsgi(environ, send)
+            return
+
+        handler, resource, values = native
+        # pushed once for the whole request like in Flask's wsgi_app, so the
+        # teardown hooks run once, when the response is built
+        context = self.app.request_context(environ)
+        context.push()
+        error = None
+        try:
+            response = await handler(resource, **values)
+        except Exception as e:
+            error = e
+            response = self.app.handle_exception(e)
+        finally:
+            context.pop(error)
+        await self._send(response, scope['method'] == 'HEAD', send, receive)
+
+    def _native_handler(self, environ):
+        lazy_blueprints = self.app.extensions.get('lazy_blueprints')
+        if lazy_blueprints is not None:
+            lazy_blueprints.load_path(environ['PATH_INFO'])
+        try:
+            endpoint, values = self.app.create_url_adapter(self.app.request_class(environ)).match()
+        except Exception:
+            return None
+        if endpoint == 'changes.stream':
+            return self._changes, None, values
+        blueprint, _, name = endpoint.partition('.')
+        if blueprint not in RESOURCES or name not in self.handlers:
+            return None
+        # streamed lists and delta syncs stay with the Flask app
+        if name == 'find_all' and re.search(r'(^|&)(stream|updatedSince)=', environ['QUERY_STRING']):
+            return None
+        if name == 'get_by_uuid':
+            try:
+                uuid_lib.UUID(values['uuid'])
+            except ValueError:
+                return None
+        return self.handlers[name], RESOURCES[blueprint], values
+
+    async def _send(self, response, head, send, receive):
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers]
+        if hasattr(response.response, '__aiter__'):
+            await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+            await _send_stream(response.response, head, send, receive)
+            return
+        body = b'' if head else response.get_data()
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _changes(self, resource):
+        '''api.change.stream on the event loop'''
+        response = self.app.preprocess_request()
+        if response is not None:
+            return self.app.process_response(self.app.make_response(response))
+        try:
+            categories = parse_categories(request.args)
+            last_id = parse_last_event_id(request)
+        except ArgumentError as e:
+            return self.app.process_response(error_response({'error': str(e)}, 400))
+
+        # subscribed first, so nothing committed meanwhile is lost
+        subscription = self.changes.subscribe(categories)
+        try:
+            if last_id is None:
+                statement = ChangeModel.horizon_query().statement
+                position, events = StreamPosition((await self.database.fetch(statement))[0][0]), []
+            else:
+                position = StreamPosition(last_id)
+                events = await self._catch_up(categories, position)
+        except Exception:
+            self.changes.unsubscribe(subscription)
+            raise
+
+        response = event_stream_response(self._change_events(subscription, categories, events, position))
+        return self.app.process_response(response)
+
+    async def _catch_up(self, categories, position):
+        '''api.change._catch_up with asyncpg, in an app context'''
+        limit = self.app.config.get('CHANGES_BACKLOG_LIMIT', 1000)
+        horizon_statement = ChangeModel.horizon_query().statement
+        oldest_statement = ChangeModel.oldest_txid_query().statement
+        changes_statement = ChangeModel.committed_since_query(position.horizon, categories, limit + 1).statement
+        horizon = (await self.database.fetch(horizon_statement))[0][0]
+        retained = ChangeModel.retained(position.horizon, (await self.database.fetch(oldest_statement))[0][0])
+        changes = [instance_from(ChangeModel, record) for record in await self.database.fetch(changes_statement)] \
+            if retained else []
+        return catch_up_events(position, horizon, retained, changes, limit)
+
+    async def _change_events(self, subscription, categories, events, position):
+        '''api.change._stream on the event loop, in an app context of its own as the request's has ended'''
+        config = self.app.config
+        context = self.app.app_context()
+        context.push()
+        try:
+            yield retry_event(config)
+            for event in events:
+                yield event
+
+            while True:
+                change = await subscription.get(config.get('CHANGES_KEEPALIVE_SECONDS', 15))
+                if subscription.resync():
+                    for event in await self._catch_up(categories, position):
+                        yield event
+                elif change is None:
+                    yield KEEPALIVE
+                else:
+                    event = live_event(position, change)
+                    if event is not None:
+                        yield event
+        finally:
+            self.changes.unsubscribe(subscription)
+            context.pop()
+
+    async def _find_all(self, resource):
+        model = resource.model
+        response = self.app.preprocess_request()
+        if response is not None:
+            return self.app.process_response(self.app.make_response(response))
+        timings = g.get('timings')
+        try:
+            # without updatedSince, delta syncs are served by the Flask app
+            only, include, _, sort, cursor, limit, total_mode, filters = parse_list_args(
+                request.args, resource.list_schema, resource.filters)
+        except ArgumentError as e:
+            return self.app.process_response(error_response({'error': str(e)}, 400))
+
+        schema = schema_for(resource.list_schema, only, include)
+        # included relationships are fetched separately, only their foreign keys are needed
+        query = resource.base_query(request.args).filter(*filters).options(
+            *query_options(model, only, (), sort.attribute, 'updated_at', *include))
+        rows_query, start = page_query(query, model, cursor, limit, sort)
+
+        etag = total = None
+        if total_mode == 'exact':
+            version = tuple((await self.database.fetch(list_version_query(query, model).statement, timings))[0])
+            etag = list_etag(version)
+            if is_not_modified(etag):
+                return self.app.process_response(not_modified_response(etag, weak=True))
+            total = version[1]
+
+        rows = [instance_from(model, record) for record in await self.database.fetch(rows_query.statement, timings)]
+        items, next_cursor = keyset_page(rows, start, limit, sort)
+        estimate = None
+        if total_mode == 'estimated' and next_cursor:
+            plan = (await self.database.fetch(explain(query.order_by(None).statement), timings))[0][0]
+            estimate = plan_rows(self.app.json_decoder().decode(plan) if isinstance(plan, str) else plan)
+        page = Page(items, start, page_total(total_mode, start, items, next_cursor, total, estimate),
+                    next_cursor, total_mode)
+        await self._load_included(model, items, include, timings)
+
+        if etag is None:
+            etag = page_etag(page)
+            if is_not_modified(etag):
+                return self.app.process_response(not_modified_response(etag, weak=True))
+        res_data = dump(schema, page.items)
+        response = resource_response(res_data, resource.category, 200, many=True, type=resource.list_type,
+                                     page=page, etag=etag, weak=True)
+        return self.app.process_response(response)
+
+    async def _get_by_uuid(self, resource, uuid):
+        model = resource.model
+        table = model.__table__
+        response = self.app.preprocess_request()
+        if response is not None:
+            return self.app.process_response(self.app.make_response(response))
+        timings = g.get('timings')
+        try:
+            only = parse_fields(request.args, resource.schema)
+            include = parse_include(request.args, resource.schema)
+        except ArgumentError as e:
+            return self.app.process_response(error_response({'error': str(e)}, 400))
+
+        if request.if_none_match:
+            records = await self.database.fetch(select([table.c.id, table.c.updated_at]).where(table.c.id == uuid),
+                                                timings)
+            etag = resource_etag(records[0]['id'], records[0]['updated_at']) if records else None
+            if is_not_modified(etag):
+                return self.app.process_response(not_modified_response(etag))
+
+        query = model.query.options(*query_options(model, only, (), 'updated_at', *include)) \
+            .filter(model.uuid == uuid)
+        records = await self.database.fetch(query.statement, timings)
+        if not records:
+            return self.app.process_response(error_response({'error': resource.not_found}, 404))
+        instance = instance_from(model, records[0])
+        await self._load_included(model, [instance], include, timings)
+
+        res_data = dump(schema_for(resource.schema, only, include), instance)
+        response = resource_response(res_data, resource.category, 200,
+                                     etag=resource_etag(instance.uuid, instance.updated_at))
+        return self.app.process_response(response)
+
+    async def _load_included(self, model, instances, include, timings):
+        '''sets the included scalar relationships of instances, one query per relationship'''
+        mapper = inspect(model)
+        for name in include:
+            relationship = mapper.relationships[name]
+            (local, remote), = relationship.local_remote_pairs
+            key = mapper.get_property_by_column(local).key
+            values = {str(getattr(instance, key)) for instance in instances if getattr(instance, key) is not None}
+            related = {}
+            if values:
+                target = relationship.mapper.class_
+                statement = select([target.__table__]).where(remote.in_(sorted(values)))
+                for record in await self.database.fetch(statement, timings):
+                    related[str(record[remote.name])] = instance_from(target, record)
+            for instance in instances:
+                value = getattr(instance, key)
+                set_committed_value(instance, name, related.get(str(value)) if value is not None else None)
+
+    async def _wsgi(self, environ, send):
+        """
+        Runs the Flask app on a thread of the executor. Its response is
+        iterated on that same thread, as streamed responses keep the request
+        context pushed there, and the chunks are passed to the event loop
+        through a bounded queue. If the client goes away the iteration stops
+        at the next chunk.
+        """
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=8)
+        gone = []
+
+        def put(message):
+            if gone:
+                raise _ClientGone()
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        future = loop.run_in_executor(self.executor, _run_wsgi, self.app, environ, put)
+        head = environ['REQUEST_METHOD'] == 'HEAD'
+        try:
+            while True:
+                kind, first, second = await queue.get()
+                if kind == 'start':
+                    await send({'type': 'http.response.start', 'status': first, 'headers': second})
+                elif kind == 'body' and not head:
+                    await send({'type': 'http.response.body', 'body': first, 'more_body': True})
+                elif kind == 'end':
+                    break
+        except Exception:
+            gone.append(True)
+            await _drain(queue, future)
+            raise
+        await future
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+class _ClientGone(Exception):
+    pass
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_stream(chunks, head, send, receive):
+    '''sends the chunks of an asynchronous iterator until it ends or the client goes away'''
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        if not head:
+            async for chunk in chunks:
+                if disconnected.done():
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        await chunks.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _drain(queue, future):
+    '''empties queue until the thread putting into it is done'''
+    while not future.done():
+        if not queue.empty():
+            queue.get_nowait()
+        await asyncio.sleep(0)
+
+
+def _run_wsgi(app, environ, put):
+    '''calls the WSGI app and puts its status, headers and body chunks, then the end'''
+    def start_response(status, headers, exc_info=None):
+        put(('start', int(status.split(' ', 1)[0]),
+             [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]))
+    try:
+        iterable = app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if chunk:
+                    put(('body', chunk, None))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    except _ClientGone:
+        pass
+    finally:
+        try:
+            put(('end', None, None))
+        except _ClientGone:
+            pass
+
+
+def create_asgi_app(env_name):
+    return AsgiApp(create_app(env_name))
@@ -0,0 +1,130 @@
+# /src/blueprints.py
+
+import copy
+import importlib
+import threading
+import time
+
+import werkzeug
+from werkzeug.routing import Map
+
+# the private attributes of werkzeug's Map _snapshot copies, as of werkzeug
+# 0.15 to 1.0 (the Pipfile pins it below 2.0)
+MAP_ATTRIBUTES = ('_rules', '_rules_by_endpoint', '_remap', '_remap_lock', 'lock_class')
+
+
+def check_map(map_class):
+    '''raises an ImportError if map_class lacks an attribute _snapshot copies, rather than misrouting requests'''
+    url_map = map_class()
+    missing = [name for name in MAP_ATTRIBUTES if not hasattr(url_map, name)]
+    if missing:
+        raise ImportError('werkzeug {} is not supported, its Map has no {}'
+                          .format(werkzeug.__version__, ', '.join(missing)))
+
+
+check_map(Map)
+
+
+def _snapshot(url_map):
+    """
+    Returns a copy of url_map sharing its rules, with its own rule lists so
+    that rules added to url_map later leave it untouched. It is sorted before
+    it is returned, so matching never modifies it.
+    """
+    snapshot = copy.copy(url_map)
+    snapshot._rules = list(url_map._rules)
+    snapshot._rules_by_endpoint = {endpoint: list(rules) for endpoint, rules in url_map._rules_by_endpoint.items()}
+    snapshot._remap = True
+    snapshot._remap_lock = url_map.lock_class()
+    snapshot.update()
+    return snapshot
+
+
+class LazyBlueprints(object):
+    """
+    Registers the API blueprints, given as (url prefix, module, attribute).
+    With LAZY_BLUEPRINTS a blueprint's module is only imported, and the
+    blueprint registered, when the first request below its prefix arrives,
+    which shortens the start of a process serving few of them. Flask refuses
+    to add routes after the first request in debug mode, so there they are
+    always registered right away. Werkzeug's Map isn't safe to add rules to
+    while other threads match against it, so in lazy mode requests match
+    against a copy of app.url_map, replaced by a new one after each load.
+    """
+
+    def __init__(self, app=None, blueprints=(), package=None):
+        self.load_times = {}
+        self.url_map = None
+        if app is not None:
+            self.init_app(app, blueprints, package)
+
+    def init_app(self, app, blueprints, package=None):
+        app.config.setdefault('LAZY_BLUEPRINTS', False)
+
+        self.app = app
+        self.package = package
+        self.pending = {prefix: (module, attribute) for prefix, module, attribute in blueprints}
+        self._lock = threading.Lock()
+        app.extensions['lazy_blueprints'] = self
+
+        if app.config['LAZY_BLUEPRINTS'] and not app.debug:
+            self._wsgi_app = app.wsgi_app
+            app.wsgi_app = self._dispatch
+            app.create_url_adapter = self._create_url_adapter
+        else:
+            self.load_all()
+
+    def _load(self, prefix):
+        with self._lock:
+            # another thread may have loaded it meanwhile
+            if prefix not in self.pending:
+                return
+            self._published()
+            start = time.perf_counter()
+            module, attribute = self.pending[prefix]
+            blueprint = getattr(importlib.import_module(module, self.package), attribute)
+            self.app.register_blueprint(blueprint, url_prefix=prefix)
+            del self.pending[prefix]
+            self.url_map = _snapshot(self.app.url_map)
+            self.load_times[prefix] = time.perf_counter() - start
+
+    def _published(self):
+        # the first copy is taken once the app's own routes are added, at the
+        # first request or load
+        if self.url_map is None:
+            self.url_map = _snapshot(self.app.url_map)
+        return self.url_map
+
+    def _create_url_adapter(self, request):
+        '''Flask.create_url_adapter, binding the copy of app.url_map'''
+        app = self.app
+        url_map = self.url_map
+        if url_map is None:
+            with self._lock:
+                url_map = self._published()
+        if request is not None:
+            subdomain = (url_map.default_subdomain or None) if not app.subdomain_matching else None
+            return url_map.bind_to_environ(request.environ, server_name=app.config['SERVER_NAME'],
+                                           subdomain=subdomain)
+        if app.config['SERVER_NAME'] is not None:
+            return url_map.bind(app.config['SERVER_NAME'], script_name=app.config['APPLICATION_ROOT'],
+                                url_scheme=app.config['PREFERRED_URL_SCHEME'])
+        return None
+
+    def load_all(self):
+        for prefix in list(self.pending):
+            self._load(prefix)
+
+    def load_path(self, path):
+        '''loads the blueprint serving path, if it is pending'''
+        if self.pending:
+            for prefix in list(self.pending):
+                if path == prefix or path.startswith(prefix + '/'):
+                    self._load(prefix)
+
+    def _dispatch(self, environ, start_response):
+        self.load_path(environ.get('PATH_INFO', ''))
+        return self._wsgi_app(environ, start_response)
+
+
+lazy_blueprints = LazyBlueprints()
@@ -0,0 +1,157 @@
+# /src/compression.py
+
+import zlib
+
+from flask import request
+
+from .instrumentation import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# content codings, their name is appended to strong ETags, e.g. "<etag>-gzip"
+CODINGS = ('gzip', 'br')
+
+
+def coded_etag(etag, coding):
+    return '{}-{}'.format(etag, coding)
+
+
+def strip_coding(etag):
+    '''returns the ETag of the identity representation of a compressed one'''
+    base, separator, coding = etag.rpartition('-')
+    return base if separator and coding in CODINGS else etag
+
+
+class GzipEncoder(object):
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def compressor(self):
+        # wbits 31 writes the gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    @staticmethod
+    def step(compressor, chunk):
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    @staticmethod
+    def finish(compressor):
+        return compressor.flush()
+
+
+class BrotliEncoder(object):
+    name = 'br'
+
+    def __init__(self, quality):
+        if brotli is None:
+            raise RuntimeError('br compression requires the brotli package')
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compressor(self):
+        return brotli.Compressor(quality=self.quality)
+
+    @staticmethod
+    def step(compressor, chunk):
+        return compressor.process(chunk) + compressor.flush()
+
+    @staticmethod
+    def finish(compressor):
+        return compressor.finish()
+
+
+class Compression(object):
+    """
+    Compresses responses of the COMPRESSION_MIMETYPES with the first of the
+    COMPRESSION_ALGORITHMS (br, gzip) the client accepts, br only if the
+    brotli package is installed. Buffered bodies smaller than
+    COMPRESSION_MIN_SIZE bytes are sent as they are, streamed ones are
+    compressed chunk by chunk and flushed after each, so clients still
+    receive them progressively. Strong ETags get the coding appended, as
+    the compressed bytes are another representation, weak ones are kept.
+    """
+
+    def __init__(self, app=None):
+        self.encoders = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESSION_ALGORITHMS', ['br', 'gzip'])
+        app.config.setdefault('COMPRESSION_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESSION_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESSION_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESSION_MIMETYPES', ['application/json'])
+
+        self.min_size = app.config['COMPRESSION_MIN_SIZE']
+        self.mimetypes = set(app.config['COMPRESSION_MIMETYPES'])
+        self.encoders = []
+        for name in app.config['COMPRESSION_ALGORITHMS']:
+            if name == 'gzip':
+                self.encoders.append(GzipEncoder(app.config['COMPRESSION_GZIP_LEVEL']))
+            elif name == 'br':
+                if brotli is not None:
+                    self.encoders.append(BrotliEncoder(app.config['COMPRESSION_BROTLI_QUALITY']))
+            else:
+                raise ValueError('unknown compression algorithm: {}'.format(name))
+        app.extensions['compression'] = self
+
+        if self.encoders:
+            app.after_request(self._compress)
+
+    def _encoder(self):
+        name = request.accept_encodings.best_match([encoder.name for encoder in self.encoders])
+        return next((encoder for encoder in self.encoders if encoder.name == name), None)
+
+    def _compress(self, response):
+        if response.mimetype not in self.mimetypes or response.status_code in (204, 304) \
+                or response.status_code < 200 or 'Content-Encoding' in response.headers:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        encoder = self._encoder()
+        if encoder is None or request.method == 'HEAD':
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(encoder, response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            with timed('compress'):
+                response.set_data(encoder.compress(data))
+        response.headers['Content-Encoding'] = encoder.name
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(coded_etag(etag, encoder.name))
+        return response
+
+    @staticmethod
+    def _stream(encoder, chunks):
+        compressor = encoder.compressor()
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if chunk:
+                    yield encoder.step(compressor, chunk)
+            yield encoder.finish(compressor)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+compression = Compression()
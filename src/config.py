@@ -3,24 +3,118 @@
 import os
 
 
-class Development(object):
+def _sync_overlap_seconds(statement_timeout):
+    return int(os.getenv('SYNC_OVERLAP_SECONDS', str(statement_timeout // 1000 + 5)))
+
+
+class Config(object):
     """
-    Development environment configuration
+    Configuration shared by the environments
     """
-    DEBUG = True
     TESTING = False
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    # connections kept open per worker process, plus up to DB_MAX_OVERFLOW
+    # more under load, a checkout fails after waiting DB_POOL_TIMEOUT seconds
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    # milliseconds, 0 disables it
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))
+    # 1 if DATABASE_URL points to PgBouncer in transaction pooling mode
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '') == '1'
+    # comma separated URLs of read replicas, safe requests read from them
+    DB_REPLICA_URLS = [url for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url]
+    # seconds a client reads from the primary after a write
+    DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+    # asyncpg pool of the ASGI app (asgi.py), per worker process
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', os.getenv('DATABASE_URL', ''))
+    ASYNC_POOL_MIN_SIZE = int(os.getenv('ASYNC_POOL_MIN_SIZE', '2'))
+    ASYNC_POOL_MAX_SIZE = int(os.getenv('ASYNC_POOL_MAX_SIZE', '10'))
+    # threads of the ASGI app serving the routes that don't run on asyncio,
+    # change streams don't take one
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '8'))
+    # none, local (per worker process, with a single SERVER_WORKERS only) or redis (shared by all workers)
+    ENTITY_CACHE_BACKEND = os.getenv('ENTITY_CACHE_BACKEND', 'none')
+    ENTITY_CACHE_TTL = int(os.getenv('ENTITY_CACHE_TTL', '30'))
+    ENTITY_CACHE_REDIS_URL = os.getenv('ENTITY_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    # 0 dumps and loads with plain marshmallow instead of the compiled schemas
+    COMPILED_SCHEMAS = os.getenv('COMPILED_SCHEMAS', '1') == '1'
+    # stdlib or orjson (needs the orjson package)
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'stdlib')
+    # total of list envelopes, exact, estimated or none, clients override it
+    # with totalMode, LIST_TOTAL_MODES sets it per endpoint, e.g.
+    # organisations.find_all=estimated,users.search=none
+    LIST_TOTAL_MODE = os.getenv('LIST_TOTAL_MODE', 'exact')
+    LIST_TOTAL_MODES = dict(item.split('=', 1) for item in os.getenv('LIST_TOTAL_MODES', '').split(',') if item)
+    # preferred first, br needs the brotli package, empty disables compression
+    COMPRESSION_ALGORITHMS = [name for name in os.getenv('COMPRESSION_ALGORITHMS', 'br,gzip').split(',') if name]
+    # bytes, smaller buffered responses are sent uncompressed
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '500'))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    # change feed (/api/v1/changes), LISTEN needs a direct connection, not
+    # one through PgBouncer in transaction mode
+    CHANGES_LISTEN_URL = os.getenv('CHANGES_LISTEN_URL', os.getenv('DATABASE_URL'))
+    # changes queued per stream, one that falls further behind reads them
+    # from the changes table, more than CHANGES_BACKLOG_LIMIT make it reset
+    CHANGES_QUEUE_SIZE = int(os.getenv('CHANGES_QUEUE_SIZE', '1000'))
+    CHANGES_BACKLOG_LIMIT = int(os.getenv('CHANGES_BACKLOG_LIMIT', '1000'))
+    CHANGES_KEEPALIVE_SECONDS = int(os.getenv('CHANGES_KEEPALIVE_SECONDS', '15'))
+    # hours the changes table keeps changes for reconnecting clients and
+    # deletes for delta syncs
+    CHANGES_RETENTION_HOURS = int(os.getenv('CHANGES_RETENTION_HOURS', '24'))
+    # seconds the watermark of a delta sync (updatedSince) lags behind, for
+    # writes committing after their updated_at, at least the statement
+    # timeout is used
+    SYNC_OVERLAP_SECONDS = _sync_overlap_seconds(DB_STATEMENT_TIMEOUT)
+    # 1 imports a blueprint's module on the first request to its prefix,
+    # ignored in debug mode
+    LAZY_BLUEPRINTS = os.getenv('LAZY_BLUEPRINTS', '') == '1'
+    # milliseconds from process start until the first request is served,
+    # checked by manage.py startup_profile
+    STARTUP_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', '1500'))
     # JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
 
 
-class Production(object):
+class Development(Config):
+    """
+    Development environment configuration
+    """
+    DEBUG = True
+
+
+class Production(Config):
     """
     Production environment configurations
     """
     DEBUG = False
-    TESTING = False
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
-    # JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+    SERVER_TIMING = os.getenv('SERVER_TIMING', '') == '1'
+    # gunicorn (gunicorn.conf.py), workers are forked from a master holding
+    # the preloaded app, each serving SERVER_THREADS requests at once
+    SERVER_BIND = os.getenv('SERVER_BIND', '0.0.0.0:8000')
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', str(2 * (os.cpu_count() or 1) + 1)))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '4'))
+    # a worker is replaced after this many requests (plus up to the jitter,
+    # so they don't restart at once) or once its RSS exceeds the megabytes,
+    # 0 disables either
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '10000'))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', '1000'))
+    SERVER_MAX_MEMORY_MB = int(os.getenv('SERVER_MAX_MEMORY_MB', '512'))
+    # seconds, a request running longer kills its worker, on SIGTERM workers
+    # finish their in-flight requests for up to SERVER_GRACEFUL_TIMEOUT
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '60'))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))
+    # milliseconds, long queries are cut off in production
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '30000'))
+    # a stream holds a server thread for as long as it is open, so a worker
+    # keeps streams from taking more than half of its SERVER_THREADS, and
+    # none with the sync worker (SERVER_THREADS=1), further ones get a 503.
+    # The ASGI app (asgi.py) serves them on its event loop without a thread.
+    CHANGES_MAX_STREAMS = int(os.getenv('CHANGES_MAX_STREAMS', str(SERVER_THREADS // 2)))
+    # at least the statement timeout above
+    SYNC_OVERLAP_SECONDS = _sync_overlap_seconds(DB_STATEMENT_TIMEOUT)
 
 
 app_config = {
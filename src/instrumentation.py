@@ -0,0 +1,110 @@
+# /src/instrumentation.py
+
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import registry
+
+request_duration = registry.histogram(
+    'plaza_http_request_duration_seconds', 'Request latency until the response is built',
+    labels=('endpoint', 'method', 'status'))
+request_queries = registry.histogram(
+    'plaza_http_request_db_queries', 'SQL statements executed per request', labels=('endpoint',),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+stage_duration = registry.histogram(
+    'plaza_http_request_stage_seconds', 'Time spent per request in the db, dump, encode and compress stages',
+    labels=('endpoint', 'stage'))
+
+STAGES = ('db', 'dump', 'encode', 'compress')
+
+
+def _timings():
+    if not has_app_context():
+        return None
+    return g.get('timings')
+
+
+@contextmanager
+def timed(stage):
+    '''adds the time spent in the block to the stage of the current request'''
+    timings = _timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _record_query(conn):
+    start = conn.info['query_start'].pop()
+    timings = _timings()
+    if timings is not None:
+        timings['db'] = timings.get('db', 0.0) + time.perf_counter() - start
+        timings['queries'] = timings.get('queries', 0) + 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(conn)
+
+
+def _handle_error(context):
+    # a failed statement has no after_cursor_execute, its start would be
+    # left on the pooled connection and pair with a later statement
+    conn = context.connection
+    if conn is not None and conn.info.get('query_start'):
+        _record_query(conn)
+
+
+def _start_request():
+    g.timings = {}
+    g.request_start = time.perf_counter()
+
+
+def _finish_request(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unmatched'
+
+    request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    request_queries.observe(timings.get('queries', 0), endpoint=endpoint)
+    for stage in STAGES:
+        if stage in timings:
+            stage_duration.observe(timings[stage], endpoint=endpoint, stage=stage)
+
+    if current_app.config['SERVER_TIMING']:
+        metrics = ['{};dur={:.2f}'.format(stage, timings[stage] * 1000) for stage in STAGES if stage in timings]
+        metrics.append('queries;desc="{}"'.format(timings.get('queries', 0)))
+        metrics.append('app;dur={:.2f}'.format(elapsed * 1000))
+        response.headers['Server-Timing'] = ', '.join(metrics)
+    return response
+
+
+def init_app(app):
+    """
+    Counts the SQL statements and DB time of each request through engine
+    events, and together with the dump and encode stages reports them in a
+    Server-Timing header (if SERVER_TIMING is set) and on /metrics.
+    """
+    app.config.setdefault('SERVER_TIMING', True)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,132 @@
+# /src/metrics.py
+
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend('{}{} {}'.format(name, labels, value) for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, description, labels=(), callback=None):
+        super(Gauge, self).__init__(name, description, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is not None:
+            # callback gauges are read at scrape time, returning {label values: value}
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in self.callback().items()]
+        return super(Gauge, self).samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, count, total = self._values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, count + 1, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = [(key, list(counts), count, total) for key, (counts, count, total) in self._values.items()]
+        for key, counts, count, total in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                samples.append((self.name + '_bucket', _format_labels(self.labels, key, [('le', bound)]), bucket_count))
+            samples.append((self.name + '_bucket', _format_labels(self.labels, key, [('le', '+Inf')]), count))
+            samples.append((self.name + '_count', _format_labels(self.labels, key), count))
+            samples.append((self.name + '_sum', _format_labels(self.labels, key), total))
+        return samples
+
+
+class Registry(object):
+    """
+    Process local metrics, rendered in the Prometheus text exposition format.
+    Every worker process has its own registry and is scraped separately.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, labels=()):
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=(), callback=None):
+        return self._register(Gauge(name, description, labels, callback))
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
@@ -1,12 +1,22 @@
 # src/models/__init__.py
 
-from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from .hashing import HashPool
+from .cache import EntityCache
+from .compiled import SchemaCompiler
+from .replicas import Replicas, RoutingSQLAlchemy
 
 # initialize our db
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 bcrypt = Bcrypt()
+hash_pool = HashPool()
+entity_cache = EntityCache()
+schema_compiler = SchemaCompiler()
+replicas = Replicas()
 
 from .user import UserModel, UserSchema  # noqa: E402,F401
 from .credential import CredentialModel, CredentialSchema  # noqa: E402,F401
 from .organisation import OrganisationModel, OrganisationSchema  # noqa: E402,F401
+from .account import AccountModel, AccountSchema  # noqa: E402,F401
+from .change import ChangeModel, ChangeSchema  # noqa: E402,F401
+from .feed import change_feed  # noqa: E402,F401
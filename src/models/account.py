@@ -4,19 +4,25 @@ import datetime
 import sqlalchemy
 from marshmallow import fields, Schema
 from sqlalchemy.dialects.postgresql import UUID
-from . import db
-from .organisation import OrganisationSchema
+from . import db, entity_cache
+from .bulk import insert_ignoring_conflicts, reference_errors
+from .writes import insert_returning, update_returning, delete_returning, row_exists
+from .change import ChangeModel
+from .organisation import OrganisationModel, OrganisationSchema
 
 class AccountModel(db.Model):
     __tablename__ = 'accounts'
     __table_args__ = (
+        db.Index('ix_accounts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_accounts_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_accounts_organisation_id', 'organisation_id'),
         db.UniqueConstraint('name', 'organisation_id', name='unique_account_name_and_organisation_id'),
     )
 
     uuid = db.Column('id', UUID(as_uuid=True), primary_key=True,
                      server_default=sqlalchemy.text('uuid_generate_v4()'))
-    created_at = db.Column(db.DateTime)
-    updated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
 
     name = db.Column(db.Text, nullable=False, default='Default Account')
     organisation_uuid = db.Column('organisation_id', UUID(), db.ForeignKey('organisations.id'), nullable=False)
@@ -34,24 +40,60 @@ class AccountModel(db.Model):
     def save(self):
         db.session.add(self)
         db.session.commit()
+        entity_cache.invalidate(AccountModel, self.uuid)
 
     def update(self, data):
         for key, item in data.items():
             setattr(self, key, item)
         self.updated_at = datetime.datetime.utcnow()
         db.session.commit()
+        entity_cache.invalidate(AccountModel, self.uuid)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        entity_cache.invalidate(AccountModel, self.uuid)
+
+    @staticmethod
+    def create(data):
+        '''inserts the loaded data in one statement, returns it or None if the name is taken in its organisation'''
+        return insert_returning(AccountModel(data), ['name', 'organisation_id'])
+
+    @staticmethod
+    def update_by_uuid(uuid, data, versions=None):
+        return update_returning(AccountModel, uuid, data, versions)
+
+    @staticmethod
+    def delete_by_uuid(uuid, versions=None):
+        return delete_returning(AccountModel, uuid, versions)
+
+    @staticmethod
+    def exists(uuid):
+        return row_exists(AccountModel, uuid)
+
+    @staticmethod
+    def tombstones(since):
+        '''returns the deletes recorded since then, which the changes table keeps for CHANGES_RETENTION_HOURS'''
+        return ChangeModel.deleted_since(AccountModel.__tablename__, since)
+
+    @staticmethod
+    def reference_errors(items):
+        '''returns the errors of the loaded items, by index, referencing an organisation that doesn't exist'''
+        return reference_errors(items, {'organisation_uuid': ('organisationUuid', OrganisationModel.uuid)})
+
+    @staticmethod
+    def insert_many(items):
+        '''inserts the loaded items in one statement, returns their uuids or None on conflict'''
+        return insert_ignoring_conflicts([AccountModel(data) for data in items], ['name', 'organisation_id'])
 
     @staticmethod
     def find_all():
         return AccountModel.query.all()
 
     @staticmethod
-    def get_by_uuid(uuid):
-        return AccountModel.query.get(uuid)
+    def get_by_uuid(uuid, *options, cached=True):
+        return entity_cache.get(db.session, AccountModel, uuid,
+                                lambda: AccountModel.query.options(*options).get(uuid), cached)
 
     def __repr(self):
         return '<uuid {}>'.format(self.uuid)
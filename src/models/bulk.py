@@ -0,0 +1,78 @@
+# src/models/bulk.py
+
+import uuid as uuid_lib
+
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import insert, UUID
+from . import db
+
+
+def column_values(instance):
+    '''returns the column values of a model instance keyed by table column, defaults applied'''
+    mapper = inspect(instance.__class__)
+    values = {}
+    for prop in mapper.column_attrs:
+        column = prop.columns[0]
+        if column.primary_key:
+            continue
+        value = getattr(instance, prop.key)
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        values[column.key] = value
+    return values
+
+
+def _key(columns, values):
+    return tuple(str(uuid_lib.UUID(str(value))) if isinstance(column.type, UUID) and value is not None else value
+                 for column, value in zip(columns, values))
+
+
+def _parse_uuid(value):
+    try:
+        return str(uuid_lib.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def reference_errors(items, references):
+    """
+    Returns the validation errors of the loaded items, by index, that
+    reference rows which don't exist. references maps an item key to the
+    field reported and the uuid column referenced, each column is looked up
+    once for the whole batch.
+    """
+    errors = {}
+    for key, (field, column) in sorted(references.items()):
+        values = {index: item.get(key) for index, item in items.items() if item.get(key) is not None}
+        parsed = {index: _parse_uuid(value) for index, value in values.items()}
+        wanted = {value for value in parsed.values() if value is not None}
+        found = {str(value) for value, in db.session.query(column).filter(column.in_(wanted))} if wanted else set()
+        for index, value in values.items():
+            if parsed[index] not in found:
+                errors.setdefault(index, {})[field] = ['{} does not exist'.format(value)]
+    return errors
+
+
+def insert_ignoring_conflicts(instances, index_elements):
+    """
+    Inserts the model instances with one multi-row INSERT ... ON CONFLICT DO
+    NOTHING statement and commits. Returns the uuid of each inserted instance,
+    in order, or None for instances conflicting with the unique index_elements,
+    either with stored rows or with an earlier instance of the same batch.
+    """
+    if not instances:
+        return []
+
+    table = instances[0].__table__
+    rows = [column_values(instance) for instance in instances]
+    columns = [table.c[name] for name in index_elements]
+
+    stmt = insert(table).values(rows).on_conflict_do_nothing(index_elements=columns) \
+        .returning(table.c.id, *columns)
+
+    created = {}
+    for row in db.session.execute(stmt):
+        created[_key(columns, row[1:])] = row[0]
+    db.session.commit()
+
+    return [created.pop(_key(columns, [row[column.key] for column in columns]), None) for row in rows]
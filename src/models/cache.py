@@ -0,0 +1,233 @@
+# src/models/cache.py
+
+import datetime
+import json
+import threading
+import time
+import uuid as uuid_lib
+from collections import OrderedDict
+
+from flask import has_request_context, request
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..metrics import registry
+from .replicas import use_primary
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+cache_hits = registry.counter('plaza_entity_cache_hits_total', 'Entity cache hits', labels=('table',))
+cache_misses = registry.counter('plaza_entity_cache_misses_total', 'Entity cache misses', labels=('table',))
+cache_evictions = registry.counter(
+    'plaza_entity_cache_evictions_total', 'Entity cache entries evicted by size or expiry', labels=('table',))
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class LocalBackend(object):
+    """
+    In-process LRU cache with a per entry TTL, bounded to max_entries.
+    Entries are local to the worker process, a write only evicts the entry of
+    the worker that made it, so EntityCache refuses this backend for more
+    than one SERVER_WORKERS.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                cache_evictions.inc(table=key.partition(':')[0])
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                cache_evictions.inc(table=evicted.partition(':')[0])
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _encode(value):
+    if isinstance(value, uuid_lib.UUID):
+        return {'$uuid': str(value)}
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+        return {'$datetime': value.strftime(DATETIME_FORMAT),
+                'utcoffset': offset.total_seconds() if offset is not None else None}
+    raise TypeError('{!r} is not a column value the entity cache stores'.format(value))
+
+
+def _decode(obj):
+    if '$uuid' in obj:
+        return uuid_lib.UUID(obj['$uuid'])
+    if '$datetime' in obj:
+        value = datetime.datetime.strptime(obj['$datetime'], DATETIME_FORMAT)
+        if obj['utcoffset'] is not None:
+            value = value.replace(tzinfo=datetime.timezone(datetime.timedelta(seconds=obj['utcoffset'])))
+        return value
+    return obj
+
+
+def dump_values(values):
+    '''returns the column values as JSON, uuids and datetimes tagged with their type'''
+    return json.dumps(values, default=_encode, separators=(',', ':')).encode('utf-8')
+
+
+def load_values(data):
+    return json.loads(data.decode('utf-8'), object_hook=_decode)
+
+
+class RedisBackend(object):
+    """
+    Cache shared by all workers on a Redis compatible server, entries expire
+    after ttl seconds and size is bounded by the server's maxmemory policy.
+    Values are stored as JSON, not pickled, so that writing to the server
+    doesn't run code in the workers reading from it.
+    """
+
+    def __init__(self, url, ttl, prefix='plaza:entity:'):
+        if redis is None:
+            raise RuntimeError('the redis entity cache backend requires the redis package')
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return load_values(value) if value is not None else None
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, dump_values(value), ex=self.ttl)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def column_state(instance):
+    '''returns the column values of a fully loaded instance, or None if some are deferred'''
+    state = inspect(instance)
+    keys = [prop.key for prop in state.mapper.column_attrs]
+    if state.unloaded.intersection(keys):
+        return None
+    return {key: state.dict[key] for key in keys}
+
+
+def hydrate(session, model, values):
+    """
+    Returns the persistent instance of model with the given column values
+    without emitting a SELECT, lazy relationships still load on access.
+    """
+    instance = inspect(model).class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
+
+
+class EntityCache(object):
+    """
+    Read-through cache of entities by uuid. The configured ENTITY_CACHE_BACKEND
+    is none (disabled), local (per worker LRU, only with a single
+    SERVER_WORKERS as the other workers would keep serving an entry a write
+    invalidated until it expires) or redis (shared, at
+    ENTITY_CACHE_REDIS_URL). Only safe requests are served from the cache,
+    writes always load the stored row. Models invalidate their entry after
+    each committed change. Credentials are not cached, their password hashes
+    are not to be copied to a shared cache.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ENTITY_CACHE_BACKEND', 'none')
+        app.config.setdefault('ENTITY_CACHE_TTL', 30)
+        app.config.setdefault('ENTITY_CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('ENTITY_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('SERVER_WORKERS', 1)
+
+        backend = app.config['ENTITY_CACHE_BACKEND']
+        if backend == 'local':
+            if app.config['SERVER_WORKERS'] > 1:
+                raise ValueError('the local entity cache backend is per worker, use redis with {} SERVER_WORKERS'
+                                 .format(app.config['SERVER_WORKERS']))
+            self.backend = LocalBackend(app.config['ENTITY_CACHE_TTL'], app.config['ENTITY_CACHE_MAX_ENTRIES'])
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['ENTITY_CACHE_REDIS_URL'], app.config['ENTITY_CACHE_TTL'])
+        elif backend == 'none':
+            self.backend = None
+        else:
+            raise ValueError('unknown entity cache backend: {}'.format(backend))
+        app.extensions['entity_cache'] = self
+
+    @staticmethod
+    def _key(model, uuid):
+        try:
+            return '{}:{}'.format(model.__tablename__, uuid_lib.UUID(str(uuid)))
+        except ValueError:
+            return None
+
+    def _enabled(self):
+        return self.backend is not None and (not has_request_context() or request.method in ('GET', 'HEAD'))
+
+    def get(self, session, model, uuid, loader, cached=True):
+        """
+        Returns the cached entity of model, or the one loader returns, caching
+        it. cached is False for loads a hit couldn't serve, e.g. with included
+        relationships, which the cached column values don't carry.
+        """
+        key = self._key(model, uuid)
+        if key is None or not cached or not self._enabled():
+            return loader()
+
+        values = self.backend.get(key)
+        if values is not None:
+            cache_hits.inc(table=model.__tablename__)
+            return hydrate(session, model, values)
+
+        cache_misses.inc(table=model.__tablename__)
+        # a replica may not have caught up with a write yet, which would
+        # then be served from the cache until the entry expires
+        with use_primary():
+            instance = loader()
+        if instance is not None:
+            values = column_state(instance)
+            if values is not None:
+                self.backend.set(key, values)
+        return instance
+
+    def invalidate(self, model, uuid):
+        key = self._key(model, uuid)
+        if key is not None and self.backend is not None:
+            self.backend.delete(key)
@@ -0,0 +1,138 @@
+# src/models/change.py
+
+import datetime
+from marshmallow import fields, Schema
+from sqlalchemy.dialects.postgresql import UUID
+from . import db
+
+# the tables recording their changes, by category
+CATEGORIES = ('organisations', 'users', 'credentials', 'accounts')
+
+
+def _parse_timestamp(value):
+    # as row_to_json writes timestamp columns
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+
+
+class ChangeModel(db.Model):
+    """
+    A create, update or delete of a row in one of the CATEGORIES tables,
+    recorded and published on the plaza_changes channel by the
+    plaza_record_change trigger. Ids are taken at insert, so a change can
+    commit after one with a higher id. Streams therefore follow a horizon, a
+    transaction id below which every transaction has finished: txid is the
+    writing transaction, snapshot_xmin the horizon when the change was
+    written. All changes of transactions below it committed, and were
+    published, before this one.
+    """
+    __tablename__ = 'changes'
+    __table_args__ = (
+        db.Index('ix_changes_changed_at', 'changed_at'),
+        db.Index('ix_changes_txid', 'txid'),
+        db.Index('ix_changes_deletes', 'category', 'changed_at', postgresql_where=db.text("action = 'delete'")),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    category = db.Column(db.Text, nullable=False)
+    action = db.Column(db.Text, nullable=False)
+    uuid = db.Column('resource_id', UUID(), nullable=False)
+    updated_at = db.Column(db.DateTime)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    txid = db.Column(db.BigInteger, nullable=False)
+    snapshot_xmin = db.Column(db.BigInteger, nullable=False)
+
+    @staticmethod
+    def from_notification(payload):
+        '''returns the change published as payload, the row as JSON'''
+        return ChangeModel(id=payload['id'], category=payload['category'], action=payload['action'],
+                           uuid=payload['resource_id'], updated_at=_parse_timestamp(payload['updated_at']),
+                           changed_at=_parse_timestamp(payload['changed_at']), txid=payload['txid'],
+                           snapshot_xmin=payload['snapshot_xmin'])
+
+    @staticmethod
+    def horizon_query():
+        return db.session.query(db.func.txid_snapshot_xmin(db.func.txid_current_snapshot()))
+
+    @staticmethod
+    def horizon():
+        '''returns the current horizon, every transaction below it has finished'''
+        return ChangeModel.horizon_query().scalar()
+
+    @staticmethod
+    def committed_since_query(horizon, categories, limit):
+        return ChangeModel.query.filter(ChangeModel.txid >= horizon, ChangeModel.category.in_(categories)) \
+            .order_by(ChangeModel.id).limit(limit)
+
+    @staticmethod
+    def committed_since(horizon, categories, limit):
+        """
+        Returns up to limit changes of categories written by transactions from
+        the horizon on that have committed, in id order. Read after horizon(),
+        in a later statement, they include every change of the transactions
+        below the horizon it returned.
+        """
+        return ChangeModel.committed_since_query(horizon, categories, limit).all()
+
+    @staticmethod
+    def oldest_txid_query():
+        return db.session.query(db.func.min(ChangeModel.txid))
+
+    @staticmethod
+    def retained(horizon, oldest_txid):
+        """
+        Whether the changes of the transactions from horizon on are all still
+        recorded when the oldest recorded change is of oldest_txid (None if
+        there is none), see purge.
+        """
+        return oldest_txid is None or oldest_txid <= horizon
+
+    @staticmethod
+    def retains(horizon):
+        return ChangeModel.retained(horizon, ChangeModel.oldest_txid_query().scalar())
+
+    @staticmethod
+    def deleted_since(category, since):
+        '''returns the deletes of category recorded since then, the tombstones of the deleted rows'''
+        return ChangeModel.query.filter(ChangeModel.category == category, ChangeModel.action == 'delete',
+                                        ChangeModel.changed_at >= since).order_by(ChangeModel.changed_at).all()
+
+    @staticmethod
+    def purge(before):
+        """
+        Deletes the changes recorded before the given time, returns their
+        number. Only changes of transactions older than every kept one are
+        deleted, so the kept ones are those from some transaction on, and
+        those of the last transaction are always kept, see retains.
+        """
+        kept = db.session.query(db.func.min(ChangeModel.txid)).filter(ChangeModel.changed_at >= before).scalar()
+        if kept is None:
+            kept = db.session.query(db.func.max(ChangeModel.txid)).scalar()
+        if kept is None:
+            return 0
+        count = ChangeModel.query.filter(ChangeModel.txid < kept).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+
+    def __repr__(self):
+        return '<change {}>'.format(self.id)
+
+
+class ChangeSchema(Schema):
+    _type = fields.Str('ChangeV1', dump_to='type', dump_only=True)
+
+    category = fields.Str(dump_only=True)
+    action = fields.Str(dump_only=True)
+    uuid = fields.Str(dump_only=True)
+    updated_at = fields.DateTime(dump_to='updatedAt', dump_only=True)
+    changed_at = fields.DateTime(dump_to='changedAt', dump_only=True)
+
+
+class TombstoneSchema(Schema):
+    uuid = fields.Str(dump_only=True)
+    changed_at = fields.DateTime(dump_to='deletedAt', dump_only=True)
+
+
+change_schema = ChangeSchema()
+tombstone_schema = TombstoneSchema(many=True)
@@ -0,0 +1,282 @@
+# src/models/compiled.py
+
+import datetime
+import uuid
+
+from marshmallow import fields, Schema, ValidationError
+from marshmallow.schema import MarshalResult, UnmarshalResult
+from marshmallow.utils import get_value, missing
+
+UTC = datetime.timezone.utc
+
+
+class _Slow(Exception):
+    '''raised by a fast path which can't handle a value, marshmallow decides'''
+    pass
+
+
+def _dump_str(value):
+    if type(value) is str:
+        return value
+    if type(value) is uuid.UUID:
+        return str(value)
+    if value is None:
+        return None
+    raise _Slow()
+
+
+def _dump_datetime(value):
+    # the iso format of marshmallow's DateTime, naive values are UTC
+    if type(value) is datetime.datetime:
+        if value.tzinfo is None:
+            return value.isoformat() + '+00:00'
+        return value.astimezone(UTC).isoformat()
+    if value is None:
+        return None
+    raise _Slow()
+
+
+def _dump_bool(value):
+    if value is True or value is False or value is None:
+        return value
+    raise _Slow()
+
+
+def _dump_str_list(value):
+    if type(value) is list and all(type(each) is str for each in value):
+        return list(value)
+    if value is None:
+        return None
+    raise _Slow()
+
+
+class CompiledSchema(object):
+    """
+    The dump and load of a marshmallow schema instance, specialized once for
+    its fields. Values of the expected types take a direct path, anything
+    else (and every validation error) goes through the field's own
+    marshmallow code, so the result and errors are the same as schema.dump
+    and schema.load return.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.dict_class = schema.dict_class
+        self.index_errors = schema.opts.index_errors
+        self._dumpers = [self._compile_dumper(name, field) for name, field in schema.fields.items()
+                         if not field.load_only]
+        self._loaders = [self._compile_loader(name, field) for name, field in schema.fields.items()
+                         if not field.dump_only]
+
+    @staticmethod
+    def supports(schema):
+        '''whether schema only uses features the compiled code implements'''
+        plain = not (schema._has_processors or schema.extra or schema.prefix or schema.strict)
+        hooks = schema.__error_handler__ is None and schema.__accessor__ is None and \
+            type(schema).get_attribute is Schema.get_attribute
+        return plain and hooks and all('.' not in (field.attribute or name) for name, field in schema.fields.items())
+
+    def _compile_dumper(self, name, field):
+        fast = None
+        if type(field) is fields.Str and not field.validators:
+            fast = _dump_str
+        elif type(field) is fields.DateTime and field.dateformat in (None, 'iso') and not field.localtime:
+            fast = _dump_datetime
+        elif type(field) is fields.Bool:
+            fast = _dump_bool
+        elif type(field) is fields.List and type(field.container) is fields.Str \
+                and not field.container.attribute:
+            fast = _dump_str_list
+        elif type(field) is fields.Nested and not isinstance(field.only, str) \
+                and isinstance(field.schema, Schema) and CompiledSchema.supports(field.schema):
+            fast = self._nested_dumper(field)
+
+        if not field._CHECK_ATTRIBUTE:
+            # values these fields compute themselves are left to marshmallow
+            return field.dump_to or name, None, None, None, name, field
+        return field.dump_to or name, field.attribute or name, field.default, fast, name, field
+
+    @staticmethod
+    def _nested_dumper(field):
+        compiled = compile_schema(field.schema)
+
+        def dump_nested(value):
+            if value is None:
+                return None
+            if field.many:
+                value = list(value)
+            data, errors = compiled.dump(value, many=field.many)
+            if errors:
+                raise ValidationError(errors, data=data)
+            return data
+        return dump_nested
+
+    @staticmethod
+    def _fast_value(obj, plain, attribute, default, fast):
+        if fast is None:
+            raise _Slow()
+        value = getattr(obj, attribute, missing) if plain else get_value(attribute, obj, missing)
+        if value is missing:
+            return default() if callable(default) else default
+        return fast(value)
+
+    def _dump_item(self, obj, errors, index):
+        ret = []
+        plain = not hasattr(obj, '__getitem__')
+        for key, attribute, default, fast, name, field in self._dumpers:
+            try:
+                value = self._fast_value(obj, plain, attribute, default, fast)
+            except _Slow:
+                try:
+                    value = field.serialize(name, obj, accessor=self.schema.get_attribute)
+                except ValidationError as error:
+                    value = self._store_error(errors, index, key, error)
+            except ValidationError as error:
+                value = self._store_error(errors, index, key, error)
+            if value is not missing:
+                ret.append((key, value))
+        return self.dict_class(ret)
+
+    def _store_error(self, errors, index, key, error):
+        if index is not None and self.index_errors:
+            errors = errors.setdefault(index, {})
+        if isinstance(error.messages, dict):
+            errors[key] = error.messages
+        elif isinstance(errors.get(key), dict):
+            errors[key].setdefault('_field', []).extend(error.messages)
+        else:
+            errors.setdefault(key, []).extend(error.messages)
+        # the data dumped before the error, as marshmallow keeps it
+        return error.data or missing
+
+    def dump(self, obj, many=None):
+        '''returns (data, errors) like marshmallow's Schema.dump'''
+        many = self.schema.many if many is None else bool(many)
+        errors = {}
+        if many and obj is not None:
+            data = [self._dump_item(each, errors, index) for index, each in enumerate(obj)]
+        else:
+            data = self._dump_item(obj, errors, None)
+        return MarshalResult(data, errors)
+
+    def _compile_loader(self, name, field):
+        fast = type(field) is fields.Str and not field.validators
+        return name, field.load_from, field.attribute or name, field, fast
+
+    @staticmethod
+    def _raw_value(data, name, load_from, field, partial):
+        value = data.get(name, missing)
+        if value is missing and load_from:
+            value = data.get(load_from, missing)
+        if value is missing:
+            if partial is True or (isinstance(partial, (list, tuple, set, frozenset)) and name in partial):
+                return missing
+            value = field.missing() if callable(field.missing) else field.missing
+            if value is missing and field.required:
+                raise _Slow()
+        return value
+
+    def _load_item(self, data, partial):
+        if not isinstance(data, dict):
+            raise _Slow()
+        ret = self.dict_class()
+        for name, load_from, attribute, field, fast in self._loaders:
+            value = self._raw_value(data, name, load_from, field, partial)
+            if value is missing:
+                continue
+            if value is None:
+                if field.allow_none is not True:
+                    raise _Slow()
+                ret[attribute] = None
+            elif fast and type(value) is str:
+                ret[attribute] = value
+            else:
+                try:
+                    ret[attribute] = field.deserialize(value, load_from or name, data)
+                except ValidationError:
+                    raise _Slow()
+        return ret
+
+    def load(self, data, many=None, partial=None):
+        '''returns (data, errors) like marshmallow's Schema.load'''
+        many = self.schema.many if many is None else bool(many)
+        partial = self.schema.partial if partial is None else partial
+        try:
+            if many:
+                if not isinstance(data, list):
+                    raise _Slow()
+                result = [self._load_item(each, partial) for each in data]
+            else:
+                result = self._load_item(data, partial)
+        except _Slow:
+            # invalid input, marshmallow builds the exact error messages
+            return self.schema.load(data, many=many, partial=partial)
+        return UnmarshalResult(result, {})
+
+
+def compile_schema(schema):
+    '''returns the compiled schema instance, compiling it on first use'''
+    compiled = schema.__dict__.get('_compiled')
+    if compiled is None:
+        compiled = CompiledSchema(schema) if CompiledSchema.supports(schema) else _Marshmallow(schema)
+        schema._compiled = compiled
+    return compiled
+
+
+class _Marshmallow(object):
+    '''stands in for schemas which can't be compiled'''
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def dump(self, obj, many=None):
+        return self.schema.dump(obj, many=many)
+
+    def load(self, data, many=None, partial=None):
+        return self.schema.load(data, many=many, partial=partial)
+
+
+def verify(schema, objects=(), payloads=()):
+    """
+    Dumps objects and loads payloads (plain and partial) with marshmallow and
+    the compiled schema, returning a description of every differing result.
+    """
+    compiled = compile_schema(schema)
+    mismatches = []
+    for obj in objects:
+        expected, actual = schema.dump(obj), compiled.dump(obj)
+        if repr(expected) != repr(actual):
+            mismatches.append('dump {!r}: {!r} != {!r}'.format(obj, actual, expected))
+    for payload in payloads:
+        for partial in (None, True):
+            expected, actual = schema.load(payload, partial=partial), compiled.load(payload, partial=partial)
+            if repr(expected) != repr(actual):
+                mismatches.append('load {!r}: {!r} != {!r}'.format(payload, actual, expected))
+    return mismatches
+
+
+class SchemaCompiler(object):
+    """
+    Dumps and loads through compiled schemas when COMPILED_SCHEMAS is set,
+    through marshmallow otherwise.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPILED_SCHEMAS', True)
+        self.enabled = app.config['COMPILED_SCHEMAS']
+        app.extensions['schema_compiler'] = self
+
+    def dump(self, schema, obj, many=None):
+        if not self.enabled:
+            return schema.dump(obj, many=many)
+        return compile_schema(schema).dump(obj, many=many)
+
+    def load(self, schema, data, many=None, partial=None):
+        if not self.enabled:
+            return schema.load(data, many=many, partial=partial)
+        return compile_schema(schema).load(data, many=many, partial=partial)
@@ -4,15 +4,21 @@ import datetime
 import sqlalchemy
 from marshmallow import fields, Schema
 from sqlalchemy.dialects.postgresql import UUID
-from . import db, bcrypt
+from . import db, hash_pool
+from .writes import insert_returning, update_returning, delete_returning, row_exists
+from .change import ChangeModel
 
 class CredentialModel(db.Model):
     __tablename__ = 'credentials'
+    __table_args__ = (
+        db.Index('ix_credentials_created_at_id', 'created_at', 'id'),
+        db.Index('ix_credentials_updated_at_id', 'updated_at', 'id'),
+    )
 
     uuid = db.Column('id', UUID(as_uuid=True), primary_key=True,
                      server_default=sqlalchemy.text('uuid_generate_v4()'))
-    created_at = db.Column(db.DateTime)
-    updated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
 
     user_uuid = db.Column('user_id', UUID(), db.ForeignKey('users.id'), unique=True, nullable=False)
     user = db.relationship('UserModel', back_populates="credential")
@@ -32,8 +38,10 @@ class CredentialModel(db.Model):
         self.updated_at = datetime.datetime.utcnow()
 
         self.user_uuid = data.get('user_uuid')
-        self.password = data.get('password')
-        self.password_set_at = data.get('password_set_at')
+        self.password = None
+        self.password_set_at = None
+        if data.get('password') is not None:
+            self.set_password(data.get('password'))
         self.is_locked = data.get('is_locked')
         self.is_expired = data.get('is_expired')
         self.last_login_at = data.get('last_login_at')
@@ -48,32 +56,79 @@ class CredentialModel(db.Model):
 
     def update(self, data):
         for key, item in data.items():
-            setattr(self, key, item)
+            if key == 'password':
+                self.set_password(item)
+            else:
+                setattr(self, key, item)
         self.updated_at = datetime.datetime.utcnow()
         db.session.commit()
 
+    def set_password(self, password):
+        self.password = self.__generate_hash(password)
+        self.password_set_at = datetime.datetime.utcnow()
+
+    def record_login(self, succeeded):
+        now = datetime.datetime.utcnow()
+        if succeeded:
+            self.last_login_at = now
+            self.user_info_last_login_at = now
+            self.user_info_last_login_failed_count = 0
+        else:
+            self.user_info_last_login_failed_at = now
+            self.user_info_last_login_failed_count = (self.user_info_last_login_failed_count or 0) + 1
+        db.session.commit()
+
     def delete(self):
         db.session.delete(self)
         db.session.commit()
 
+    @staticmethod
+    def create(data):
+        '''inserts the loaded data in one statement, returns it or None if the user has one'''
+        return insert_returning(CredentialModel(data), ['user_id'])
+
+    @staticmethod
+    def update_by_uuid(uuid, data, versions=None):
+        '''updates in one statement, a password is hashed in the bcrypt pool first'''
+        data = dict(data)
+        if 'password' in data:
+            data['password'] = hash_pool.generate_hash(data['password'])
+            data['password_set_at'] = datetime.datetime.utcnow()
+        return update_returning(CredentialModel, uuid, data, versions)
+
+    @staticmethod
+    def delete_by_uuid(uuid, versions=None):
+        return delete_returning(CredentialModel, uuid, versions)
+
+    @staticmethod
+    def exists(uuid):
+        return row_exists(CredentialModel, uuid)
+
+    @staticmethod
+    def tombstones(since):
+        '''returns the deletes recorded since then, which the changes table keeps for CHANGES_RETENTION_HOURS'''
+        return ChangeModel.deleted_since(CredentialModel.__tablename__, since)
+
     @staticmethod
     def find_all():
         return CredentialModel.query.all()
 
     @staticmethod
-    def get_by_uuid(uuid):
-        return CredentialModel.query.get(uuid)
+    def get_by_uuid(uuid, *options):
+        # not cached, see EntityCache
+        return CredentialModel.query.options(*options).get(uuid)
 
     @staticmethod
     def get_by_user_uuid(user_uuid):
         return CredentialModel.query.filter_by(user_uuid=user_uuid).first()
 
     def __generate_hash(self, password):
-        return bcrypt.generate_password_hash(password, rounds=10).decode('utf-8')
+        '''hashes in the bcrypt pool, raises PoolSaturated when it is busy'''
+        return hash_pool.generate_hash(password)
 
     def check_hash(self, password):
         '''checks given password against stored password hash'''
-        return bcrypt.check_password_hash(self.password, password)
+        return hash_pool.check_hash(self.password, password)
 
     def __repr(self):
         return '<uuid {}>'.format(self.uuid)
@@ -98,5 +153,13 @@ class CredentialSchema(Schema):
     user_info_last_login_failed_count = fields.DateTime(dump_to='userInfoLastLoginFailedCount', dump_only=True)
 
 
+class LoginSchema(Schema):
+    email_address = fields.Email(load_from='emailAddress')
+    user_uuid = fields.Str(load_from='userUuid')
+    password = fields.Str(required=True)
+
+
 credential_schema = CredentialSchema()
 credential_list_schema = CredentialSchema(many=True)
+login_schema = LoginSchema()
+password_schema = LoginSchema(only=['password'])
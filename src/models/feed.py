@@ -0,0 +1,195 @@
+# src/models/feed.py
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy.engine.url import make_url
+
+from ..metrics import registry
+from .change import ChangeModel
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'plaza_changes'
+
+# wakes a subscription that missed changes
+RESYNC = object()
+
+
+# the feeds of the process, the ASGI app adds its own
+feeds = []
+
+
+def _subscriber_count():
+    return {(): sum(len(feed.subscriptions) for feed in feeds)}
+
+
+feed_subscribers = registry.gauge(
+    'plaza_change_feed_subscribers', 'Open change feed streams of the worker', callback=_subscriber_count)
+feed_changes = registry.counter(
+    'plaza_change_feed_changes_total', 'Changes received on the LISTEN connection', labels=('category',))
+feed_overflows = registry.counter(
+    'plaza_change_feed_overflows_total', 'Changes not queued for a subscriber that fell behind, read again later')
+feed_reconnects = registry.counter(
+    'plaza_change_feed_reconnects_total', 'Times the LISTEN connection was lost and opened again')
+
+
+class TooManyStreams(Exception):
+    pass
+
+
+class Subscription(object):
+
+    def __init__(self, categories, size):
+        self.categories = frozenset(categories)
+        self.queue = queue.Queue(maxsize=size)
+        self.missed = False
+
+    def put(self, change):
+        try:
+            self.queue.put_nowait(change)
+        except queue.Full:
+            feed_overflows.inc()
+            # the full queue keeps waking the stream until it has caught up
+            self.missed = True
+
+    def miss(self):
+        self.missed = True
+        self.put(RESYNC)
+
+    def get(self, timeout):
+        '''returns the next change or RESYNC, None if there was none within timeout seconds'''
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def resync(self):
+        '''whether changes were missed since the last call, which must then be read from the changes table'''
+        missed, self.missed = self.missed, False
+        return missed
+
+
+class ChangeFeed(object):
+    """
+    Fans the changes published on the plaza_changes channel out to the
+    change streams of the worker. One connection per process LISTENs,
+    opened in a background thread on the first subscription (and again
+    after a fork). It must reach Postgres directly, as PgBouncer in
+    transaction mode doesn't keep LISTEN, so CHANGES_LISTEN_URL defaults to
+    DATABASE_URL. When a subscription's queue is full, or the connection was
+    (re)opened, the subscription is told to read what it missed from the
+    changes table. Each stream holds a thread of the server for as long as
+    it is open, so at most CHANGES_MAX_STREAMS are subscribed at once (None
+    for no limit), further ones fail with TooManyStreams. The ASGI app
+    serves streams on its event loop instead, see asgi.AsyncChangeFeed.
+    """
+
+    def __init__(self, app=None):
+        self.subscriptions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        feeds.append(self)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHANGES_LISTEN_URL', app.config.get('SQLALCHEMY_DATABASE_URI'))
+        app.config.setdefault('CHANGES_QUEUE_SIZE', 1000)
+        app.config.setdefault('CHANGES_RECONNECT_SECONDS', 5)
+        app.config.setdefault('CHANGES_MAX_STREAMS', None)
+
+        self.url = app.config['CHANGES_LISTEN_URL']
+        self.queue_size = app.config['CHANGES_QUEUE_SIZE']
+        self.reconnect_seconds = app.config['CHANGES_RECONNECT_SECONDS']
+        self.max_streams = app.config['CHANGES_MAX_STREAMS']
+        app.extensions['change_feed'] = self
+
+    def subscribe(self, categories):
+        subscription = Subscription(categories, self.queue_size)
+        with self._lock:
+            if self.max_streams is not None and len(self.subscriptions) >= self.max_streams:
+                raise TooManyStreams()
+            self.subscriptions.add(subscription)
+            if self._thread is None or self._pid != os.getpid():
+                self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions.discard(subscription)
+
+    def _start(self):
+        if psycopg2 is None:
+            raise RuntimeError('the change feed requires the psycopg2 package')
+        self._thread = threading.Thread(target=self._listen, name='change-feed', daemon=True)
+        self._pid = os.getpid()
+        self._thread.start()
+
+    def _connect(self):
+        url = make_url(self.url)
+        connection = psycopg2.connect(**dict(url.translate_connect_args(username='user', database='dbname'),
+                                             **url.query))
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        connection.cursor().execute('LISTEN {}'.format(CHANNEL))
+        return connection
+
+    def _listen(self):
+        connected = False
+        while True:
+            try:
+                connection = self._connect()
+            except psycopg2.Error:
+                logger.exception('opening the change feed connection failed')
+                time.sleep(self.reconnect_seconds)
+                continue
+            if connected:
+                feed_reconnects.inc()
+            # changes published before LISTEN, or while it was gone, are only
+            # in the table, also for streams subscribed before the first one
+            self._miss_all()
+            connected = True
+            try:
+                self._receive(connection)
+            except psycopg2.Error:
+                logger.exception('the change feed connection was lost')
+            finally:
+                connection.close()
+
+    def _receive(self, connection):
+        while True:
+            select.select([connection], [], [], self.reconnect_seconds)
+            connection.poll()
+            while connection.notifies:
+                notification = connection.notifies.pop(0)
+                change = ChangeModel.from_notification(json.loads(notification.payload))
+                feed_changes.inc(category=change.category)
+                self._publish(change)
+
+    def _publish(self, change):
+        with self._lock:
+            subscriptions = [subscription for subscription in self.subscriptions
+                             if change.category in subscription.categories]
+        for subscription in subscriptions:
+            subscription.put(change)
+
+    def _miss_all(self):
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.miss()
+
+
+change_feed = ChangeFeed()
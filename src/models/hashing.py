@@ -0,0 +1,122 @@
+# src/models/hashing.py
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+from ..metrics import registry
+
+hash_pool_depth = registry.gauge(
+    'plaza_hash_pool_depth', 'Password hash jobs running or queued in the bcrypt pool')
+hash_pool_rejected = registry.counter(
+    'plaza_hash_pool_rejected_total', 'Password hash jobs rejected because the bcrypt pool was saturated',
+    labels=('operation',))
+hash_duration = registry.histogram(
+    'plaza_hash_duration_seconds', 'Password hash job latency including queueing', labels=('operation',))
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def _generate_hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_hash(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        # stored value isn't a bcrypt hash
+        return False
+
+
+class HashPool(object):
+    """
+    Runs bcrypt in a dedicated process pool so hashing bursts don't block the
+    request threads. At most BCRYPT_POOL_WORKERS + BCRYPT_POOL_QUEUE jobs are
+    accepted at once, further jobs fail fast with PoolSaturated, as do jobs
+    not finished within BCRYPT_POOL_TIMEOUT seconds.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 10)
+        app.config.setdefault('BCRYPT_POOL_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('BCRYPT_POOL_QUEUE', 2 * app.config['BCRYPT_POOL_WORKERS'])
+        app.config.setdefault('BCRYPT_POOL_TIMEOUT', 5.0)
+
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['BCRYPT_POOL_WORKERS']
+        self.timeout = app.config['BCRYPT_POOL_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['BCRYPT_POOL_QUEUE'])
+        app.extensions['hash_pool'] = self
+
+    def _get_executor(self):
+        # the pool is created on first use and again after a fork, as worker
+        # processes of the parent are not usable in a child
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def reset(self):
+        '''drops the pool, e.g. in a freshly forked server worker'''
+        with self._lock:
+            self._executor = None
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            hash_pool_rejected.inc(operation=operation)
+            raise PoolSaturated()
+
+        hash_pool_depth.inc()
+        start = time.perf_counter()
+
+        def release(_):
+            hash_pool_depth.dec()
+            self._slots.release()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            hash_pool_rejected.inc(operation=operation)
+            raise PoolSaturated()
+        finally:
+            hash_duration.observe(time.perf_counter() - start, operation=operation)
+
+    def generate_hash(self, password):
+        return self._run('hash', _generate_hash, password, self.rounds)
+
+    def check_hash(self, pw_hash, password):
+        return self._run('check', _check_hash, pw_hash, password)
+
+    def check_dummy(self, password):
+        """
+        Checks password against a hash of a random password, at the rounds of
+        real hashes, and always fails. Run in place of check_hash when there
+        is no credential, so unknown users take as long to reject.
+        """
+        with self._lock:
+            if self._dummy_hash is None:
+                self._dummy_hash = _generate_hash(os.urandom(16).hex(), self.rounds)
+        self._run('check', _check_hash, self._dummy_hash, password)
+        return False
@@ -4,9 +4,14 @@ import datetime
 import sqlalchemy
 from marshmallow import fields, Schema
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy import or_
-from . import db
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy import func, literal
+from sqlalchemy.orm import aliased
+from . import db, entity_cache
+from .bulk import insert_ignoring_conflicts, reference_errors
+from .writes import insert_returning, update_returning, delete_returning, row_exists
+from .change import ChangeModel
+from .search import trigram_search
 
 ROLE_PLATFORM_OPERATOR = 'PLATFORM_OPERATOR'
 ROLE_CUSTOMER = 'CUSTOMER'
@@ -17,13 +22,23 @@ ROLE_BROKER = 'BROKER'
 class OrganisationModel(db.Model):
     __tablename__ = 'organisations'
     __table_args__ = (
+        db.Index('ix_organisations_created_at_id', 'created_at', 'id'),
+        db.Index('ix_organisations_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_organisations_supplier_uuid', 'supplier_uuid'),
+        db.Index('ix_organisations_country_code', 'country_code'),
+        db.Index('ix_organisations_email_address', 'email_address'),
+        db.Index('ix_organisations_roles', 'roles', postgresql_using='gin'),
+        db.Index('ix_organisations_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_organisations_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_organisations_customer_number_trgm', 'customer_number', postgresql_using='gin',
+                 postgresql_ops={'customer_number': 'gin_trgm_ops'}),
         db.UniqueConstraint('name', 'country_code', name='unique_organisation_name_and_country_code'),
     )
 
     uuid = db.Column('id', UUID(as_uuid=True), primary_key=True,
                      server_default=sqlalchemy.text('uuid_generate_v4()'))
-    created_at = db.Column(db.DateTime)
-    updated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
 
     name = db.Column(db.Text, nullable=False)
     roles = db.Column(ARRAY(db.Text))
@@ -69,16 +84,51 @@ class OrganisationModel(db.Model):
     def save(self):
         db.session.add(self)
         db.session.commit()
+        entity_cache.invalidate(OrganisationModel, self.uuid)
 
     def update(self, data):
         for key, item in data.items():
             setattr(self, key, item)
         self.updated_at = datetime.datetime.utcnow()
         db.session.commit()
+        entity_cache.invalidate(OrganisationModel, self.uuid)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        entity_cache.invalidate(OrganisationModel, self.uuid)
+
+    @staticmethod
+    def create(data):
+        '''inserts the loaded data in one statement, returns it or None if the name is taken in its country'''
+        return insert_returning(OrganisationModel(data), ['name', 'country_code'])
+
+    @staticmethod
+    def update_by_uuid(uuid, data, versions=None):
+        return update_returning(OrganisationModel, uuid, data, versions)
+
+    @staticmethod
+    def delete_by_uuid(uuid, versions=None):
+        return delete_returning(OrganisationModel, uuid, versions)
+
+    @staticmethod
+    def exists(uuid):
+        return row_exists(OrganisationModel, uuid)
+
+    @staticmethod
+    def tombstones(since):
+        '''returns the deletes recorded since then, which the changes table keeps for CHANGES_RETENTION_HOURS'''
+        return ChangeModel.deleted_since(OrganisationModel.__tablename__, since)
+
+    @staticmethod
+    def reference_errors(items):
+        '''returns the errors of the loaded items, by index, referencing a supplier that doesn't exist'''
+        return reference_errors(items, {'supplier_uuid': ('supplierUuid', OrganisationModel.uuid)})
+
+    @staticmethod
+    def insert_many(items):
+        '''inserts the loaded items in one statement, returns their uuids or None on conflict'''
+        return insert_ignoring_conflicts([OrganisationModel(data) for data in items], ['name', 'country_code'])
 
     @staticmethod
     def find_all():
@@ -86,18 +136,69 @@ class OrganisationModel(db.Model):
 
     @staticmethod
     def find_suppliers():
+        return OrganisationModel.query_suppliers().all()
+
+    @staticmethod
+    def search(text):
+        '''returns the query of organisations matching text in name, city or customer number, best first'''
+        return trigram_search(OrganisationModel.query, OrganisationModel, [
+            OrganisationModel.name, OrganisationModel.city, OrganisationModel.customer_number], text)
+
+    @staticmethod
+    def query_suppliers():
+        # && is served by the GIN index on roles, unlike = ANY(roles)
         return OrganisationModel.query.filter(
-            or_(OrganisationModel.roles.any('PLATFORM_OPERATOR'),
-                OrganisationModel.roles.any('SUPPLIER'))).all()
+            OrganisationModel.roles.overlap([ROLE_PLATFORM_OPERATOR, ROLE_SUPPLIER]))
 
     @staticmethod
-    def get_by_uuid(uuid):
-        return OrganisationModel.query.get(uuid)
+    def get_by_uuid(uuid, *options, cached=True):
+        return entity_cache.get(db.session, OrganisationModel, uuid,
+                                lambda: OrganisationModel.query.options(*options).get(uuid), cached)
 
     @staticmethod
     def get_by_name_and_country_code(name, country_code):
         return OrganisationModel.query.filter_by(name=name, country_code=country_code,).first()
 
+    @staticmethod
+    def customer_tree(uuid, max_depth=None):
+        '''
+        Returns a recursive CTE of (id, depth, path) rows walking the customers of
+        the given organisation down to max_depth levels, or all levels if None.
+        The organisation itself is the depth 0 row. Paths guard against cycles.
+        '''
+        tree = db.session.query(
+            OrganisationModel.uuid.label('id'),
+            literal(0).label('depth'),
+            array([OrganisationModel.uuid]).label('path')
+        ).filter(OrganisationModel.uuid == uuid).cte('customer_tree', recursive=True)
+
+        customer = aliased(OrganisationModel)
+        step = db.session.query(
+            customer.uuid,
+            tree.c.depth + 1,
+            func.array_append(tree.c.path, customer.uuid)
+        ).filter(customer.supplier_uuid == tree.c.id).filter(~tree.c.path.any(customer.uuid))
+        if max_depth is not None:
+            step = step.filter(tree.c.depth < max_depth)
+
+        return tree.union_all(step)
+
+    @staticmethod
+    def query_customers(uuid, max_depth=1):
+        if max_depth == 1:
+            return OrganisationModel.query.filter_by(supplier_uuid=uuid)
+
+        tree = OrganisationModel.customer_tree(uuid, max_depth)
+        return OrganisationModel.query.join(tree, OrganisationModel.uuid == tree.c.id).filter(tree.c.depth > 0)
+
+    @staticmethod
+    def find_customer_tree(uuid, max_depth=None, *options):
+        '''returns (organisation, depth) rows of the tree below uuid, ordered by depth'''
+        tree = OrganisationModel.customer_tree(uuid, max_depth)
+        return db.session.query(OrganisationModel, tree.c.depth).options(*options) \
+            .join(tree, OrganisationModel.uuid == tree.c.id) \
+            .order_by(tree.c.depth, OrganisationModel.created_at, OrganisationModel.uuid).all()
+
     def __repr(self):
         return '<uuid {}>'.format(self.uuid)
 
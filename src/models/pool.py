@@ -0,0 +1,122 @@
+# src/models/pool.py
+
+import time
+import weakref
+
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from ..metrics import registry
+
+_pools = weakref.WeakSet()
+
+
+def _pool_connections():
+    values = {}
+    for pool in list(_pools):
+        for state, count in (('checked_out', pool.checkedout()), ('idle', pool.checkedin()),
+                             ('overflow', max(pool.overflow(), 0))):
+            values[(state,)] = values.get((state,), 0) + count
+    return values
+
+
+def _pool_capacity():
+    return {(): sum(pool.size() + max(pool._max_overflow, 0) for pool in list(_pools))}
+
+
+pool_connections = registry.gauge(
+    'plaza_db_pool_connections', 'Database connections of the pool by state, overflow ones count as checked out too',
+    labels=('state',), callback=_pool_connections)
+pool_capacity = registry.gauge(
+    'plaza_db_pool_capacity', 'Database connections the pool may open, pool size plus max overflow',
+    callback=_pool_capacity)
+pool_wait = registry.histogram(
+    'plaza_db_pool_wait_seconds', 'Time spent waiting to check out a database connection',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+pool_timeouts = registry.counter(
+    'plaza_db_pool_timeouts_total', 'Checkouts that failed because no connection was free within DB_POOL_TIMEOUT')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool recording how long checkouts wait for a connection, and whose
+    size and usage are reported on /metrics.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        except PoolTimeout:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_wait.observe(time.perf_counter() - start)
+
+
+def engine_options(config):
+    '''returns the SQLALCHEMY_ENGINE_OPTIONS for the DB_* settings of config'''
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    # PgBouncer in transaction mode rejects the options startup parameter and
+    # hands every transaction to another server connection, so the timeout is
+    # set per transaction instead
+    if config['DB_STATEMENT_TIMEOUT'] and not config['DB_PGBOUNCER']:
+        options['connect_args'] = {'options': '-c statement_timeout={:d}'.format(config['DB_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def _set_local_statement_timeout(session, transaction, connection):
+    # listening on every SignallingSession, also of apps not set up by init_app
+    config = session.app.config
+    if config.get('DB_PGBOUNCER') and config.get('DB_STATEMENT_TIMEOUT'):
+        connection.execute('SET LOCAL statement_timeout = {:d}'.format(config['DB_STATEMENT_TIMEOUT']))
+
+
+def init_app(app):
+    """
+    Sizes the connection pool and applies the statement timeout (milliseconds,
+    0 disables it) from the DB_* settings. With DB_PGBOUNCER the database is
+    reached through PgBouncer in transaction pooling mode, where no session
+    state survives a transaction.
+    """
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('DB_STATEMENT_TIMEOUT', 0)
+    app.config.setdefault('DB_PGBOUNCER', False)
+
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    if not event.contains(SignallingSession, 'after_begin', _set_local_statement_timeout):
+        event.listen(SignallingSession, 'after_begin', _set_local_statement_timeout)
+
+
+def dispose_engines(app):
+    """
+    Closes the pooled connections of every engine of app, the primary and the
+    replica binds. A forked server worker calls it before its first request,
+    so that it opens its own connections instead of sharing the sockets of
+    its parent.
+    """
+    state = app.extensions.get('sqlalchemy')
+    if state is None:
+        return
+    for connector in list(state.connectors.values()):
+        connector.get_engine().dispose()
@@ -0,0 +1,166 @@
+# src/models/replicas.py
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.exc import DBAPIError
+
+from ..metrics import registry
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'plaza_primary_until'
+
+replica_reads = registry.counter(
+    'plaza_db_replica_requests_total', 'Requests by the database they read from', labels=('bind',))
+replica_failures = registry.counter(
+    'plaza_db_replica_failures_total', 'Connection failures that took a replica out of rotation', labels=('bind',))
+replica_retries = registry.counter(
+    'plaza_db_replica_retries_total', 'Requests run again on the primary after their replica failed', labels=('bind',))
+
+
+class Replicas(object):
+    """
+    Routes the reads of safe requests (GET, HEAD, OPTIONS) round-robin to the
+    DB_REPLICA_URLS, everything else goes to the primary. A replica failing
+    to connect is skipped for DB_REPLICA_RETRY_SECONDS, and the request that
+    hit the failure runs again on the primary. After a successful write a
+    client reads from the primary for DB_REPLICA_STICKY_SECONDS, so it sees
+    its own writes despite replication lag.
+    """
+
+    def __init__(self, app=None):
+        self._down_until = {}
+        self._listened = set()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DB_REPLICA_URLS', [])
+        app.config.setdefault('DB_REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('DB_REPLICA_RETRY_SECONDS', 30)
+
+        self.retry_seconds = app.config['DB_REPLICA_RETRY_SECONDS']
+        self.names = ['replica-{}'.format(index) for index in range(len(app.config['DB_REPLICA_URLS']))]
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', None) or {}
+        binds.update(zip(self.names, app.config['DB_REPLICA_URLS']))
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['replicas'] = self
+
+        if self.names:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            app.register_error_handler(DBAPIError, self._retry_on_primary)
+
+    def _start_request(self):
+        g.db_bind = None
+        if request.method in READ_METHODS and not self._is_sticky():
+            g.db_bind = self._next_healthy()
+        replica_reads.inc(bind=g.db_bind or 'primary')
+
+    def _finish_request(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            sticky = current_app.config['DB_REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + sticky) + 1), max_age=sticky, httponly=True)
+        return response
+
+    @staticmethod
+    def _is_sticky():
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _next_healthy(self):
+        start = next(self._counter)
+        now = time.monotonic()
+        for offset in range(len(self.names)):
+            name = self.names[(start + offset) % len(self.names)]
+            if self._down_until.get(name, 0) <= now:
+                return name
+        return None
+
+    def _mark_down(self, name):
+        self._down_until[name] = time.monotonic() + self.retry_seconds
+        replica_failures.inc(bind=name)
+
+    def _retry_on_primary(self, error):
+        """
+        Dispatches the request again reading from the primary if its replica
+        failed, safe requests have no effects to repeat. Other errors are
+        raised again, as are failures of streamed responses, which happen
+        after the handlers are done.
+        """
+        name = g.pop('db_replica_failed', None)
+        if name is None or g.get('db_bind') != name:
+            raise error
+        # drops the session holding the broken connection
+        current_app.extensions['sqlalchemy'].db.session.remove()
+        g.db_bind = None
+        replica_retries.inc(bind=name)
+        return current_app.dispatch_request()
+
+    def engine(self, db, app, name):
+        engine = db.get_engine(app, bind=name)
+        if name not in self._listened:
+            with self._lock:
+                if name not in self._listened:
+                    event.listen(engine, 'handle_error', self._error_listener(name))
+                    self._listened.add(name)
+        return engine
+
+    def _error_listener(self, name):
+        def handle_error(context):
+            # connect failures come without a connection
+            if context.connection is None or context.is_disconnect:
+                self._mark_down(name)
+                if has_app_context():
+                    g.db_replica_failed = name
+        return handle_error
+
+
+def _routed_bind():
+    if not has_app_context() or g.get('db_primary'):
+        return None
+    return g.get('db_bind')
+
+
+@contextmanager
+def use_primary():
+    '''reads from the primary within the block, also in a request routed to a replica'''
+    if not has_app_context():
+        yield
+        return
+    previous = g.get('db_primary')
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+class RoutingSession(SignallingSession):
+    '''session reading from the replica chosen for the request, flushes always go to the primary'''
+
+    def __init__(self, db, autocommit=False, autoflush=True, **options):
+        self._db = db
+        super(RoutingSession, self).__init__(db, autocommit=autocommit, autoflush=autoflush, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        name = _routed_bind()
+        if name is not None and not self._flushing:
+            return self.app.extensions['replicas'].engine(self._db, self.app, name)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''flask-sqlalchemy with sessions routing reads to the replicas'''
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
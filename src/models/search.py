@@ -0,0 +1,26 @@
+# src/models/search.py
+
+from sqlalchemy import func, or_
+
+# trigram indexes can't serve shorter search terms
+MIN_SEARCH_LENGTH = 3
+
+
+def escape_like(value):
+    # backslash is PostgreSQL's default LIKE escape character
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def trigram_search(query, model, columns, text):
+    """
+    Restricts query to rows where one of columns contains text or is similar
+    to it (pg_trgm's % operator), best matches first. Both conditions are
+    served by the gin_trgm_ops index of each column, the rank is the best
+    word similarity of text to any of the columns.
+    """
+    pattern = '%{}%'.format(escape_like(text))
+    match = or_(*[condition for column in columns
+                  # %% is the % operator, escaped for the driver's paramstyle
+                  for condition in (column.ilike(pattern), column.op('%%')(text))])
+    rank = func.greatest(*[func.word_similarity(text, column) for column in columns])
+    return query.filter(match).order_by(rank.desc(), model.uuid)
@@ -4,17 +4,32 @@ import datetime
 import sqlalchemy
 from marshmallow import fields, Schema
 from sqlalchemy.dialects.postgresql import UUID
-from . import db
-from .organisation import OrganisationSchema
+from . import db, entity_cache
+from .bulk import insert_ignoring_conflicts, reference_errors
+from .writes import insert_returning, update_returning, delete_returning, row_exists
+from .change import ChangeModel
+from .search import trigram_search
+from .organisation import OrganisationModel, OrganisationSchema
 from .credential import CredentialSchema
 
 class UserModel(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+        db.Index('ix_users_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_users_organisation_id', 'organisation_id'),
+        db.Index('ix_users_first_name_trgm', 'first_name', postgresql_using='gin',
+                 postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        db.Index('ix_users_last_name_trgm', 'last_name', postgresql_using='gin',
+                 postgresql_ops={'last_name': 'gin_trgm_ops'}),
+        db.Index('ix_users_email_address_trgm', 'email_address', postgresql_using='gin',
+                 postgresql_ops={'email_address': 'gin_trgm_ops'}),
+    )
 
     uuid = db.Column('id', UUID(as_uuid=True), primary_key=True,
                      server_default=sqlalchemy.text('uuid_generate_v4()'))
-    created_at = db.Column(db.DateTime)
-    updated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
 
     username = db.Column(db.String(320), nullable=False)
     email_address = db.Column(db.String(320), unique=True, nullable=False)
@@ -48,16 +63,51 @@ class UserModel(db.Model):
     def save(self):
         db.session.add(self)
         db.session.commit()
+        entity_cache.invalidate(UserModel, self.uuid)
 
     def update(self, data):
         for key, item in data.items():
             setattr(self, key, item)
         self.updated_at = datetime.datetime.utcnow()
         db.session.commit()
+        entity_cache.invalidate(UserModel, self.uuid)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        entity_cache.invalidate(UserModel, self.uuid)
+
+    @staticmethod
+    def create(data):
+        '''inserts the loaded data in one statement, returns it or None if the email address is taken'''
+        return insert_returning(UserModel(data), ['email_address'])
+
+    @staticmethod
+    def update_by_uuid(uuid, data, versions=None):
+        return update_returning(UserModel, uuid, data, versions)
+
+    @staticmethod
+    def delete_by_uuid(uuid, versions=None):
+        return delete_returning(UserModel, uuid, versions)
+
+    @staticmethod
+    def exists(uuid):
+        return row_exists(UserModel, uuid)
+
+    @staticmethod
+    def tombstones(since):
+        '''returns the deletes recorded since then, which the changes table keeps for CHANGES_RETENTION_HOURS'''
+        return ChangeModel.deleted_since(UserModel.__tablename__, since)
+
+    @staticmethod
+    def reference_errors(items):
+        '''returns the errors of the loaded items, by index, referencing an organisation that doesn't exist'''
+        return reference_errors(items, {'organisation_uuid': ('organisationUuid', OrganisationModel.uuid)})
+
+    @staticmethod
+    def insert_many(items):
+        '''inserts the loaded items in one statement, returns their uuids or None on conflict'''
+        return insert_ignoring_conflicts([UserModel(data) for data in items], ['email_address'])
 
     @staticmethod
     def find_all():
@@ -68,8 +118,15 @@ class UserModel(db.Model):
     #    return UserModel.query.filter_by(organisation_uuid=value)
 
     @staticmethod
-    def get_by_uuid(uuid):
-        return UserModel.query.get(uuid)
+    def get_by_uuid(uuid, *options, cached=True):
+        return entity_cache.get(db.session, UserModel, uuid,
+                                lambda: UserModel.query.options(*options).get(uuid), cached)
+
+    @staticmethod
+    def search(text):
+        '''returns the query of users matching text in first or last name or email address, best first'''
+        return trigram_search(UserModel.query, UserModel, [
+            UserModel.first_name, UserModel.last_name, UserModel.email_address], text)
 
     @staticmethod
     def get_by_email_address(value):
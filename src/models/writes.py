@@ -0,0 +1,99 @@
+# src/models/writes.py
+
+import datetime
+import uuid as uuid_lib
+
+from sqlalchemy import and_, delete, false, inspect, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from . import db, entity_cache
+from .bulk import column_values
+from .cache import hydrate
+
+
+def _parse_uuid(value):
+    try:
+        return uuid_lib.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _identified(model, uuid, versions):
+    '''returns the where clause of the row uuid, if versions is not None at one of these updated_at versions'''
+    table = model.__table__
+    if versions is None:
+        return table.c.id == uuid
+    if not versions:
+        return false()
+    return and_(table.c.id == uuid, or_(*[table.c.updated_at.is_(None) if version is None
+                                          else table.c.updated_at == version for version in versions]))
+
+
+def _execute(model, stmt):
+    """
+    Executes a statement returning at most one row of model and commits.
+    Returns the row as a persistent instance, or None if there was none.
+    """
+    row = db.session.execute(stmt).first()
+    db.session.commit()
+    if row is None:
+        return None
+    entity_cache.invalidate(model, row[model.__table__.c.id])
+    mapper = inspect(model)
+    # hydrated after the commit, which would expire it
+    return hydrate(db.session, model, {mapper.get_property_by_column(column).key: row[column]
+                                       for column in model.__table__.columns})
+
+
+def insert_returning(instance, index_elements):
+    """
+    Inserts the model instance with one INSERT ... ON CONFLICT DO NOTHING
+    RETURNING statement and commits. Returns the stored instance, or None if
+    it conflicts with a stored row on the unique index_elements.
+    """
+    table = instance.__table__
+    stmt = insert(table).values(column_values(instance)) \
+        .on_conflict_do_nothing(index_elements=[table.c[name] for name in index_elements]) \
+        .returning(*table.columns)
+    return _execute(type(instance), stmt)
+
+
+def update_returning(model, uuid, data, versions=None):
+    """
+    Sets the attributes in data and updated_at of the row uuid with one
+    UPDATE ... RETURNING statement and commits. If versions is not None only a
+    row at one of these updated_at versions is updated. Returns the updated
+    instance, or None if no row matched.
+    """
+    uuid = _parse_uuid(uuid)
+    if uuid is None:
+        return None
+    columns = {prop.key: prop.columns[0] for prop in inspect(model).column_attrs}
+    values = {columns[key]: value for key, value in data.items() if key in columns}
+    values[columns['updated_at']] = datetime.datetime.utcnow()
+
+    table = model.__table__
+    stmt = update(table).where(_identified(model, uuid, versions)).values(values).returning(*table.columns)
+    return _execute(model, stmt)
+
+
+def delete_returning(model, uuid, versions=None):
+    """
+    Deletes the row uuid with one DELETE ... RETURNING statement and commits.
+    If versions is not None only a row at one of these updated_at versions is
+    deleted. Returns whether a row was deleted.
+    """
+    uuid = _parse_uuid(uuid)
+    if uuid is None:
+        return False
+    table = model.__table__
+    row = db.session.execute(delete(table).where(_identified(model, uuid, versions)).returning(table.c.id)).first()
+    db.session.commit()
+    if row is None:
+        return False
+    entity_cache.invalidate(model, uuid)
+    return True
+
+
+def row_exists(model, uuid):
+    uuid = _parse_uuid(uuid)
+    return uuid is not None and db.session.query(model.uuid).filter(model.uuid == uuid).first() is not None
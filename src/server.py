@@ -0,0 +1,54 @@
+# /src/server.py
+
+import logging
+import os
+import resource
+
+from .models import hash_pool, pool
+
+logger = logging.getLogger(__name__)
+
+
+def rss_megabytes():
+    '''returns the resident set size of the current process'''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        # the peak instead, kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_after_fork(app):
+    """
+    Drops the state a forked worker must not share with its parent, the
+    database connections and the bcrypt process pool. Both are opened again
+    on first use.
+    """
+    pool.dispose_engines(app)
+    hash_pool.reset()
+
+
+def over_memory_limit(app):
+    limit = app.config.get('SERVER_MAX_MEMORY_MB', 0)
+    return bool(limit) and rss_megabytes() > limit
+
+
+# gunicorn server hooks, see gunicorn.conf.py
+
+def pre_fork(server, worker):
+    # connections the master opened while loading the app are closed here,
+    # not in the workers where the sockets would be shared
+    pool.dispose_engines(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    reset_after_fork(server.app.wsgi())
+
+
+def post_request(worker, req, environ, resp):
+    if worker.alive and over_memory_limit(worker.wsgi):
+        logger.warning('worker %s exceeds SERVER_MAX_MEMORY_MB with %.0f MB, restarting it', worker.pid,
+                       rss_megabytes())
+        # stops accepting, in-flight requests are finished before it exits
+        worker.alive = False
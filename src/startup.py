@@ -0,0 +1,139 @@
+# /src/startup.py
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+# top level packages and the subsystem their import time is reported under,
+# modules they import in turn (e.g. the stdlib) count towards them as well
+SUBSYSTEMS = {
+    'flask': 'flask', 'werkzeug': 'flask', 'jinja2': 'flask', 'itsdangerous': 'flask', 'click': 'flask',
+    'markupsafe': 'flask', 'flask_cors': 'flask', 'flask_script': 'flask', 'flask_migrate': 'flask',
+    'sqlalchemy': 'sqlalchemy', 'flask_sqlalchemy': 'sqlalchemy', 'psycopg2': 'sqlalchemy',
+    'marshmallow': 'marshmallow',
+    'bcrypt': 'bcrypt', 'flask_bcrypt': 'bcrypt',
+    'redis': 'optional', 'orjson': 'optional', 'brotli': 'optional', 'asyncpg': 'optional',
+}
+
+# run in a fresh interpreter, so nothing is imported yet
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from src.app import BLUEPRINTS, create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+# below the first API prefix, so lazy mode loads the blueprint it deferred,
+# the path matches none of its routes and so needs no database
+app.test_client().get(BLUEPRINTS[0][0] + '/startup-probe/not-found')
+served = time.time()
+first_request = time.perf_counter()
+blueprints = app.extensions['lazy_blueprints']
+loaded = sorted(blueprints.load_times)
+blueprints.load_all()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first_request - created) * 1000,
+    'served_at': served,
+    'lazy_blueprints': app.config['LAZY_BLUEPRINTS'] and not app.debug,
+    'first_request_blueprints': loaded,
+    'blueprints_ms': {prefix: seconds * 1000 for prefix, seconds in blueprints.load_times.items()},
+}))
+'''
+
+
+class StartupBudgetExceeded(Exception):
+    pass
+
+
+def subsystem(module):
+    if module == 'src' or module.startswith('src.'):
+        parts = module.split('.')
+        return parts[1] if len(parts) > 2 and parts[1] in ('api', 'models') else 'app'
+    return SUBSYSTEMS.get(module.split('.')[0])
+
+
+def parse_importtime(output):
+    """
+    Returns the import time in milliseconds per subsystem from the output of
+    python -X importtime. The self time of every module counts towards the
+    closest module above it in the import tree (or itself) which belongs to
+    a subsystem, interpreter startup and unattributed imports to python.
+    """
+    nodes = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            own, _, name = line[len('import time:'):].split('|')
+            own = int(own)
+        except ValueError:
+            # the header
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        # lines come after the ones of the modules they imported
+        children = []
+        while nodes and nodes[-1][0] > depth:
+            children.insert(0, nodes.pop())
+        nodes.append((depth, name.strip(), own, children))
+
+    totals = {}
+
+    def attribute(node, owner):
+        _, name, own, children = node
+        owner = subsystem(name) or owner
+        totals[owner] = totals.get(owner, 0.0) + own / 1000
+        for child in children:
+            attribute(child, owner)
+
+    for node in nodes:
+        attribute(node, 'python')
+    return totals
+
+
+def profile_startup(env_name, lazy_blueprints=None):
+    """
+    Starts the app in a new interpreter and returns where the time until its
+    first request went: import time per subsystem, create_app, the first
+    request and loading each blueprint. start_to_first_request_ms includes
+    the interpreter's startup, measured from spawning it, importtime adds a
+    little overhead on top.
+    """
+    env = dict(os.environ)
+    if lazy_blueprints is not None:
+        env['LAZY_BLUEPRINTS'] = '1' if lazy_blueprints else '0'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    spawned = time.time()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE, env_name], cwd=root, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError('starting the app failed:\n{}'.format(result.stderr[-2000:]))
+
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    profile['start_to_first_request_ms'] = (profile.pop('served_at') - spawned) * 1000
+    profile['imports_ms'] = parse_importtime(result.stderr)
+    return profile
+
+
+def check_budget(profile, budget_ms):
+    '''raises StartupBudgetExceeded if the first request was served later than budget_ms after start'''
+    if profile['start_to_first_request_ms'] > budget_ms:
+        raise StartupBudgetExceeded('first request served after {:.0f}ms, the budget is {}ms'.format(
+            profile['start_to_first_request_ms'], budget_ms))
+
+
+def format_profile(profile):
+    lines = ['imports']
+    for name, ms in sorted(profile['imports_ms'].items(), key=lambda item: -item[1]):
+        lines.append('  {:<24} {:8.1f}ms'.format(name, ms))
+    lines.append('{:<26} {:8.1f}ms'.format('create_app', profile['create_app_ms']))
+    lines.append('{:<26} {:8.1f}ms'.format('first request', profile['first_request_ms']))
+    lines.append('blueprints ({})'.format('lazy, on first request' if profile['lazy_blueprints'] else 'eager'))
+    for prefix, ms in sorted(profile['blueprints_ms'].items()):
+        lines.append('  {:<24} {:8.1f}ms'.format(prefix, ms))
+    lines.append('{:<26} {:8.1f}ms'.format('start to first request', profile['start_to_first_request_ms']))
+    return '\n'.join(lines)
@@ -0,0 +1,22 @@
+"""
+The app of the tests that need no database. Its database URL is never
+connected to, the tests stand in for what would be read from it.
+"""
+
+import pytest
+
+from src.app import create_app
+
+DATABASE_URL = 'postgresql://plaza@localhost:1/plaza'
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app('development')
+    app.config.update(SQLALCHEMY_DATABASE_URI=DATABASE_URL, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
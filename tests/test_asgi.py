@@ -0,0 +1,204 @@
+"""
+The ASGI app against the Flask app, see src/asgi.py. Requests served on the
+event loop must be answered like the Flask app answers them, the database
+of both is stood in for by the same rows.
+"""
+
+import asyncio
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from sqlalchemy import inspect
+
+from src.app import create_app
+from src.asgi import AsgiApp
+from src.models.credential import CredentialModel
+from src.models.organisation import OrganisationModel
+from src.models.user import UserModel
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+# never connected to, statements are only compiled for it
+DATABASE_URL = 'postgresql://plaza@localhost:1/plaza'
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app('development')
+    app.config.update(SQLALCHEMY_DATABASE_URI=DATABASE_URL, ASYNC_DATABASE_URL=DATABASE_URL,
+                      CHANGES_LISTEN_URL=DATABASE_URL)
+    return app
+
+
+@pytest.fixture
+def asgi_app(app):
+    return AsgiApp(app)
+
+
+def user():
+    model = UserModel({'username': 'jane', 'email_address': 'jane@plaza.example', 'first_name': 'Jane',
+                       'last_name': 'Doe', 'registered_at': NOW})
+    model.uuid, model.created_at, model.updated_at = uuid.uuid4(), NOW, NOW
+    model.phone_number = model.confirmation_code = None
+    model.preferred_language, model.is_confirmed = 'en_US', False
+
+    organisation = OrganisationModel({'name': 'Plaza', 'roles': ['supplier'], 'email_address': 'info@plaza.example'})
+    organisation.uuid, organisation.created_at, organisation.updated_at = uuid.uuid4(), NOW, NOW
+    organisation.city, organisation.country_code, organisation.is_validated = 'Berlin', 'DE', True
+    for name in ('supplier_uuid', 'customer_number', 'phone_number', 'address1', 'address2', 'postal_code', 'state'):
+        setattr(organisation, name, None)
+    model.organisation_uuid, model.organisation = str(organisation.uuid), organisation
+
+    credential = CredentialModel({'user_uuid': str(model.uuid), 'is_locked': False, 'is_expired': False,
+                                  'last_login_at': NOW})
+    credential.uuid, credential.created_at, credential.updated_at = uuid.uuid4(), NOW, NOW
+    for name in ('password', 'password_set_at', 'last_logout_at', 'user_info_last_login_at',
+                 'user_info_last_login_failed_at', 'user_info_last_login_failed_count'):
+        setattr(credential, name, None)
+    model.credential = credential
+    return model
+
+
+def record(instance):
+    '''the row of instance as asyncpg returns it'''
+    mapper = inspect(type(instance))
+    return {column.name: getattr(instance, mapper.get_property_by_column(column).key)
+            for column in type(instance).__table__.c}
+
+
+def call(asgi_app, path, query='', headers=()):
+    '''returns the status, headers and body the ASGI app sends for a GET'''
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'query_string': query.encode('ascii'),
+             'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+             'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000)}
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(asgi_app(scope, receive, send))
+    finally:
+        loop.close()
+    start = messages[0]
+    headers = sorted((name.decode('latin-1'), value.decode('latin-1')) for name, value in start['headers']
+                     if name != b'server-timing')
+    return start['status'], headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def call_flask(app, path, query='', headers=()):
+    response = app.test_client().get(path, query_string=query, headers=list(headers))
+    # Server-Timing differs by the durations only
+    headers = sorted((name.lower(), value) for name, value in response.headers if name != 'Server-Timing')
+    return response.status_code, headers, response.get_data()
+
+
+def fetching(*users):
+    """
+    A stand-in for AsyncDatabase.fetch returning the rows of users, their
+    organisations and credentials from the table a statement reads.
+    """
+    rows = {'users': [record(stored) for stored in users],
+            'organisations': [record(stored.organisation) for stored in users],
+            'credentials': [record(stored.credential) for stored in users]}
+
+    async def fetch(statement, timings=None):
+        return rows[statement.froms[0].name]
+    return fetch
+
+
+@pytest.mark.parametrize('query', ['', 'fields=username,emailAddress', 'include=organisation&fields=uuid',
+                                   'include='])
+def test_reads_are_answered_alike(app, asgi_app, query):
+    stored = user()
+    path = '/api/v1/users/{}'.format(stored.uuid)
+
+    with mock.patch.object(asgi_app.database, 'fetch', fetching(stored)):
+        native = call(asgi_app, path, query)
+    with mock.patch.object(UserModel, 'get_by_uuid', return_value=stored):
+        assert native == call_flask(app, path, query)
+    assert native[0] == 200
+
+
+def test_not_found_is_answered_alike(app, asgi_app):
+    path = '/api/v1/users/{}'.format(uuid.uuid4())
+
+    with mock.patch.object(asgi_app.database, 'fetch', fetching()):
+        native = call(asgi_app, path)
+    with mock.patch.object(UserModel, 'get_by_uuid', return_value=None):
+        assert native == call_flask(app, path)
+    assert native[0] == 404
+
+
+@pytest.mark.parametrize('path, query', [
+    ('/api/v1/users/', 'sort=password'),
+    ('/api/v1/accounts/', 'limit=0'),
+    ('/api/v1/organisations/', 'supplierUuid=plaza'),
+    ('/api/v1/credentials/{}'.format(uuid.UUID(int=1)), 'fields=password'),
+])
+def test_argument_errors_are_answered_alike(app, asgi_app, path, query):
+    native = call(asgi_app, path, query)
+
+    assert native == call_flask(app, path, query)
+    assert native[0] == 400
+
+
+def test_routes_of_the_flask_app_are_answered_alike(app, asgi_app):
+    assert call(asgi_app, '/') == call_flask(app, '/')
+
+
+def test_request_teardown_runs_once(app, asgi_app):
+    stored = user()
+    calls = []
+    app.teardown_request_funcs.setdefault(None, []).append(lambda error: calls.append('request'))
+    app.teardown_appcontext_funcs.append(lambda error: calls.append('app'))
+    try:
+        with mock.patch.object(asgi_app.database, 'fetch', fetching(stored)):
+            status, _, _ = call(asgi_app, '/api/v1/users/{}'.format(stored.uuid), 'include=organisation',
+                                headers=[('If-None-Match', '"stale"')])
+    finally:
+        app.teardown_request_funcs[None].pop()
+        app.teardown_appcontext_funcs.pop()
+
+    assert status == 200
+    assert calls == ['request', 'app']
+
+
+def test_concurrent_requests_keep_their_context(asgi_app):
+    users = [user(), user()]
+
+    async def fetch(statement, timings=None):
+        # the other request runs meanwhile, on the same thread
+        await asyncio.sleep(0.01)
+        return [record(stored) for stored in users
+                if str(stored.uuid) in str(statement.compile(compile_kwargs={'literal_binds': True}))]
+
+    async def request(stored):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/users/{}'.format(stored.uuid),
+                 'query_string': b'include=', 'headers': []}
+        await asgi_app(scope, receive, send)
+        return messages[1]['body']
+
+    async def both():
+        return await asyncio.gather(*(request(stored) for stored in users))
+
+    loop = asyncio.new_event_loop()
+    try:
+        with mock.patch.object(asgi_app.database, 'fetch', fetch):
+            bodies = loop.run_until_complete(both())
+    finally:
+        loop.close()
+    for stored, body in zip(users, bodies):
+        assert str(stored.uuid).encode('ascii') in body
@@ -0,0 +1,81 @@
+"""
+Lazily registered blueprints, see src/blueprints.py
+"""
+
+import pytest
+from flask import Blueprint, Flask, request
+from werkzeug.routing import Map
+
+from src.blueprints import LazyBlueprints, check_map
+
+probe_api = Blueprint('probe', __name__)
+
+
+@probe_api.route('/ping', methods=['GET'])
+def ping():
+    return 'pong'
+
+
+def create_app(lazy=True, debug=False):
+    app = Flask(__name__)
+    app.config.update(LAZY_BLUEPRINTS=lazy, DEBUG=debug)
+    blueprints = LazyBlueprints(app, [('/probe', __name__, 'probe_api')])
+
+    @app.route('/', methods=['GET'])
+    def index():
+        return 'index'
+
+    return app, blueprints
+
+
+def test_blueprint_is_registered_on_the_first_request_below_its_prefix():
+    app, blueprints = create_app()
+    client = app.test_client()
+
+    assert client.get('/').data == b'index'
+    assert '/probe' in blueprints.pending
+
+    assert client.get('/probe/ping').data == b'pong'
+    assert not blueprints.pending
+    assert '/probe' in blueprints.load_times
+
+
+def test_blueprints_are_registered_right_away_unless_lazy():
+    for app, blueprints in (create_app(lazy=False), create_app(lazy=True, debug=True)):
+        assert not blueprints.pending
+        assert app.test_client().get('/probe/ping').data == b'pong'
+
+
+def test_requests_match_against_a_copy_while_a_blueprint_is_registered():
+    app, blueprints = create_app()
+    client = app.test_client()
+    assert client.get('/').data == b'index'
+
+    matched = []
+    add = app.url_map.add
+
+    def add_and_match(rule):
+        add(rule)
+        # as another thread matching a request in the middle of the load
+        with app.test_request_context('/probe/ping'):
+            matched.append(request.url_rule)
+
+    app.url_map.add = add_and_match
+    assert client.get('/probe/ping').data == b'pong'
+
+    # the copy had no probe routes yet, and app.url_map itself is never matched against
+    assert matched == [None]
+    assert blueprints.url_map is not app.url_map
+    assert client.get('/').data == b'index'
+
+
+def test_unsupported_werkzeug_maps_fail_loudly():
+    class RewrittenMap(Map):
+        def __init__(self):
+            super(RewrittenMap, self).__init__()
+            del self._rules
+
+    check_map(Map)
+    with pytest.raises(ImportError) as error:
+        check_map(RewrittenMap)
+    assert '_rules' in str(error.value)
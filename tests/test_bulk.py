@@ -0,0 +1,98 @@
+"""
+Bulk creates and their per item results, see src/api/utils.py bulk_results
+"""
+
+import uuid
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+
+from src.api.utils import BULK_MAX_ITEMS, bulk_results
+from src.models.account import AccountModel
+from src.models.bulk import reference_errors
+from src.models.organisation import OrganisationModel
+from src.models.user import UserModel
+
+
+def user(index):
+    return {'username': 'user{}'.format(index), 'emailAddress': 'user{}@plaza.example'.format(index),
+            'lastName': 'Doe', 'organisationUuid': str(uuid.uuid4())}
+
+
+def test_results_are_in_request_order():
+    created = uuid.uuid4()
+    results = bulk_results(4, {3: {'name': ['missing']}, 0: {'name': ['missing']}}, [2, 1], [None, created])
+
+    assert results == [
+        {'index': 0, 'status': 'invalid', 'errors': {'name': ['missing']}},
+        {'index': 1, 'status': 'created', 'uuid': str(created)},
+        {'index': 2, 'status': 'conflict'},
+        {'index': 3, 'status': 'invalid', 'errors': {'name': ['missing']}},
+    ]
+
+
+def test_empty_bulk():
+    assert bulk_results(0, {}, [], []) == []
+
+
+def test_missing_references_are_invalid(app):
+    found, missing = uuid.uuid4(), uuid.uuid4()
+    items = {0: {'organisation_uuid': str(found).upper()}, 1: {'organisation_uuid': str(missing)},
+             2: {'organisation_uuid': 'plaza'}, 3: {}}
+    with app.app_context(), mock.patch('src.models.db.session.query') as query:
+        query.return_value.filter.return_value = [(found,)]
+        errors = reference_errors(items, {'organisation_uuid': ('organisationUuid', OrganisationModel.uuid)})
+
+    assert errors == {1: {'organisationUuid': ['{} does not exist'.format(missing)]},
+                      2: {'organisationUuid': ['plaza does not exist']}}
+    # the column is looked up once, without the unparseable uuid
+    query.assert_called_once_with(OrganisationModel.uuid)
+
+
+def test_bulk_maps_every_item(client):
+    created = uuid.uuid4()
+    items = [user(0), {'username': 'broken'}, user(2), user(3)]
+    with mock.patch.object(UserModel, 'reference_errors',
+                           return_value={3: {'organisationUuid': ['does not exist']}}) as references, \
+            mock.patch.object(UserModel, 'insert_many', return_value=[created, None]) as insert_many:
+        response = client.post('/api/v1/users/bulk', json=items)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['type'] == 'BulkResultListV1'
+    assert body['count'] == 4
+    assert [(result['index'], result['status']) for result in body['members']] == \
+        [(0, 'created'), (1, 'invalid'), (2, 'conflict'), (3, 'invalid')]
+    assert body['members'][0]['uuid'] == str(created)
+    assert 'emailAddress' in body['members'][1]['errors']
+    assert body['members'][3]['errors'] == {'organisationUuid': ['does not exist']}
+
+    # only the valid items are looked up, only the referencing ones inserted
+    assert sorted(references.call_args[0][0]) == [0, 2, 3]
+    assert [item['email_address'] for item in insert_many.call_args[0][0]] == \
+        ['user0@plaza.example', 'user2@plaza.example']
+
+
+def test_bulk_expects_a_list(client):
+    response = client.post('/api/v1/users/bulk', json=user(0))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'expected a list of users'}
+
+
+def test_bulk_is_limited(client):
+    with mock.patch.object(AccountModel, 'insert_many') as insert_many:
+        response = client.post('/api/v1/accounts/bulk', json=[{}] * (BULK_MAX_ITEMS + 1))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'at most {} accounts per request'.format(BULK_MAX_ITEMS)}
+    insert_many.assert_not_called()
+
+
+def test_concurrent_deletes_conflict(client):
+    violation = IntegrityError('INSERT ...', {}, Exception('23503'))
+    with mock.patch.object(UserModel, 'reference_errors', return_value={}), \
+            mock.patch.object(UserModel, 'insert_many', side_effect=violation), \
+            mock.patch('src.models.db.session.rollback') as rollback:
+        response = client.post('/api/v1/users/bulk', json=[user(0)])
+
+    assert response.status_code == 409
+    rollback.assert_called_once_with()
@@ -0,0 +1,133 @@
+"""
+Entity cache, see src/models/cache.py
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from flask import Flask
+
+from src.models import db
+from src.models.cache import EntityCache, LocalBackend, RedisBackend, dump_values, load_values
+from src.models.organisation import OrganisationModel
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        assert isinstance(value, bytes)
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.values) if key.startswith(pattern.rstrip('*'))]
+
+
+def organisation():
+    model = OrganisationModel({'name': 'Plaza', 'roles': ['supplier'], 'email_address': 'info@plaza.example'})
+    model.uuid, model.created_at, model.updated_at = uuid.uuid4(), NOW, NOW
+    model.supplier_uuid, model.city, model.country_code = None, 'Berlin', 'DE'
+    return model
+
+
+def create_cache(**config):
+    app = Flask(__name__)
+    app.config.update(ENTITY_CACHE_BACKEND='local', **config)
+    return app, EntityCache(app)
+
+
+def test_local_hits_misses_and_deletes():
+    backend = LocalBackend(ttl=30, max_entries=10)
+
+    assert backend.get('organisations:a') is None
+    backend.set('organisations:a', {'name': 'Plaza'})
+    assert backend.get('organisations:a') == {'name': 'Plaza'}
+    backend.delete('organisations:a')
+    assert backend.get('organisations:a') is None
+
+
+def test_local_evicts_the_least_recently_used():
+    backend = LocalBackend(ttl=30, max_entries=2)
+    backend.set('users:a', 1)
+    backend.set('users:b', 2)
+    backend.get('users:a')
+    backend.set('users:c', 3)
+
+    assert [backend.get(key) for key in ('users:a', 'users:b', 'users:c')] == [1, None, 3]
+
+
+def test_local_entries_expire():
+    backend = LocalBackend(ttl=30, max_entries=10)
+    with mock.patch('time.monotonic', return_value=100.0):
+        backend.set('users:a', 1)
+    with mock.patch('time.monotonic', return_value=129.0):
+        assert backend.get('users:a') == 1
+    with mock.patch('time.monotonic', return_value=131.0):
+        assert backend.get('users:a') is None
+
+
+def test_local_backend_is_refused_for_several_workers():
+    with pytest.raises(ValueError):
+        create_cache(SERVER_WORKERS=3)
+    assert isinstance(create_cache(SERVER_WORKERS=1)[1].backend, LocalBackend)
+
+
+def test_values_round_trip_as_json():
+    values = {'uuid': uuid.uuid4(), 'created_at': NOW, 'roles': ['supplier'], 'is_validated': False,
+              'updated_at': NOW.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=2))), 'state': None}
+    data = dump_values(values)
+
+    assert data.startswith(b'{')
+    assert load_values(data) == values
+    with pytest.raises(TypeError):
+        dump_values({'password': object()})
+
+
+def test_redis_stores_json():
+    with mock.patch('src.models.cache.redis') as redis:
+        redis.Redis.from_url.return_value = client = FakeRedis()
+        backend = RedisBackend('redis://localhost:6379/0', ttl=30)
+    values = {'uuid': uuid.uuid4(), 'updated_at': NOW}
+
+    backend.set('users:a', values)
+    assert client.values['plaza:entity:users:a'] == dump_values(values)
+    assert backend.get('users:a') == values
+    backend.clear()
+    assert backend.get('users:a') is None
+
+
+def test_reads_through_and_invalidates():
+    app, cache = create_cache(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    stored = organisation()
+    loader = mock.Mock(return_value=stored)
+
+    with app.test_request_context('/', method='GET'):
+        assert cache.get(db.session, OrganisationModel, stored.uuid, loader) is stored
+        hit = cache.get(db.session, OrganisationModel, stored.uuid, loader)
+        assert loader.call_count == 1
+        assert (hit.uuid, hit.name, hit.updated_at) == (stored.uuid, 'Plaza', NOW)
+
+        cache.invalidate(OrganisationModel, stored.uuid)
+        cache.get(db.session, OrganisationModel, stored.uuid, loader)
+        assert loader.call_count == 2
+        # with relationships included
+        cache.get(db.session, OrganisationModel, stored.uuid, loader, cached=False)
+        assert loader.call_count == 3
+        db.session.remove()
+
+    with app.test_request_context('/', method='PUT'):
+        cache.get(db.session, OrganisationModel, stored.uuid, loader)
+        assert loader.call_count == 4
@@ -0,0 +1,145 @@
+"""
+Change stream positions, see src/api/change.py StreamPosition. Changes are
+numbered at insert but published at commit, a stream follows the horizon
+of the transactions that have all finished.
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from flask import request
+
+from src.api import change as change_api
+from src.api.change import StreamPosition, catch_up_events, live_event, parse_last_event_id
+from src.api.utils import ArgumentError
+from src.models.change import ChangeModel
+from src.models.feed import RESYNC, Subscription
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15)
+
+
+def change(id, txid, snapshot_xmin, action='update'):
+    return ChangeModel(id=id, category='users', action=action, uuid=str(uuid.UUID(int=id)), updated_at=NOW,
+                       changed_at=NOW, txid=txid, snapshot_xmin=snapshot_xmin)
+
+
+def parse(events):
+    '''returns the (id, event, uuid) of the server-sent events'''
+    parsed = []
+    for event in events:
+        fields = dict(line.split(': ', 1) for line in event.decode('utf-8').strip().split('\n'))
+        parsed.append((int(fields['id']), fields['event'], fields['data'].split('"uuid":"')[-1][:36]
+                       if '"uuid"' in fields['data'] else None))
+    return parsed
+
+
+def uuid_of(id):
+    return str(uuid.UUID(int=id))
+
+
+def test_changes_committing_out_of_id_order_are_sent_once():
+    position = StreamPosition(100)
+    # 11 commits first, while the transaction of 10 is still running
+    late, early = change(10, 100, 100), change(11, 101, 100)
+
+    assert parse([live_event(position, early)]) == [(100, 'update', uuid_of(11))]
+    assert parse([live_event(position, late)]) == [(100, 'update', uuid_of(10))]
+    # both read again from the table, e.g. after missed notifications
+    assert catch_up_events(position, 102, True, [late, early], 1000) == []
+    assert position.horizon == 102
+    assert position.sent == {}
+
+
+def test_live_changes_advance_to_their_snapshot():
+    position = StreamPosition(100)
+
+    live_event(position, change(10, 100, 100))
+    live_event(position, change(11, 105, 101))
+    assert (position.horizon, position.sent) == (101, {11: 105})
+    # of a transaction below the horizon, i.e. sent already
+    assert live_event(position, change(9, 99, 99)) is None
+    assert live_event(position, change(11, 105, 101)) is None
+
+
+def test_resuming_from_last_event_id_sends_the_rest():
+    position = StreamPosition(100)
+    changes = [change(10, 100, 99), change(12, 103, 100), change(11, 101, 100)]
+
+    events = parse(catch_up_events(position, 104, True, changes, 1000))
+    # only the last carries the new horizon, resuming in between repeats the others
+    assert events == [(100, 'update', uuid_of(10)), (100, 'update', uuid_of(12)), (104, 'update', uuid_of(11))]
+    assert position.horizon == 104
+
+
+def test_catching_up_with_nothing_new_advances_quietly():
+    position = StreamPosition(100)
+
+    assert catch_up_events(position, 103, True, [], 1000) == []
+    assert position.horizon == 103
+
+
+def test_purged_horizon_resets():
+    position = StreamPosition(100)
+    position.add(change(10, 100, 99))
+
+    assert not ChangeModel.retained(100, 101)
+    assert ChangeModel.retained(100, 100) and ChangeModel.retained(100, None)
+    events = catch_up_events(position, 150, ChangeModel.retained(100, 120), [], 1000)
+    assert parse(events) == [(150, 'reset', None)]
+    assert (position.horizon, position.sent) == (150, {})
+
+
+def test_backlog_over_the_limit_resets():
+    position = StreamPosition(100)
+    changes = [change(id, 100 + id, 100) for id in range(4)]
+
+    assert parse(catch_up_events(position, 110, True, changes, 3)) == [(110, 'reset', None)]
+    assert parse(catch_up_events(StreamPosition(100), 110, True, changes, 4))[-1][0] == 110
+
+
+@pytest.mark.parametrize('headers, query, expected', [
+    ({}, {}, None),
+    ({'Last-Event-ID': '104'}, {}, 104),
+    ({}, {'lastEventId': '7'}, 7),
+])
+def test_last_event_id(app, headers, query, expected):
+    with app.test_request_context('/api/v1/changes/', headers=headers, query_string=query):
+        assert parse_last_event_id(request) == expected
+
+
+@pytest.mark.parametrize('value', ['x', '-1'])
+def test_invalid_last_event_id(app, value):
+    with app.test_request_context('/api/v1/changes/', headers={'Last-Event-ID': value}):
+        with pytest.raises(ArgumentError):
+            parse_last_event_id(request)
+
+
+def test_queue_overflow_catches_up(app):
+    subscription = Subscription(['users'], size=1)
+    position = StreamPosition(100)
+    subscription.put(change(10, 100, 100))
+    # dropped, the stream reads it from the table
+    subscription.put(change(11, 101, 100))
+    caught_up = [b'id: 102\nevent: update\ndata: {}\n\n']
+
+    app.config['CHANGES_KEEPALIVE_SECONDS'] = 0
+    with mock.patch.object(change_api, '_catch_up', return_value=caught_up) as catch_up, \
+            mock.patch.object(change_api.change_feed, 'unsubscribe') as unsubscribe:
+        events = change_api._stream(app, subscription, ['users'], [], position)
+        assert next(events).startswith(b'retry: ')
+        assert next(events) == caught_up[0]
+        catch_up.assert_called_once_with(['users'], position, 1000)
+        assert next(events) == change_api.KEEPALIVE
+        events.close()
+    unsubscribe.assert_called_once_with(subscription)
+
+
+def test_reconnects_resync():
+    subscription = Subscription(['users'], size=10)
+    subscription.miss()
+
+    assert subscription.get(0) is RESYNC
+    assert subscription.resync()
+    assert not subscription.resync()
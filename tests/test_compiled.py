@@ -0,0 +1,163 @@
+"""
+Compiled schemas against marshmallow, see src/models/compiled.py. Both must
+return the same data and the same errors for every dump and load.
+"""
+
+import datetime
+import uuid
+
+import pytest
+
+from src.models.account import AccountModel, AccountSchema
+from src.models.compiled import compile_schema, verify
+from src.models.credential import CredentialModel, CredentialSchema
+from src.models.organisation import OrganisationModel, OrganisationSchema
+from src.models.user import UserModel, UserSchema
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+ORGANISATION_UUID = uuid.UUID('5b1f3c9a-0a52-4c7e-9d0b-51e2b8f0c001')
+
+
+def organisation(**values):
+    model = OrganisationModel({'name': 'Plaza', 'roles': ['supplier'], 'email_address': 'info@plaza.example'})
+    model.uuid, model.created_at, model.updated_at = ORGANISATION_UUID, NOW, NOW
+    model.city, model.country_code = 'Berlin', 'DE'
+    for name, value in values.items():
+        setattr(model, name, value)
+    return model
+
+
+def user(**values):
+    model = UserModel({'username': 'jane', 'email_address': 'jane@plaza.example', 'first_name': 'Jane',
+                       'last_name': 'Doe', 'registered_at': NOW})
+    model.uuid, model.created_at, model.updated_at = uuid.uuid4(), NOW, NOW
+    model.organisation_uuid = str(ORGANISATION_UUID)
+    for name, value in values.items():
+        setattr(model, name, value)
+    return model
+
+
+def credential(**values):
+    model = CredentialModel({'user_uuid': str(uuid.uuid4()), 'is_locked': False, 'is_expired': False,
+                             'last_login_at': NOW})
+    model.uuid, model.created_at, model.updated_at = uuid.uuid4(), NOW, NOW
+    for name, value in values.items():
+        setattr(model, name, value)
+    return model
+
+
+def account(**values):
+    model = AccountModel({'name': 'Default Account', 'organisation_uuid': str(ORGANISATION_UUID)})
+    model.uuid, model.created_at, model.updated_at = uuid.uuid4(), NOW, NOW
+    for name, value in values.items():
+        setattr(model, name, value)
+    return model
+
+
+def assert_same_dump(schema, obj, many=None):
+    expected, actual = schema.dump(obj, many=many), compile_schema(schema).dump(obj, many=many)
+    assert actual.data == expected.data
+    assert actual.errors == expected.errors
+    return actual
+
+
+def assert_same_load(schema, data, many=None, partial=None):
+    expected = schema.load(data, many=many, partial=partial)
+    actual = compile_schema(schema).load(data, many=many, partial=partial)
+    assert actual.data == expected.data
+    assert actual.errors == expected.errors
+    return actual
+
+
+MODELS = [
+    (OrganisationSchema, organisation),
+    (UserSchema, user),
+    (CredentialSchema, credential),
+    (AccountSchema, account),
+]
+
+
+@pytest.mark.parametrize('schema_class, model', MODELS)
+def test_dumps_match(schema_class, model):
+    rows = [model(), model(updated_at=NOW.replace(tzinfo=datetime.timezone.utc))]
+
+    result = assert_same_dump(schema_class(), rows[0])
+    assert result.data['type'].endswith('V1')
+    assert_same_dump(schema_class(many=True), rows)
+    assert_same_dump(schema_class(), rows, many=True)
+    assert not verify(schema_class(), rows)
+
+
+def test_nested_dumps_match():
+    assert_same_dump(UserSchema(), user(organisation=organisation(), credential=credential()))
+    assert_same_dump(AccountSchema(many=True), [account(organisation=organisation()), account(organisation=None)])
+
+
+@pytest.mark.parametrize('only', [('uuid',), ('uuid', 'updated_at', 'email_address'), ('organisation',)])
+def test_fieldset_dumps_match(only):
+    result = assert_same_dump(UserSchema(only=only), user(organisation=organisation()))
+    assert len(result.data) == len(only)
+
+
+def test_invalid_dump_values_match():
+    # a date that isn't a datetime, and an integer in a DateTime field
+    assert_same_dump(UserSchema(), user(registered_at='yesterday'))
+    rows = [credential(), credential(user_info_last_login_failed_count=3)]
+    result = assert_same_dump(CredentialSchema(many=True), rows)
+    assert 1 in result.errors
+    assert_same_dump(OrganisationSchema(), organisation(roles='supplier', uuid='not a uuid'))
+
+
+PAYLOADS = {
+    OrganisationSchema: {'name': 'Plaza', 'roles': ['supplier'], 'supplierUuid': str(ORGANISATION_UUID),
+                         'emailAddress': 'info@plaza.example', 'customerNumber': None, 'city': 'Berlin',
+                         'countryCode': 'DE'},
+    UserSchema: {'username': 'jane', 'emailAddress': 'jane@plaza.example', 'firstName': 'Jane', 'lastName': 'Doe',
+                 'organisationUuid': str(ORGANISATION_UUID)},
+    CredentialSchema: {'userUuid': str(uuid.uuid4()), 'password': 'secret', 'locked': 'admin@plaza.example'},
+    AccountSchema: {'name': 'Default Account', 'organisationUuid': str(ORGANISATION_UUID)},
+}
+
+
+@pytest.mark.parametrize('schema_class', [schema_class for schema_class, _ in MODELS])
+def test_loads_match(schema_class):
+    payload = PAYLOADS[schema_class]
+
+    for partial in (None, True):
+        result = assert_same_load(schema_class(), payload, partial=partial)
+        assert not result.errors
+        assert_same_load(schema_class(), [payload, payload], many=True, partial=partial)
+    assert not verify(schema_class(), payloads=[payload, {}])
+
+
+@pytest.mark.parametrize('schema_class', [schema_class for schema_class, _ in MODELS])
+def test_invalid_loads_match(schema_class):
+    payload = PAYLOADS[schema_class]
+    invalid = [
+        None,
+        'junk',
+        [payload],
+        {},
+        dict(payload, unknown='ignored', createdAt='not a date', uuid='not a uuid'),
+        dict(payload, emailAddress='not an address', name=1, roles='x'),
+        {key: None for key in payload},
+    ]
+    for data in invalid:
+        for partial in (None, True, ('name',)):
+            assert_same_load(schema_class(), data, partial=partial)
+    assert_same_load(schema_class(many=True), invalid[3:], many=True)
+    assert_same_load(schema_class(), invalid[4], many=True)
+
+
+def test_invalid_email_errors_are_keyed_by_the_request_name():
+    result = assert_same_load(UserSchema(), dict(PAYLOADS[UserSchema], emailAddress='not an address'))
+
+    assert list(result.errors) == ['emailAddress']
+
+
+def test_fieldset_loads_match():
+    schema = UserSchema(only=('username', 'email_address'))
+
+    assert_same_load(schema, PAYLOADS[UserSchema])
+    assert_same_load(schema, {'username': 'jane'})
+    assert_same_load(schema, {'username': 'jane'}, partial=True)
@@ -0,0 +1,152 @@
+"""
+Response compression and the ETags of compressed representations, see
+src/compression.py
+"""
+
+import gzip
+import json
+import zlib
+from unittest import mock
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+from src import compression as compression_module
+from src.compression import Compression, coded_etag, strip_coding
+
+BODY = json.dumps({'members': ['plaza'] * 200}).encode('utf-8')
+
+brotli_only = pytest.mark.skipif(compression_module.brotli is None, reason='brotli is not installed')
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['COMPRESSION_ALGORITHMS'] = ['gzip']
+    Compression(app)
+
+    @app.route('/big')
+    def big():
+        response = Response(BODY, mimetype='application/json')
+        response.set_etag('abc')
+        return response
+
+    @app.route('/weak')
+    def weak():
+        response = Response(BODY, mimetype='application/json')
+        response.set_etag('abc', weak=True)
+        return response
+
+    @app.route('/small')
+    def small():
+        return Response(b'{}', mimetype='application/json')
+
+    @app.route('/html')
+    def html():
+        return Response(BODY, mimetype='text/html')
+
+    @app.route('/unchanged')
+    def unchanged():
+        return Response(status=304, mimetype='application/json')
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            yield '{"members":['
+            yield b''
+            yield ','.join(['"plaza"'] * 200)
+            yield ']}'
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    return app
+
+
+def get(app, path, accept='gzip', method='GET'):
+    return app.test_client().open(path, method=method, headers={'Accept-Encoding': accept} if accept else {})
+
+
+def test_strip_coding():
+    assert coded_etag('abc', 'gzip') == 'abc-gzip'
+    assert strip_coding('abc-gzip') == 'abc'
+    assert strip_coding('abc-br') == 'abc'
+    assert strip_coding('abc') == 'abc'
+    assert strip_coding('a-b-c') == 'a-b-c'
+    assert strip_coding('abc-gzip-gzip') == 'abc-gzip'
+
+
+def test_compressed_with_coded_etag(app):
+    response = get(app, '/big')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == '"abc-gzip"'
+    assert gzip.decompress(response.get_data()) == BODY
+    assert int(response.headers['Content-Length']) == len(response.get_data())
+
+
+def test_weak_etags_are_kept(app):
+    response = get(app, '/weak')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == 'W/"abc"'
+
+
+@pytest.mark.parametrize('accept', [None, 'identity', 'br', 'gzip;q=0'])
+def test_not_accepted(app, accept):
+    response = get(app, '/big', accept)
+
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == '"abc"'
+    assert response.get_data() == BODY
+
+
+@pytest.mark.parametrize('path', ['/small', '/html', '/unchanged'])
+def test_sent_as_is(app, path):
+    assert 'Content-Encoding' not in get(app, path).headers
+
+
+def test_head_requests_are_not_compressed(app):
+    response = get(app, '/big', method='HEAD')
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streams_are_compressed_chunk_by_chunk(app):
+    response = get(app, '/stream')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    chunks = list(response.response)
+    # every chunk is flushed, so each is decodable on arrival
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(chunks[0]) == b'{"members":['
+    assert json.loads(gzip.decompress(b''.join(chunks))) == {'members': ['plaza'] * 200}
+
+
+def test_unknown_algorithm():
+    app = Flask(__name__)
+    app.config['COMPRESSION_ALGORITHMS'] = ['zstd']
+    with pytest.raises(ValueError, match='unknown compression algorithm: zstd'):
+        Compression(app)
+
+
+def test_br_needs_brotli():
+    app = Flask(__name__)
+    app.config['COMPRESSION_ALGORITHMS'] = ['br']
+    with mock.patch.object(compression_module, 'brotli', None):
+        compression = Compression(app)
+    # without any encoder nothing is hooked
+    assert compression.encoders == []
+    assert app.after_request_funcs == {}
+
+
+@brotli_only
+def test_br_is_preferred():
+    app = Flask(__name__)
+    Compression(app)
+    app.route('/big')(lambda: Response(BODY, mimetype='application/json'))
+
+    response = get(app, '/big', 'gzip, br')
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert compression_module.brotli.decompress(response.get_data()) == BODY
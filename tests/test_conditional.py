@@ -0,0 +1,135 @@
+"""
+ETags and conditional requests, see src/api/conditional.py
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+
+from src.api.conditional import (if_match_versions, is_not_modified, list_etag, not_modified_response, page_etag,
+                                 resource_etag, unmatched_write_response)
+from src.api.pagination import Page
+from src.models.user import UserModel
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+UUID = uuid.UUID('5b1f3c9a-0a52-4c7e-9d0b-51e2b8f0c001')
+
+
+class Row(object):
+
+    def __init__(self, updated_at=NOW):
+        self.uuid = uuid.uuid4()
+        self.updated_at = updated_at
+
+
+@pytest.fixture
+def request_context(app):
+    def push(query_string=None, headers=None, method='GET'):
+        context = app.test_request_context('/api/v1/users/', query_string=query_string, headers=headers,
+                                           method=method)
+        context.push()
+        contexts.append(context)
+    contexts = []
+    yield push
+    for context in reversed(contexts):
+        context.pop()
+
+
+def test_resource_etag_follows_the_version_and_the_representation(request_context):
+    request_context()
+    etag = resource_etag(UUID, NOW)
+    assert etag == '{}.20190902103015250000'.format(UUID)
+    assert resource_etag(UUID, NOW + datetime.timedelta(microseconds=1)) != etag
+    assert resource_etag(UUID, None) == '{}.0'.format(UUID)
+
+    request_context({'fields': 'uuid'})
+    assert resource_etag(UUID, NOW).startswith(etag + '.')
+    assert resource_etag(UUID, NOW) != etag
+
+
+def test_list_etag_changes_with_any_member(request_context):
+    request_context()
+    etag = list_etag((NOW, 10))
+
+    assert list_etag((NOW, 10)) == etag
+    # a create or delete changes the count, an update the latest updated_at
+    assert list_etag((NOW, 11)) != etag
+    assert list_etag((NOW + datetime.timedelta(seconds=1), 10)) != etag
+    assert list_etag((None, 0)) != etag
+
+
+def test_page_etag_changes_with_its_members(request_context):
+    request_context()
+    rows = [Row(), Row()]
+    etag = page_etag(Page(rows, 1, None, None, 'none'))
+
+    assert page_etag(Page(list(rows), 1, None, None, 'none')) == etag
+    rows[1].updated_at = NOW + datetime.timedelta(seconds=1)
+    assert page_etag(Page(rows, 1, None, None, 'none')) != etag
+    assert page_etag(Page(rows[:1], 1, None, None, 'none')) != etag
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    (None, False),
+    ('"other"', False),
+    ('"etag"', True),
+    ('W/"etag"', True),
+    ('"other", "etag"', True),
+    ('*', True),
+    # of the compressed representation
+    ('"etag-gzip"', True),
+    ('"etag-deflate"', False),
+])
+def test_is_not_modified(request_context, if_none_match, expected):
+    request_context(headers={'If-None-Match': if_none_match} if if_none_match else {})
+
+    assert is_not_modified('etag') is expected
+
+
+def test_missing_resources_are_never_not_modified(request_context):
+    request_context(headers={'If-None-Match': '*'})
+
+    assert not is_not_modified(None)
+
+
+def test_not_modified_answers_with_the_tag_sent(request_context):
+    request_context(headers={'If-None-Match': '"etag-br"'})
+    response = not_modified_response('etag')
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"etag-br"'
+    assert not_modified_response('other', weak=True).headers['ETag'] == 'W/"other"'
+
+
+def test_if_match_versions(request_context):
+    version = '{}.20190902103015250000'.format(UUID)
+    request_context(headers={'If-Match': '"{0}", "{0}.abc-gzip", "{1}.0", "{2}.20190902103015250001", "{0}x"'
+                             .format(version, UUID, uuid.uuid4())}, method='PUT')
+
+    # the tags of the header are a set, the versions come in no particular order
+    versions = if_match_versions(str(UUID))
+    assert len(versions) == 3
+    assert versions.count(NOW) == 2 and None in versions
+    assert if_match_versions('not a uuid') == []
+
+
+@pytest.mark.parametrize('if_match', [None, '*'])
+def test_any_version_matches_without_if_match(request_context, if_match):
+    request_context(headers={'If-Match': if_match} if if_match else {}, method='PUT')
+
+    assert if_match_versions(str(UUID)) is None
+
+
+@pytest.mark.parametrize('versions, exists, status', [
+    (None, True, 404),
+    ([NOW], True, 412),
+    ([NOW], False, 404),
+])
+def test_unmatched_writes(request_context, versions, exists, status):
+    request_context(method='PUT')
+
+    with mock.patch.object(UserModel, 'exists', return_value=exists):
+        response = unmatched_write_response(UserModel, str(UUID), versions, 'user not found')
+    assert response.status_code == status
@@ -0,0 +1,88 @@
+"""
+The JSON backends of the responses and request bodies, see src/encoding.py
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from flask import Flask, request
+
+from src import encoding
+from src.encoding import Codec, CodecRequest, OrjsonBackend, StdlibBackend
+
+orjson_only = pytest.mark.skipif(encoding.orjson is None, reason='orjson is not installed')
+
+UUID = uuid.UUID('6f1c2a8e-5b4d-4e0f-9a3c-2d7e8b1f0c4a')
+
+DOCUMENTS = [
+    {'b': 1, 'a': [True, False, None], 'c': {'z': 'x', 'y': ''}},
+    {'name': 'Zürich – 東京 "quoted" \\ \n\t ', 'emoji': '\U0001f600'},
+    {'uuid': UUID, 'uuids': [UUID, str(UUID)]},
+    {'naive': datetime.datetime(2019, 9, 2, 10, 30, 15),
+     'micro': datetime.datetime(2019, 9, 2, 10, 30, 15, 250000),
+     'utc': datetime.datetime(2019, 9, 2, 10, 30, 15, tzinfo=datetime.timezone.utc),
+     'offset': datetime.datetime(2019, 9, 2, 10, 30, 15, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+     'date': datetime.date(2019, 9, 2)},
+    {'int': 2 ** 60, 'negative': -42, 'float': 0.1, 'whole': 1.0, 'big': 1e20, 'zero': -0.0, 'long': 123456789.123},
+    [],
+    {},
+    'plain',
+]
+
+
+@orjson_only
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_backends_encode_the_same_bytes(document):
+    assert StdlibBackend().dumps(document) == OrjsonBackend().dumps(document)
+
+
+@orjson_only
+def test_small_exponents_differ():
+    assert StdlibBackend().dumps(1.5e-7) == b'1.5e-07'
+    assert OrjsonBackend().dumps(1.5e-7) == b'1.5e-7'
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_stdlib_round_trip(document):
+    data = StdlibBackend().dumps(document)
+    assert isinstance(data, bytes)
+    assert StdlibBackend().loads(data) == encoding.json.loads(data.decode('utf-8'))
+
+
+def test_datetimes_are_rfc3339():
+    dumps = StdlibBackend().dumps
+    assert dumps(datetime.datetime(2019, 9, 2, 10, 30, 15)) == b'"2019-09-02T10:30:15+00:00"'
+    assert dumps(UUID) == '"{}"'.format(UUID).encode('ascii')
+    with pytest.raises(TypeError):
+        dumps(object())
+
+
+def test_orjson_is_required():
+    with mock.patch.object(encoding, 'orjson', None), pytest.raises(RuntimeError):
+        OrjsonBackend()
+
+
+def test_unknown_backend():
+    app = Flask(__name__)
+    app.config['JSON_BACKEND'] = 'simplejson'
+    with pytest.raises(ValueError):
+        Codec().init_app(app)
+
+
+def test_request_bodies_are_parsed_by_the_codec():
+    app = Flask(__name__)
+    Codec().init_app(app)
+    assert app.request_class is CodecRequest
+
+    @app.route('/', methods=['POST'])
+    def echo():
+        return encoding.codec.dumps(request.get_json())
+
+    with mock.patch.object(encoding.codec, 'loads', wraps=encoding.codec.loads) as loads:
+        response = app.test_client().post('/', data='{"b":1,"a":"ü"}'.encode('utf-8'),
+                                          content_type='application/json')
+
+    assert response.get_data() == '{"a":"ü","b":1}'.encode('utf-8')
+    loads.assert_called_once_with('{"b":1,"a":"ü"}'.encode('utf-8'))
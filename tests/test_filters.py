@@ -0,0 +1,133 @@
+"""
+The allowed list filters and the sort order, see src/api/filters.py
+"""
+
+import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from src.api import organisation, user
+from src.api.filters import (DEFAULT_SORT, Filter, FilterError, Sort, is_indexed, parse_datetime, parse_filters,
+                             parse_sort, parse_uuid)
+from src.models.organisation import OrganisationModel
+from src.models.user import UserModel
+
+UUID = '6f1c2a8e-5b4d-4e0f-9a3c-2d7e8b1f0c4a'
+
+
+def sql(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
+def test_parse_uuid():
+    assert parse_uuid(UUID.upper()) == UUID
+    with pytest.raises(FilterError):
+        parse_uuid('plaza')
+
+
+@pytest.mark.parametrize('value', [
+    '2019-09-02T10:30:15Z',
+    '2019-09-02T10:30:15+00:00',
+    '2019-09-02T12:30:15+02:00',
+    '2019-09-02T12:30:15 0200',
+    '2019-09-02T08:30:15-02:00',
+    '2019-09-02T10:30:15',
+    ' 2019-09-02T10:30:15.000+00:00 ',
+])
+def test_parse_datetime(value):
+    assert parse_datetime(value) == datetime.datetime(2019, 9, 2, 10, 30, 15)
+
+
+def test_parse_datetime_fractions_and_dates():
+    assert parse_datetime('2019-09-02T10:30:15.25Z') == datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+    assert parse_datetime('2019-09-02') == datetime.datetime(2019, 9, 2)
+
+
+@pytest.mark.parametrize('value', ['yesterday', '2019-13-02', '02.09.2019', ''])
+def test_invalid_datetimes(value):
+    with pytest.raises(FilterError):
+        parse_datetime(value)
+
+
+def test_only_indexed_columns_are_filters():
+    assert is_indexed(UserModel.__table__.c.id)
+    assert is_indexed(UserModel.__table__.c.email_address)
+    assert is_indexed(UserModel.__table__.c.organisation_id)
+    assert not is_indexed(UserModel.__table__.c.phone_number)
+
+    with pytest.raises(ValueError, match='users.phone_number is not indexed'):
+        Filter(UserModel.phone_number)
+    with pytest.raises(ValueError, match='unknown filter operator'):
+        Filter(UserModel.email_address, operator='like')
+
+
+@pytest.mark.parametrize('filters', [organisation.LIST_FILTERS, user.LIST_FILTERS])
+def test_list_filters_are_indexed(filters):
+    for name, list_filter in filters.items():
+        assert is_indexed(list_filter.attribute.property.columns[0]), name
+
+
+def test_eq_filters():
+    email = Filter(UserModel.email_address)
+    assert sql(email.clause('emailAddress', ['jane@plaza.example'])) == 'users.email_address = %(email_address_1)s'
+    assert sql(email.clause('emailAddress', ['jane@plaza.example', 'john@plaza.example'])) == \
+        'users.email_address IN (%(email_address_1)s, %(email_address_2)s)'
+
+
+def test_contains_filter():
+    role = Filter(OrganisationModel.roles, operator='contains')
+    assert sql(role.clause('role', ['supplier', 'customer'])) == 'organisations.roles @> %(roles_1)s::TEXT[]'
+
+
+def test_gt_filter_accepts_one_value():
+    updated = Filter(UserModel.updated_at, parse_datetime, 'gt')
+    assert sql(updated.clause('updatedAfter', ['2019-09-02'])) == 'users.updated_at > %(updated_at_1)s'
+    with pytest.raises(FilterError, match='updatedAfter accepts one value'):
+        updated.clause('updatedAfter', ['2019-09-02', '2019-09-03'])
+
+
+def test_parse_filters():
+    args = MultiDict([('emailAddress', 'jane@plaza.example'), ('phoneNumber', '+41'), ('limit', '10'),
+                      ('organisationUuid', UUID)])
+
+    clauses = parse_filters(args, user.LIST_FILTERS)
+
+    # unknown parameters are ignored, the clauses come in the order of the names
+    assert [sql(clause) for clause in clauses] == ['users.email_address = %(email_address_1)s',
+                                                   'users.organisation_id = %(organisation_id_1)s']
+    assert clauses[1].right.value == UUID
+    assert parse_filters(MultiDict(), user.LIST_FILTERS) == []
+
+
+def test_parse_filters_rejects_invalid_values():
+    with pytest.raises(FilterError):
+        parse_filters(MultiDict([('organisationUuid', 'plaza')]), user.LIST_FILTERS)
+
+
+def test_invalid_filters_are_a_bad_request(client):
+    response = client.get('/api/v1/users?organisationUuid=plaza')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'invalid uuid: plaza'}
+
+
+@pytest.mark.parametrize('value, key, descending', [
+    (None, 'createdAt', False),
+    ('createdAt', 'createdAt', False),
+    ('-updatedAt', 'updatedAt', True),
+])
+def test_parse_sort(value, key, descending):
+    sort = parse_sort(MultiDict({'sort': value} if value else {}))
+    assert (sort.key, sort.descending) == (key, descending)
+    assert sort.token == (value or DEFAULT_SORT.token)
+
+
+@pytest.mark.parametrize('value', ['name', '--createdAt', 'created_at'])
+def test_invalid_sort(value):
+    with pytest.raises(FilterError, match='sort must be one of createdAt, updatedAt'):
+        parse_sort(MultiDict({'sort': value}))
+
+
+def test_sort_columns():
+    assert Sort('updatedAt', True).columns(UserModel) == (UserModel.updated_at, UserModel.uuid)
@@ -0,0 +1,113 @@
+"""
+Request timings, the Server-Timing header and /metrics, see
+src/instrumentation.py and src/metrics.py
+"""
+
+import re
+from unittest import mock
+
+import pytest
+from flask import Flask, g
+
+from src import instrumentation
+from src.metrics import Registry
+
+
+class Connection(object):
+    def __init__(self):
+        self.info = {}
+
+
+def execute(conn, failed=False):
+    '''stands in for the engine events of one statement'''
+    instrumentation._before_cursor_execute(conn, None, 'SELECT 1', {}, None, False)
+    if failed:
+        instrumentation._handle_error(mock.Mock(connection=conn))
+    else:
+        instrumentation._after_cursor_execute(conn, None, 'SELECT 1', {}, None, False)
+
+
+@pytest.fixture
+def timed_app():
+    app = Flask(__name__)
+    instrumentation.init_app(app)
+
+    @app.route('/rows')
+    def rows():
+        conn = Connection()
+        execute(conn)
+        execute(conn, failed=True)
+        with instrumentation.timed('dump'):
+            pass
+        with instrumentation.timed('dump'):
+            pass
+        assert conn.info['query_start'] == []
+        return 'rows'
+
+    return app
+
+
+def test_server_timing(timed_app):
+    response = timed_app.test_client().get('/rows')
+
+    metrics = response.headers['Server-Timing'].split(', ')
+    assert [metric.split(';')[0] for metric in metrics] == ['db', 'dump', 'queries', 'app']
+    assert metrics[2] == 'queries;desc="2"'
+    for metric in metrics[:2] + metrics[3:]:
+        assert re.match(r'^\w+;dur=\d+\.\d{2}$', metric)
+
+
+def test_server_timing_can_be_disabled(timed_app):
+    timed_app.config['SERVER_TIMING'] = False
+    response = timed_app.test_client().get('/rows')
+
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+
+
+def test_timed_outside_requests(app):
+    with instrumentation.timed('dump'):
+        pass
+    with app.app_context():
+        with instrumentation.timed('dump'):
+            pass
+        execute(Connection())
+        assert 'timings' not in g
+
+
+def test_requests_are_on_metrics(client):
+    client.get('/')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'plaza_http_request_duration_seconds_count{endpoint="index",method="GET",status="200"}' in body
+    assert 'plaza_http_request_db_queries_bucket{endpoint="index",le="1"}' in body
+
+
+def test_render():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', labels=('path',))
+    registry.gauge('streams', 'Open streams', labels=('kind',), callback=lambda: {('changes',): 2})
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+
+    requests.inc(path='/a"b')
+    requests.inc(2, path='/a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    assert registry.counter('requests_total', 'Again') is requests
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{path="/a\\"b"} 3',
+        '# HELP streams Open streams',
+        '# TYPE streams gauge',
+        'streams{kind="changes"} 2',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        'latency_seconds_count 3',
+        'latency_seconds_sum 5.55',
+    ]) + '\n'
@@ -0,0 +1,125 @@
+"""
+Keyset pagination, see src/api/pagination.py
+"""
+
+import base64
+import datetime
+import json
+import uuid
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from src.api.filters import DEFAULT_SORT, Sort
+from src.api.pagination import (MAX_LIMIT, PaginationError, decode_cursor, encode_cursor, keyset_page, page_query,
+                                parse_page_args)
+from src.models.user import UserModel
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+
+
+class Row(object):
+
+    def __init__(self, created_at):
+        self.uuid = uuid.uuid4()
+        self.created_at = created_at
+
+
+@pytest.fixture
+def context(app):
+    with app.app_context():
+        yield
+
+
+def sql(query):
+    return str(query.statement.compile(dialect=postgresql.dialect()))
+
+
+def test_cursor_round_trip():
+    uuid_ = uuid.uuid4()
+    token = encode_cursor(DEFAULT_SORT, NOW, uuid_, 51)
+
+    assert '=' not in token
+    assert decode_cursor(token) == (NOW, uuid_, 51, None)
+    assert decode_cursor(encode_cursor(DEFAULT_SORT, NOW.replace(microsecond=0), uuid_, 2))[0] == \
+        NOW.replace(microsecond=0)
+
+
+def raw_cursor(raw):
+    return base64.urlsafe_b64encode(json.dumps(raw).encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('token', [
+    'not a cursor',
+    raw_cursor(['createdAt', 'yesterday', str(uuid.uuid4()), 1]),
+    raw_cursor(['createdAt', NOW.isoformat(), 'not a uuid', 1]),
+    raw_cursor(['createdAt', NOW.isoformat(), str(uuid.uuid4()), 'one']),
+    raw_cursor(['createdAt', NOW.isoformat()]),
+    raw_cursor({'sort': 'createdAt'}),
+])
+def test_invalid_cursors(token):
+    with pytest.raises(PaginationError):
+        decode_cursor(token)
+
+
+def test_cursor_belongs_to_its_sort_order():
+    token = encode_cursor(Sort('createdAt', descending=True), NOW, uuid.uuid4(), 51)
+
+    with pytest.raises(PaginationError) as error:
+        decode_cursor(token, DEFAULT_SORT)
+    assert '-createdAt' in str(error.value)
+
+
+@pytest.mark.parametrize('args, expected', [
+    ({}, (None, 50)),
+    ({'limit': '1'}, (None, 1)),
+    ({'limit': str(MAX_LIMIT)}, (None, MAX_LIMIT)),
+])
+def test_page_args(args, expected):
+    assert parse_page_args(MultiDict(args)) == expected
+
+
+@pytest.mark.parametrize('limit', ['0', str(MAX_LIMIT + 1), 'ten'])
+def test_invalid_limits(limit):
+    with pytest.raises(PaginationError):
+        parse_page_args(MultiDict({'limit': limit}))
+
+
+def test_page_args_decode_the_cursor():
+    uuid_ = uuid.uuid4()
+    args = MultiDict({'cursor': encode_cursor(DEFAULT_SORT, NOW, uuid_, 11), 'limit': '10'})
+
+    assert parse_page_args(args) == ((NOW, uuid_, 11, None), 10)
+
+
+def test_first_page_query(context):
+    query, start = page_query(UserModel.query, UserModel, None, 10)
+
+    assert start == 1
+    assert 'WHERE' not in sql(query)
+    assert 'ORDER BY users.created_at, users.id' in sql(query)
+    # one more to tell whether another page follows
+    assert query._limit == 11
+
+
+@pytest.mark.parametrize('sort, operator, order', [
+    (DEFAULT_SORT, '>', 'users.created_at, users.id'),
+    (Sort('updatedAt', descending=True), '<', 'users.updated_at DESC, users.id DESC'),
+])
+def test_following_page_query_seeks_past_the_cursor(context, sort, operator, order):
+    query, start = page_query(UserModel.query, UserModel, (NOW, uuid.uuid4(), 51, None), 50, sort)
+
+    assert start == 51
+    assert '(users.{}, users.id) {} (%(param_1)s, %(param_2)s)'.format(sort.attribute, operator) in sql(query)
+    assert 'ORDER BY ' + order in sql(query)
+
+
+def test_keyset_page():
+    rows = [Row(NOW + datetime.timedelta(seconds=index)) for index in range(3)]
+
+    items, next_cursor = keyset_page(rows, 11, 2)
+    assert items == rows[:2]
+    assert decode_cursor(next_cursor) == (rows[1].created_at, rows[1].uuid, 13, None)
+    assert keyset_page(rows, 11, 3) == (rows, None)
+    assert keyset_page([], 1, 3) == ([], None)
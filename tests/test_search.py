@@ -0,0 +1,117 @@
+"""
+Searches and their offset pages, see src/models/search.py and the offset
+cursors of src/api/pagination.py
+"""
+
+import base64
+import datetime
+import json
+from unittest import mock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from src.api.filters import DEFAULT_SORT, FilterError, parse_search
+from src.api.pagination import (PaginationError, decode_offset_cursor, encode_cursor, encode_offset_cursor,
+                                paginate_offset, parse_offset_page_args)
+from src.models.search import MIN_SEARCH_LENGTH, escape_like
+from src.models.user import UserModel
+
+
+@pytest.fixture
+def context(app):
+    with app.app_context():
+        yield
+
+
+def token(raw):
+    return base64.urlsafe_b64encode(json.dumps(raw).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def search_query(rows, count=None):
+    query = mock.Mock()
+    query.offset.return_value.limit.return_value.all.return_value = rows
+    query.order_by.return_value.count.return_value = count
+    return query
+
+
+@pytest.mark.parametrize('start', [1, 51, 10 ** 6])
+def test_offset_cursor_round_trip(start):
+    cursor = encode_offset_cursor(start)
+    assert '=' not in cursor
+    assert decode_offset_cursor(cursor) == start
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!', token(['offset', 0]), token(['offset', 'x']), token(['keyset', 10]), token(['offset']),
+    # the cursor of a keyset page
+    token({'offset': 10}), encode_cursor(DEFAULT_SORT, datetime.datetime(2019, 9, 2), 'a1', 11),
+])
+def test_invalid_offset_cursors(cursor):
+    with pytest.raises(PaginationError, match='invalid cursor'):
+        decode_offset_cursor(cursor)
+
+
+def test_offset_page_args():
+    assert parse_offset_page_args(MultiDict()) == (1, 50)
+    assert parse_offset_page_args(MultiDict({'cursor': encode_offset_cursor(21), 'limit': '20'})) == (21, 20)
+
+
+def test_paginate_offset():
+    query = search_query(['c', 'd', 'e'], count=7)
+
+    page = paginate_offset(query, 3, 2)
+
+    query.offset.assert_called_once_with(2)
+    query.offset.return_value.limit.assert_called_once_with(3)
+    assert page.items == ['c', 'd']
+    assert (page.start, page.total, page.total_mode) == (3, 7, 'exact')
+    assert decode_offset_cursor(page.next) == 5
+
+
+def test_last_offset_page():
+    query = search_query(['g'])
+
+    page = paginate_offset(query, 7, 2, total_mode='estimated')
+
+    assert page.next is None
+    assert page.total == 7
+    query.order_by.assert_not_called()
+
+
+def test_parse_search():
+    assert parse_search(MultiDict({'q': '  zür  '})) == 'zür'
+    for value in ['', ' ab ', 'x' * (MIN_SEARCH_LENGTH - 1)]:
+        with pytest.raises(FilterError, match='q must have at least {} characters'.format(MIN_SEARCH_LENGTH)):
+            parse_search(MultiDict({'q': value}))
+    with pytest.raises(FilterError):
+        parse_search(MultiDict())
+
+
+def test_escape_like():
+    assert escape_like('50%_off\\') == '50\\%\\_off\\\\'
+
+
+def test_search_query(context):
+    compiled = UserModel.search('jane_d').statement.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+
+    assert 'WHERE users.first_name ILIKE %(first_name_1)s OR (users.first_name %% %(first_name_2)s) OR ' in sql
+    assert 'OR (users.email_address %% %(email_address_2)s) ORDER BY' in sql
+    assert 'ORDER BY greatest(word_similarity(%(word_similarity_1)s, users.first_name)' in sql
+    assert sql.endswith('DESC, users.id')
+    # the term is a substring pattern with its wildcards escaped, and compared as is
+    params = compiled.params
+    assert params['first_name_1'] == '%jane\\_d%'
+    assert params['first_name_2'] == 'jane_d'
+
+
+def test_short_searches_are_a_bad_request(client):
+    response = client.get('/api/v1/users/search?q=ab')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'q must have at least 3 characters'}
+
+    response = client.get('/api/v1/organisations/search?q=plaza&cursor=' + token(['offset', 0]))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'invalid cursor'}
@@ -0,0 +1,41 @@
+"""
+Startup time of the app, see src/startup.py and manage.py startup_profile
+"""
+
+import pytest
+
+from src.app import BLUEPRINTS
+from src.config import Production
+from src.startup import StartupBudgetExceeded, check_budget, parse_importtime, profile_startup
+
+IMPORTTIME = '''import time: self [us] | cumulative | imported package
+import time:        50 |         50 | encodings
+import time:       100 |        100 |   _io
+import time:       300 |        300 |     werkzeug.routing
+import time:      1000 |       1300 |   flask
+import time:      2000 |       2000 |     sqlalchemy.orm
+import time:       500 |       2500 |   src.models.user
+import time:       200 |       4000 | src.app
+'''
+
+
+def test_check_budget():
+    check_budget({'start_to_first_request_ms': 900.0}, 1000)
+    with pytest.raises(StartupBudgetExceeded):
+        check_budget({'start_to_first_request_ms': 1100.0}, 1000)
+
+
+def test_imports_count_towards_their_subsystem():
+    totals = parse_importtime(IMPORTTIME)
+
+    assert totals == pytest.approx({'python': 0.05, 'app': 0.3, 'flask': 1.3, 'sqlalchemy': 2.0, 'models': 0.5})
+
+
+@pytest.mark.parametrize('lazy', [True, False])
+def test_first_request_within_budget(lazy):
+    profile = profile_startup('production', lazy_blueprints=lazy)
+
+    # the first request loads a blueprint lazy mode deferred
+    assert BLUEPRINTS[0][0] in profile['first_request_blueprints']
+    assert sorted(profile['blueprints_ms']) == sorted(prefix for prefix, _, _ in BLUEPRINTS)
+    check_budget(profile, Production.STARTUP_BUDGET_MS)
@@ -0,0 +1,154 @@
+"""
+Delta syncs, see src/api/sync.py, and the watermark their cursors carry,
+see src/api/pagination.py
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from src.api import sync
+from src.api.filters import FilterError
+from src.api.pagination import Page, decode_cursor, encode_cursor, keyset_page
+from src.api.sync import SYNC_SORT, check_retention, parse_updated_since, sync_page, watermark_at
+from src.models.change import ChangeModel
+from src.models.user import UserModel
+
+# the database clock, far behind the app's
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+SINCE = NOW - datetime.timedelta(hours=1)
+
+
+class Row(object):
+
+    def __init__(self, updated_at):
+        self.uuid = uuid.uuid4()
+        self.updated_at = updated_at
+
+
+@pytest.fixture
+def context(app):
+    with app.test_request_context('/api/v1/users/'):
+        yield app.config
+
+
+@pytest.fixture
+def paginate():
+    with mock.patch.object(sync, 'paginate', return_value=Page([], 1, 0, None)) as paginate:
+        yield paginate
+
+
+def test_updated_since_is_read_in_the_sync_order():
+    assert parse_updated_since(MultiDict()) is None
+    assert parse_updated_since(MultiDict({'updatedSince': '2019-09-02T09:30:15.250000'})) == SINCE
+    assert parse_updated_since(MultiDict({'updatedSince': '2019-09-02T09:30:15', 'sort': 'updatedAt'}))
+    with pytest.raises(FilterError):
+        parse_updated_since(MultiDict({'updatedSince': '2019-09-02T09:30:15', 'sort': '-updatedAt'}))
+
+
+def test_retention_is_checked_against_the_database_clock(context):
+    context['CHANGES_RETENTION_HOURS'] = 24
+    # long ago for the app's clock
+    check_retention(NOW - datetime.timedelta(hours=23), NOW)
+    with pytest.raises(FilterError):
+        check_retention(NOW - datetime.timedelta(hours=25), NOW)
+
+
+@pytest.mark.parametrize('overlap, statement_timeout, expected', [(5, 0, 5), (5, 30000, 30), (60, 30000, 60)])
+def test_watermark_overlaps_the_statement_timeout(context, overlap, statement_timeout, expected):
+    context.update(SYNC_OVERLAP_SECONDS=overlap, DB_STATEMENT_TIMEOUT=statement_timeout)
+
+    assert watermark_at(NOW) == NOW - datetime.timedelta(seconds=expected)
+
+
+def test_first_page_lists_tombstones_and_takes_the_watermark(context, paginate):
+    context.update(SYNC_OVERLAP_SECONDS=5, DB_STATEMENT_TIMEOUT=0)
+    deleted = ChangeModel(category='users', action='delete', uuid=str(uuid.UUID(int=1)), changed_at=NOW)
+
+    with mock.patch.object(sync, '_now', return_value=NOW), \
+            mock.patch.object(UserModel, 'tombstones', return_value=[deleted]) as tombstones:
+        page = sync_page(UserModel.query, UserModel, SINCE, None, 50)
+
+    watermark = NOW - datetime.timedelta(seconds=5)
+    assert page.watermark == watermark
+    assert paginate.call_args[1]['watermark'] == watermark
+    assert paginate.call_args[1]['sort'] is SYNC_SORT
+    tombstones.assert_called_once_with(SINCE)
+    assert page.deleted == [{'uuid': str(uuid.UUID(int=1)), 'deletedAt': '2019-09-02T10:30:15.250000+00:00'}]
+
+
+def test_first_page_rejects_a_purged_since(context, paginate):
+    context['CHANGES_RETENTION_HOURS'] = 24
+
+    with mock.patch.object(sync, '_now', return_value=NOW), pytest.raises(FilterError):
+        sync_page(UserModel.query, UserModel, NOW - datetime.timedelta(days=2), None, 50)
+    paginate.assert_not_called()
+
+
+def test_later_pages_keep_the_watermark_of_the_first(context, paginate):
+    watermark = NOW - datetime.timedelta(seconds=5)
+    cursor = (NOW, uuid.uuid4(), 51, watermark)
+
+    with mock.patch.object(sync, '_now') as now, mock.patch.object(UserModel, 'tombstones') as tombstones:
+        page = sync_page(UserModel.query, UserModel, SINCE, cursor, 50)
+
+    assert page.watermark == watermark
+    assert page.deleted == []
+    now.assert_not_called()
+    tombstones.assert_not_called()
+    assert paginate.call_args[0][2] == cursor
+
+
+def test_cursors_of_plain_lists_watermark_since(context, paginate):
+    with mock.patch.object(sync, '_now') as now:
+        page = sync_page(UserModel.query, UserModel, SINCE, (NOW, uuid.uuid4(), 51, None), 50)
+
+    assert page.watermark == SINCE
+    now.assert_not_called()
+
+
+def test_cursor_carries_the_watermark():
+    watermark = NOW - datetime.timedelta(seconds=5)
+    rows = [Row(NOW), Row(NOW), Row(NOW + datetime.timedelta(seconds=1))]
+
+    items, next_cursor = keyset_page(rows, 1, 2, SYNC_SORT, watermark)
+    assert items == rows[:2]
+    assert decode_cursor(next_cursor, SYNC_SORT) == (NOW, rows[1].uuid, 3, watermark)
+
+    _, next_cursor = keyset_page(rows, 1, 2, SYNC_SORT)
+    assert decode_cursor(next_cursor, SYNC_SORT)[3] is None
+    assert keyset_page(rows, 1, 3, SYNC_SORT, watermark)[1] is None
+
+
+def test_cursor_watermark_survives_an_encode():
+    uuid_ = uuid.uuid4()
+    token = encode_cursor(SYNC_SORT, NOW, uuid_, 51, NOW.replace(microsecond=0))
+
+    assert decode_cursor(token, SYNC_SORT) == (NOW, uuid_, 51, NOW.replace(microsecond=0))
+
+
+def test_delta_sync_of_a_purged_since_is_a_bad_request(client):
+    with mock.patch.object(sync, '_now', return_value=NOW):
+        response = client.get('/api/v1/users/', query_string={'updatedSince': '2019-08-01T00:00:00'})
+
+    assert response.status_code == 400
+    assert 'sync the whole list again' in response.get_json()['error']
+
+
+def test_delta_sync_lists_the_page_with_tombstones_and_watermark(client):
+    page = Page([], 1, 0, None)
+    page.deleted, page.watermark = [], NOW
+
+    with mock.patch.object(sync, 'sync_page', return_value=page) as sync_page_:
+        response = client.get('/api/v1/users/', query_string={'updatedSince': '2019-09-02T09:30:15.250000'})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert (body['deleted'], body['watermark']) == ([], '2019-09-02T10:30:15.250000+00:00')
+    # passed as updatedSince by the next sync
+    assert parse_updated_since(MultiDict({'updatedSince': body['watermark']})) == NOW
+    assert sync_page_.call_args[0][2] == SINCE
@@ -0,0 +1,173 @@
+"""
+The total of list pages by totalMode, see src/api/pagination.py and
+list_response in src/api/sync.py
+"""
+
+import datetime
+import uuid
+from unittest import mock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from src.api import pagination, sync
+from src.api.conditional import list_etag, page_etag
+from src.api.pagination import (Page, PaginationError, encode_offset_cursor, explain, page_total, paginate,
+                                parse_total_mode, plan_rows)
+from src.models.user import UserModel
+
+NOW = datetime.datetime(2019, 9, 2, 10, 30, 15, 250000)
+
+
+class Row(object):
+
+    def __init__(self):
+        self.uuid = uuid.uuid4()
+        self.created_at = self.updated_at = NOW
+
+
+@pytest.fixture
+def modes(app):
+    with mock.patch.dict(app.config, {'LIST_TOTAL_MODE': 'exact',
+                                      'LIST_TOTAL_MODES': {'users.search': 'none', 'users.find_all': 'estimated'}}):
+        yield app
+
+
+@pytest.fixture
+def query():
+    with mock.patch.object(pagination, 'estimate_count', return_value=1000) as estimate_count:
+        query = mock.Mock()
+        query.order_by.return_value.count.return_value = 42
+        query.estimate_count = estimate_count
+        yield query
+
+
+def rows_of(query, rows):
+    return mock.patch.object(pagination, 'page_query', return_value=(mock.Mock(**{'all.return_value': rows}), 11))
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('/api/v1/users/search', 'none'),
+    ('/api/v1/users/', 'estimated'),
+    ('/api/v1/accounts/', 'exact'),
+])
+def test_total_mode_defaults_per_endpoint(modes, path, expected):
+    with modes.test_request_context(path):
+        assert parse_total_mode(MultiDict()) == expected
+        assert parse_total_mode(MultiDict({'totalMode': 'exact'})) == 'exact'
+
+
+def test_invalid_total_mode(app):
+    with app.test_request_context('/api/v1/users/'), \
+            pytest.raises(PaginationError, match='totalMode must be one of exact, estimated, none'):
+        parse_total_mode(MultiDict({'totalMode': 'approximate'}))
+
+
+@pytest.mark.parametrize('total_mode, next_cursor, expected', [
+    ('exact', 'next', 42),
+    ('none', 'next', None),
+    ('none', None, None),
+    # the last page counts its rows
+    ('estimated', None, 12),
+    ('estimated', 'next', 1000),
+])
+def test_page_total(total_mode, next_cursor, expected):
+    assert page_total(total_mode, 11, ['a', 'b'], next_cursor, count=42, estimate=1000) == expected
+
+
+def test_estimate_is_at_least_the_rows_seen():
+    assert page_total('estimated', 11, ['a', 'b'], 'next', estimate=3) == 13
+
+
+def test_plan_rows():
+    assert plan_rows([{'Plan': {'Node Type': 'Seq Scan', 'Plan Rows': 1234.0}}]) == 1234
+
+
+def test_explain(app):
+    with app.app_context():
+        statement = explain(UserModel.query.filter(UserModel.email_address == 'jane@plaza.example').statement)
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+
+    assert sql.startswith('EXPLAIN (FORMAT JSON) SELECT users.id')
+    assert sql.endswith('WHERE users.email_address = %(email_address_1)s')
+
+
+def test_exact_totals_are_counted(query):
+    with rows_of(query, [Row(), Row(), Row()]):
+        page = paginate(query, UserModel, None, 2)
+        assert page.total == 42
+        assert paginate(query, UserModel, None, 2, total=7).total == 7
+
+    query.order_by.return_value.count.assert_called_once_with()
+    query.estimate_count.assert_not_called()
+
+
+def test_estimated_totals_are_planned(query):
+    with rows_of(query, [Row(), Row(), Row()]):
+        page = paginate(query, UserModel, None, 2, total_mode='estimated')
+    with rows_of(query, [Row()]):
+        last = paginate(query, UserModel, None, 2, total_mode='estimated')
+
+    assert (page.total, page.total_mode) == (1000, 'estimated')
+    assert last.total == 11
+    query.estimate_count.assert_called_once_with(query)
+    query.order_by.return_value.count.assert_not_called()
+
+
+def test_no_totals(query):
+    with rows_of(query, [Row(), Row(), Row()]):
+        page = paginate(query, UserModel, None, 2, total_mode='none')
+
+    assert (page.total, page.total_mode) == (None, 'none')
+    query.estimate_count.assert_not_called()
+    query.order_by.return_value.count.assert_not_called()
+
+
+def test_offset_pages_estimate_too(query):
+    query.offset.return_value.limit.return_value.all.return_value = ['a', 'b', 'c']
+
+    page = pagination.paginate_offset(query, 1, 2, total_mode='estimated')
+
+    assert page.total == 1000
+    assert page.next == encode_offset_cursor(3)
+
+
+@pytest.fixture
+def lists():
+    page = Page([Row()], 1, None, None, 'none')
+    with mock.patch.object(sync, 'paginate', return_value=page) as paginate_, \
+            mock.patch.object(sync, 'list_version', return_value=(NOW, 1)) as list_version:
+        yield paginate_, list_version, page
+
+
+def test_exact_lists_are_tagged_by_their_version(client, lists):
+    paginate_, list_version, page = lists
+    response = client.get('/api/v1/users/?totalMode=exact')
+
+    assert response.status_code == 200
+    with client.application.test_request_context('/api/v1/users/?totalMode=exact'):
+        assert response.headers['ETag'] == 'W/"{}"'.format(list_etag((NOW, 1)))
+    list_version.assert_called_once()
+    assert paginate_.call_args[1]['total'] == 1
+
+
+@pytest.mark.parametrize('total_mode', ['estimated', 'none'])
+def test_uncounted_lists_are_tagged_by_their_page(client, lists, total_mode):
+    paginate_, list_version, page = lists
+    response = client.get('/api/v1/users/?totalMode=' + total_mode)
+
+    assert response.status_code == 200
+    list_version.assert_not_called()
+    assert paginate_.call_args[1]['total_mode'] == total_mode
+    with client.application.test_request_context('/api/v1/users/?totalMode=' + total_mode):
+        etag = page_etag(page)
+    assert response.headers['ETag'] == 'W/"{}"'.format(etag)
+
+    response = client.get('/api/v1/users/?totalMode=' + total_mode, headers={'If-None-Match': 'W/"{}"'.format(etag)})
+    assert response.status_code == 304
+
+
+def test_invalid_total_mode_is_a_bad_request(client):
+    response = client.get('/api/v1/organisations/?totalMode=approximate')
+    assert response.status_code == 400
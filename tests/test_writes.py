@@ -0,0 +1,63 @@
+"""
+Creates and updates violating a constraint, see src/api/utils.py
+constraint_error_response
+"""
+
+import uuid
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from src.models.account import AccountModel
+from src.models.credential import CredentialModel
+from src.models.organisation import OrganisationModel
+from src.models.user import UserModel
+
+
+class PgError(Exception):
+    def __init__(self, pgcode):
+        super(PgError, self).__init__(pgcode)
+        self.pgcode = pgcode
+
+
+UNIQUE_VIOLATION = IntegrityError('UPDATE ...', {}, PgError('23505'))
+FOREIGN_KEY_VIOLATION = IntegrityError('UPDATE ...', {}, PgError('23503'))
+
+RESOURCES = [
+    ('/api/v1/organisations', OrganisationModel, {'name': 'Plaza', 'supplierUuid': str(uuid.uuid4())},
+     'Organisation already exist, please supply another name'),
+    ('/api/v1/users', UserModel, {'emailAddress': 'jane@plaza.example', 'organisationUuid': str(uuid.uuid4())},
+     'User already exist, please supply another email address'),
+    ('/api/v1/accounts', AccountModel, {'name': 'Billing', 'organisationUuid': str(uuid.uuid4())},
+     'Account already exist, please supply another name'),
+    ('/api/v1/credentials', CredentialModel, {'userUuid': str(uuid.uuid4())},
+     'Credential for given user already exist'),
+]
+
+
+@pytest.mark.parametrize('prefix, model, payload, conflict', RESOURCES)
+def test_update_conflicts_are_answered_like_create(client, prefix, model, payload, conflict):
+    with mock.patch.object(model, 'update_by_uuid', side_effect=UNIQUE_VIOLATION), \
+            mock.patch('src.models.db.session.rollback') as rollback:
+        response = client.put('{}/{}'.format(prefix, uuid.uuid4()), json=payload)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': conflict}
+    rollback.assert_called_once_with()
+
+
+@pytest.mark.parametrize('prefix, model, payload, conflict', RESOURCES)
+def test_unknown_references_are_a_bad_request(client, prefix, model, payload, conflict):
+    with mock.patch.object(model, 'update_by_uuid', side_effect=FOREIGN_KEY_VIOLATION), \
+            mock.patch('src.models.db.session.rollback'):
+        response = client.put('{}/{}'.format(prefix, uuid.uuid4()), json=payload)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'a referenced resource does not exist'}
+
+    with mock.patch.object(model, 'create', side_effect=FOREIGN_KEY_VIOLATION), \
+            mock.patch.object(model, 'update_by_uuid'), mock.patch('src.models.db.session.rollback'):
+        response = client.post(prefix + '/', json=dict(payload, name='Plaza', username='jane', lastName='Doe',
+                                                       city='Berlin', countryCode='DE'))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'a referenced resource does not exist'}
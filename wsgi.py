@@ -0,0 +1,5 @@
+# /wsgi.py
+from src.app import create_app
+
+# served by gunicorn, see gunicorn.conf.py
+application = create_app('production')